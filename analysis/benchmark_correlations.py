@@ -0,0 +1,62 @@
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.append("analysis/utils")
+import correlation_computations as compute
+from correlation_backends import BACKENDS
+
+
+def synthetic_field(Nframes, Nside, spacing, seed=0):
+    """ Masked scalar field on a regular grid, as from PIV """
+
+    rng = np.random.default_rng(seed)
+
+    x, y = np.meshgrid(np.arange(Nside) * spacing, np.arange(Nside) * spacing, indexing='ij')
+    x = np.ma.array(np.tile(x.ravel(), (Nframes, 1)))
+    y = np.ma.array(np.tile(y.ravel(), (Nframes, 1)))
+
+    field = np.sin(x / (5 * spacing)) + rng.normal(0, 0.5, x.shape)
+    mask  = rng.random(x.shape) < 0.1
+
+    return x, y, np.ma.array(field, mask=mask)
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark correlation backends on synthetic gridded data")
+    parser.add_argument('-F', '--Nframes', type=int,   help="Number of frames",                 default=10)
+    parser.add_argument('-N', '--Nside',   type=int,   help="Number of grid points per side",   default=50)
+    parser.add_argument('--dr',            type=float, help="Spatial step size",                default=1)
+    parser.add_argument('--rfrac',         type=float, help="Max distance as fraction of side", default=0.5)
+    parser.add_argument('-b', '--backends', nargs='*', help="Backends to benchmark",            default=BACKENDS)
+    args = parser.parse_args()
+
+    x, y, field = synthetic_field(args.Nframes, args.Nside, spacing=1)
+    r_max = args.Nside * args.rfrac
+
+    reference = None
+    for backend in args.backends:
+
+        # compile numba kernels outside timing
+        compute.general_spatial_correlation(x[:1], y[:1], field[:1], dr=args.dr, r_max=r_max, backend=backend)
+        compute.general_temporal_correlation(field[:2], t_max=2, backend=backend)
+
+        start = time.perf_counter()
+        Cr = compute.general_spatial_correlation(x, y, field, dr=args.dr, r_max=r_max, t_avrg=True, backend=backend)
+        t_spatial = time.perf_counter() - start
+
+        start = time.perf_counter()
+        compute.general_temporal_correlation(field, t_max=args.Nframes // 2, t_avrg=True, backend=backend)
+        t_temporal = time.perf_counter() - start
+
+        if reference is None:
+            reference = Cr['C_norm']
+        max_diff = np.ma.max(np.abs(Cr['C_norm'] - reference))
+
+        print(f"{backend:>8}: spatial {t_spatial:8.3f} s, temporal {t_temporal:8.3f} s, max deviation {max_diff:.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+from cells.bind import VertexModel
+
+import glob
+import argparse
+import platform
+import numpy as np
+from pathlib import Path
+from multiprocessing import Pool
+
+import utils.config_functions   as config
+import utils.vm_output_handling as vm_output
+import utils.dynamic_correlations as dynamic
+
+from utils.correlation_object import VMAutocorrelationObject
+
+
+# Define paths
+obj_dir    = "data/simulated/processed/"
+config_dir = "data/simulated/configs/"
+
+if platform.node() != 'silja-work' and platform.node() != 'silja-pc':
+    obj_dir    = "../../../../hdd_data/silja/VertexModel_data/simulated/processed/"
+    config_dir = "../../../../hdd_data/silja/VertexModel_data/simulated/configs/"
+
+
+
+def member_overlap_moments(path, ensemble_name, config_path, args):
+    """ Loads one ensemble member and returns sums of its overlap over time origins """
+
+    # Compute time period between frames
+    config_file = config.load(config_path)
+    df = config_file["simulation"]["period"] * config_file["simulation"]["dt"]
+
+    # Skip the transient recorded in the ensemble config
+    init_time  = config_file["simulation"].get("init_time", 100)
+    list_vm, _ = vm_output.load(path, init_time=init_time, df=df)
+    positions  = vm_output.get_cell_positions(list_vm)
+
+    # Overlap cutoff in units of the mean cell spacing
+    system_size = vm_output.get_system_size(list_vm)
+    spacing = np.sqrt(np.prod(system_size) / positions.shape[1])
+
+    # Same lags for all members, from the ensemble config. Lags longer than a member have no origins in it.
+    Nframes = args.Nframes if args.Nframes else config_file["simulation"]["Nframes"] - init_time
+    lags = dynamic.log_spaced_lags(Nframes, args.Nlags)
+
+    a = args.overlap_a * spacing
+
+    moments = dynamic.overlap_moments(positions, lags, a, origin_step=args.origin_step)
+    moments['t'] = lags * df
+    moments['a'] = a
+
+    return ensemble_name, moments
+
+
+
+def _member_overlap_moments(command):
+    return member_overlap_moments(*command)
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute four-point dynamic susceptibility chi4(t) of ensembles from overlap fluctuations")
+    parser.add_argument('dirpaths', type=str, nargs='+', help="Paths to ensemble directories. Typically 'data/simulated/raw/dir/'")
+    parser.add_argument('--overlap_a',   type=float, help="Overlap cutoff in units of cell spacing (float)",     default='0.3')
+    parser.add_argument('--Nlags',       type=int,   help="Number of log-spaced time differences",               default=50)
+    parser.add_argument('--origin_step', type=int,   help="Number of frames between time origins",               default=1)
+    parser.add_argument('--Nframes',     type=int,   help="Number of frames after transient the lags span. Default: from ensemble config", default=None)
+    parser.add_argument('-P', '--Npool', type=int,   help="Number of parallel processes reading members",        default=16)
+    args = parser.parse_args()
+
+    # Members of all ensembles are processed in one pool
+    commands = []
+    for dirpath in args.dirpaths:
+        ensemble_name = Path(dirpath).stem
+        config_path   = f"{config_dir}{ensemble_name}.json"
+
+        for path in sorted(glob.glob(f"{dirpath}/*.p")):
+            commands.append((path, ensemble_name, config_path, args))
+
+    print(f"Computing overlap of {len(commands)} members in {len(args.dirpaths)} ensembles.")
+
+    # Stream members, accumulating sums of each ensemble as they finish
+    moments = {}
+    times   = {}
+    cutoffs = {}
+    Npool = max(1, min(len(commands), args.Npool))
+    with Pool(processes=Npool) as pool:
+        for ensemble_name, member in pool.imap_unordered(_member_overlap_moments, commands):
+            times[ensemble_name]   = member.pop('t')
+            cutoffs[ensemble_name] = member.pop('a')
+            moments[ensemble_name] = dynamic.merge_overlap_moments(moments.get(ensemble_name), member)
+
+    Path(f"{obj_dir}averages/").mkdir(parents=True, exist_ok=True)
+    for ensemble_name, ensemble_moments in moments.items():
+        mean_Q, chi4 = dynamic.four_point_susceptibility(ensemble_moments)
+
+        # Save with ensemble averages of correlations
+        autocorr_obj = VMAutocorrelationObject(out_path=f"{obj_dir}averages/{ensemble_name}")
+        autocorr_obj.dynamic.update({'t':         times[ensemble_name],
+                                     'a':         cutoffs[ensemble_name],
+                                     'Q':         mean_Q,
+                                     'chi4':      chi4,
+                                     'tau_chi4':  times[ensemble_name][np.ma.argmax(chi4)],
+                                     'Nmembers':  len([c for c in commands if c[1] == ensemble_name])})
+        autocorr_obj.save_pickle()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,22 @@
 from cells.bind import VertexModel
 
+import os
+import sys
 import glob
 import argparse
 import platform
 import numpy as np
 from pathlib import Path
-from multiprocessing import Pool
 
 import utils.config_functions   as config
 import utils.vm_output_handling as vm_output
+import utils.coarse_graining    as coarse_graining
 
 from utils.correlation_object import VMAutocorrelationObject
 
+sys.path.append("exe/utils")
+import resources
+
 
 def vm_compute_correlation(path, config_path, args):
 
@@ -23,8 +28,9 @@ def vm_compute_correlation(path, config_path, args):
     T  = config_file["simulation"]["period"]
     df = T * dt
 
-    # Load frames as vm objects
-    list_vm, init_vm = vm_output.load(path, df=df)
+    # Load frames as vm objects, skipping the transient detected in the run if recorded
+    init_time = config_file["simulation"].get("init_time", 100)
+    list_vm, init_vm = vm_output.load(path, init_time=init_time, df=df)
     print("Lenght of data: ", len(list_vm))
 
 
@@ -61,15 +67,18 @@ def vm_compute_correlation(path, config_path, args):
         # Upper limit on distance
         rmax = Lgrid * args.rfrac
 
+        # Approximate mode with sampled reference cells
+        sampling = {'Nmax': args.Nmax, 'error_target': args.error_target, 'seed': args.seed, 'backend': args.backend}
+
         # Compute spatial autocorrelations
         if args.param == 'hh' or args.param == 'all':
-            autocorr_obj.compute_spatial(positions, h_variation, 'hh', args.dr, rmax, t_avrg=True, overwrite=args.overwrite)
+            autocorr_obj.compute_spatial(positions, h_variation, 'hh', args.dr, rmax, t_avrg=True, overwrite=args.overwrite, **sampling)
         if args.param == 'AA' or args.param == 'all':
-            autocorr_obj.compute_spatial(positions, A_variation, 'AA', args.dr, rmax, t_avrg=True, overwrite=args.overwrite)
+            autocorr_obj.compute_spatial(positions, A_variation, 'AA', args.dr, rmax, t_avrg=True, overwrite=args.overwrite, **sampling)
         if args.param == 'VV' or args.param == 'all':
-            autocorr_obj.compute_spatial(positions, V_variation, 'VV', args.dr, rmax, t_avrg=True, overwrite=args.overwrite)
+            autocorr_obj.compute_spatial(positions, V_variation, 'VV', args.dr, rmax, t_avrg=True, overwrite=args.overwrite, **sampling)
         if args.param == 'vv' or args.param == 'all':
-            autocorr_obj.compute_spatial(positions, velocities,  'vv', args.dr, rmax, t_avrg=True, overwrite=args.overwrite) 
+            autocorr_obj.compute_spatial(positions, velocities,  'vv', args.dr, rmax, t_avrg=True, overwrite=args.overwrite, **sampling) 
 
     if args.var == 't' or args.var == 'all':
         # Upper limit on t ime difference
@@ -77,13 +86,67 @@ def vm_compute_correlation(path, config_path, args):
 
         # Compute temporal autocorrelations
         if args.param == 'hh' or args.param == 'all':
-            autocorr_obj.compute_temporal(h_variation, 'hh', tmax, df=df, t_avrg=True, overwrite=args.overwrite)
+            autocorr_obj.compute_temporal(h_variation, 'hh', tmax, df=df, t_avrg=True, overwrite=args.overwrite, backend=args.backend)
         if args.param == 'AA' or args.param == 'all':
-            autocorr_obj.compute_temporal(A_variation, 'AA', tmax, df=df, t_avrg=True, overwrite=args.overwrite)
+            autocorr_obj.compute_temporal(A_variation, 'AA', tmax, df=df, t_avrg=True, overwrite=args.overwrite, backend=args.backend)
         if args.param == 'VV' or args.param == 'all':
-            autocorr_obj.compute_temporal(V_variation, 'VV', tmax, df=df, t_avrg=True, overwrite=args.overwrite)
+            autocorr_obj.compute_temporal(V_variation, 'VV', tmax, df=df, t_avrg=True, overwrite=args.overwrite, backend=args.backend)
         if args.param == 'vv' or args.param == 'all':
-            autocorr_obj.compute_temporal(velocities,  'vv', tmax, df=df, t_avrg=True, overwrite=args.overwrite)
+            autocorr_obj.compute_temporal(velocities,  'vv', tmax, df=df, t_avrg=True, overwrite=args.overwrite, backend=args.backend)
+
+    if args.var == 'q':
+        # Upper limit on wave vector
+        system_size = vm_output.get_system_size(list_vm)
+        qmax = 2 * np.pi / args.rmin_q
+
+        # Compute spectra of density, heights and velocities
+        autocorr_obj.compute_spectral(positions, system_size, qmax, args.dq, heights=heights, velocities=np.stack(velocities, axis=-1),
+                                      method=args.q_method, overwrite=args.overwrite)
+
+    if args.var == 'd':
+        # Wave vectors and overlap cutoff in units of the mean cell spacing
+        system_size = vm_output.get_system_size(list_vm)
+        spacing = np.sqrt(np.prod(system_size) / positions.shape[1])
+
+        # Compute self-intermediate scattering function and overlap
+        autocorr_obj.compute_dynamic(positions, 2 * np.pi * np.array(args.q_fs) / spacing, args.overlap_a * spacing, df=df,
+                                     Nlags=args.Nlags, overwrite=args.overwrite)
+
+    if args.var == 'f':
+        # Coarse-grain on regular grid, with mean cell spacing as default grid spacing
+        system_size  = vm_output.get_system_size(list_vm)
+        grid_spacing = args.grid_spacing if args.grid_spacing else np.sqrt(np.prod(system_size) / positions.shape[1])
+
+        x, y, fields = coarse_graining.coarse_grain(positions, {'hh': h_variation, 'AA': A_variation, 'VV': V_variation,
+                                                                'vv': np.stack(velocities, axis=-1)}, system_size, grid_spacing)
+        density = fields.pop('density')
+        fields['rhorho'] = density - np.ma.mean(density, axis=1, keepdims=True)
+        grid_positions = np.ma.stack([x, y], axis=-1)
+
+        # Compute spatial autocorrelations of fields, exact on grid
+        rmax = Lgrid * args.rfrac
+        for name, field in fields.items():
+            if args.param == name or args.param == 'all':
+                autocorr_obj.compute_spatial(grid_positions, field, f'{name}_field', args.dr, rmax, t_avrg=True, overwrite=args.overwrite, backend='fft')
+
+    if args.var == 'T1':
+        # Neighbour graphs of all frames, and cumulative number of T1s in simulation
+        graph = vm_output.get_neighbour_matrix(list_vm)
+        nT1   = np.array([vm.nT1 for vm in list_vm])
+        system_size = vm_output.get_system_size(list_vm)
+        spacing = np.sqrt(np.prod(system_size) / positions.shape[1])
+
+        # Detect T1 transitions, with clustering up to a quarter of the box
+        autocorr_obj.compute_rearrangements(graph, positions, system_size, cell_properties={'hh': heights, 'VV': volumes},
+                                            df=df, dr=spacing / 2, r_max=np.min(system_size) / 4, nT1=nT1, overwrite=args.overwrite)
+
+    if args.var == 'm':
+        # Compute mean squared displacement and non-Gaussian parameter
+        autocorr_obj.compute_displacements(positions, df=df, remove_drift=True, overwrite=args.overwrite)
+
+    # Confidence bands from resampling frames. Files are already computed in parallel, so resample serially
+    if args.bootstrap > 0:
+        autocorr_obj.compute_confidence_bands(method=args.resampling, Nresamples=args.bootstrap, Npool=1)
 
     # Save autocorrelation as .autocorr
     autocorr_obj.save_pickle()
@@ -110,12 +173,30 @@ def main():
     parser = argparse.ArgumentParser(description="Computes correlations on simulation data and save as pickle")
     parser.add_argument('filepath',          type=str, help="Defines path to file or dir, typically: data/simulated/raw/dir/.")
     parser.add_argument('-p', '--param',     type=str, help="Parameter to plot correlation of (varvar)", default="all")
-    parser.add_argument('-v', '--var',       type=str, help="Correlation variable (t or r)",             default="all")
+    parser.add_argument('-v', '--var',       type=str, help="Correlation variable (t, r, q, d, m, f or T1). all: t and r",default="all")
     parser.add_argument('-o','--overwrite',            help="Overwrite previous computations",           action='store_true')
     parser.add_argument('--dr',            type=float, help="Spatial step size (float)",                                            default='20')
     parser.add_argument('--rfrac',         type=float, help="Max distance to compute correlation for (float)",                      default='0.5')
     parser.add_argument('--tfrac',         type=float, help="Fraction of total duration to compute correlation for (float)",        default='0.5')
     parser.add_argument('--mean_var',      type=str,   help="Variable to take mean over in <x - <x>_var> (t or cell). Default: t",  default='t')
+    parser.add_argument('--Nmax',          type=int,   help="Max number of reference cells per frame in spatial correlations",     default=5000)
+    parser.add_argument('--error_target',  type=float, help="Target standard error of spatial correlations, sampling up to Nmax reference cells (float)", default=None)
+    parser.add_argument('--seed',          type=int,   help="Seed of reference cell sampling",                                      default=0)
+    parser.add_argument('--dq',            type=float, help="Width of wave vector shells in spectra (float)",                       default='0.05')
+    parser.add_argument('--rmin_q',        type=float, help="Smallest length scale 2pi/q_max in spectra (float)",                   default='1')
+    parser.add_argument('--q_method',      type=str,   help="Fourier transform in spectra (direct or grid)",                        default='direct')
+    parser.add_argument('--q_fs', nargs='*', type=float, help="Wave vectors of F_s(q,t) in units of 2pi/cell spacing",           default=[1])
+    parser.add_argument('--overlap_a',     type=float, help="Overlap cutoff in units of cell spacing (float)",                      default='0.3')
+    parser.add_argument('--Nlags',         type=int,   help="Number of log-spaced time differences in F_s(q,t) and overlap",       default=50)
+    parser.add_argument('--grid_spacing',  type=float, help="Grid spacing of coarse-grained fields (float). Default: mean cell spacing", default=None)
+    parser.add_argument('--backend',       type=str,   help="Correlation backend (python, numba or fft)",                           default='numba')
+    parser.add_argument('-b', '--bootstrap', type=int, help="Number of resamples of frames for confidence bands (0: none)",        default=0)
+    parser.add_argument('--resampling',      type=str, help="Resampling method for confidence bands (bootstrap or jackknife)",    default='bootstrap')
+    parser.add_argument('-P', '--Npool',     type=int, help="Max number of parallel processes",                                    default=16)
+    parser.add_argument('--threads',         type=int, help="Threads per process (numba, OpenMP, BLAS). Default: cores per process", default=None)
+    parser.add_argument('--pin',                       help="Pin every process to its cores",                                      action='store_true')
+    parser.add_argument('--memory_fraction', type=float, help="Fraction of available memory processes may use (float)",             default='0.8')
+    parser.add_argument('--memory_per_byte', type=float, help="Peak memory per byte of input file (float). Default: measured on first file", default=None)
     args = parser.parse_args()
 
 
@@ -166,12 +247,11 @@ def main():
         ]
         commands.append(command)
     
-    Npool = len(glob.glob(f"{args.filepath}*"))
-    if Npool > 16: Npool = 16
-
-    with Pool(processes=Npool) as pool:
-        pool.starmap(vm_compute_correlation, commands)
-
+    # Split cores among processes, so that parallel kernels do not oversubscribe the node,
+    # and start processes only while their estimated memory is available
+    resources.run_memory_aware(vm_compute_correlation, commands, [os.path.getsize(command[0]) for command in commands],
+                               args.Npool, threads=args.threads, pin=args.pin,
+                               memory_fraction=args.memory_fraction, memory_per_byte=args.memory_per_byte)
 
 if __name__ == "__main__":
     main()
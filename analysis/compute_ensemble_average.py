@@ -1,11 +1,15 @@
+import os
 import glob
+import json
 import pickle
 import argparse
 import subprocess
 import numpy as np
 
 from pathlib import Path
+from multiprocessing import Pool
 
+import utils.ensemble_reduction as ensemble
 from utils.correlation_object import VMAutocorrelationObject
 
 processed_dir = "data/simulated/processed/"
@@ -32,10 +36,126 @@ def compute_correlations(dirpath, args):
     
 
 
+def load_member(path):
+    """ Loads correlations, number of pairs and bin values of one ensemble member """
+
+    # modification time before reading, so a member rewritten while reading is read again next time
+    mtime = os.path.getmtime(path)
+    autocorr_tmp = VMAutocorrelationObject(out_path=path)
+
+    member = {'path': path, 'mtime': mtime}
+    for var, corr, counts, axis in [('t', autocorr_tmp.temporal, autocorr_tmp.temporal_N, autocorr_tmp.t_array),
+                                    ('r', autocorr_tmp.spatial,  autocorr_tmp.spatial_N,  autocorr_tmp.r_array)]:
+
+        # Files computed before counts were stored are weighted equally
+        member[var] = {key: (axis[key], corr[key], counts.get(key, np.ones(len(corr[key]))))
+                       for key in corr.keys()}
+
+    return member
+
+
+
+def reset_ensemble(autocorr_obj):
+    """ Empties accumulated sums of ensemble correlation object, and all averages computed from them """
+
+    autocorr_obj.ensemble = {'members': [], 'mtimes': {}, 'temporal': {}, 'spatial': {}, 'blocks': {'t': {}, 'r': {}}}
+
+    for averages in [autocorr_obj.temporal, autocorr_obj.t_array, autocorr_obj.temporal_N, autocorr_obj.temporal_err,
+                     autocorr_obj.temporal_blocks, autocorr_obj.temporal_ci, autocorr_obj.temporal_ci_err,
+                     autocorr_obj.spatial, autocorr_obj.r_array, autocorr_obj.spatial_N, autocorr_obj.spatial_err,
+                     autocorr_obj.spatial_blocks, autocorr_obj.spatial_ci, autocorr_obj.spatial_ci_err]:
+        averages.clear()
+
+
+
+def changed_members(autocorr_obj, files_list):
+    """ Members in average that were removed or recomputed since they were added """
+
+    mtimes = autocorr_obj.ensemble.get('mtimes', {})
+
+    return [path for path in autocorr_obj.ensemble['members']
+            if path not in files_list or mtimes.get(path) != os.path.getmtime(path)]
+
+
+
+def update_ensemble(autocorr_obj, member):
+    """ Adds member to accumulated sums of ensemble correlation object """
+
+    for var, accumulators in [('t', autocorr_obj.ensemble['temporal']),
+                              ('r', autocorr_obj.ensemble['spatial'])]:
+
+        for key, (axis, corr, counts) in member[var].items():
+            acc = accumulators.get(key, ensemble.empty_accumulator())
+            accumulators[key] = ensemble.add_member(acc, axis, corr, counts)
+
+            # Keep member for resampling over members
+            autocorr_obj.ensemble['blocks'][var].setdefault(key, []).append((axis, corr, counts))
+
+    autocorr_obj.ensemble['members'].append(member['path'])
+    autocorr_obj.ensemble['mtimes'][member['path']] = member['mtime']
+
+
+
+def reduce_ensemble(autocorr_obj):
+    """ Computes ensemble average and standard error from accumulated sums """
+
+    for key, acc in autocorr_obj.ensemble['temporal'].items():
+        axis, mean, err, counts = ensemble.reduce_accumulator(acc)
+
+        autocorr_obj.t_array[key]      = axis
+        autocorr_obj.temporal[key]     = mean
+        autocorr_obj.temporal_err[key] = err
+        autocorr_obj.temporal_N[key]   = counts
+
+        sums, counts = ensemble.member_blocks(axis, autocorr_obj.ensemble['blocks']['t'][key])
+        autocorr_obj.temporal_blocks[key] = {'sums': sums, 'counts': counts}
+
+    for key, acc in autocorr_obj.ensemble['spatial'].items():
+        axis, mean, err, counts = ensemble.reduce_accumulator(acc)
+
+        autocorr_obj.r_array[key]     = axis
+        autocorr_obj.spatial[key]     = mean
+        autocorr_obj.spatial_err[key] = err
+        autocorr_obj.spatial_N[key]   = counts
+
+        sums, counts = ensemble.member_blocks(axis, autocorr_obj.ensemble['blocks']['r'][key])
+        autocorr_obj.spatial_blocks[key] = {'sums': sums, 'counts': counts}
+
+
+
+def ensemble_status(autocorr_obj):
+    """
+    Number of members, and largest standard error of every ensemble-averaged correlation over its bins,
+    absolute and relative to the correlation in the first bin (zero time difference or distance).
+    Errors are None while less than two members contribute.
+    """
+
+    status = {'Nmembers': len(autocorr_obj.ensemble['members']), 't': {}, 'r': {}}
+
+    for var, name, correlations, errors in [('t', 'temporal', autocorr_obj.temporal, autocorr_obj.temporal_err),
+                                            ('r', 'spatial',  autocorr_obj.spatial,  autocorr_obj.spatial_err)]:
+        for key in autocorr_obj.ensemble[name].keys():
+            error = np.ma.max(errors[key])
+            scale = np.ma.abs(correlations[key][0])
+
+            if error is np.ma.masked:
+                status[var][key] = {'error': None, 'relative_error': None}
+            else:
+                status[var][key] = {'error': float(error), 'relative_error': float(error / scale) if scale > 0 else None}
+
+    return status
+
+
+
 def main():
     parser = argparse.ArgumentParser(description="Compute ensemble average of autocorrelation")
     parser.add_argument('dirpath', type=str,      help="Path to ensemble directory. Typically 'data/simulated/processed/dir'")
     parser.add_argument('--compute_correlations', help="Run compute_correlations.py before taking average.", action="store_true")
+    parser.add_argument('-o', '--overwrite',      help="Recompute average from all members instead of adding new members", action="store_true")
+    parser.add_argument('-P', '--Npool', type=int, help="Number of parallel processes reading members", default=16)
+    parser.add_argument('-b', '--bootstrap', type=int, help="Number of resamples of members for confidence bands (0: none)", default=0)
+    parser.add_argument('--resampling',      type=str, help="Resampling method for confidence bands (bootstrap or jackknife)", default='bootstrap')
+    parser.add_argument('--status',          type=str, help="Save number of members and standard errors of average as json to this path", default=None)
 
     # compute correlations inputs
     parser.add_argument('-p', '--param',     type=str, help="Parameter to plot correlation of (varvar)", default="all")
@@ -53,32 +173,50 @@ def main():
         args.dirpath = f"data/simulated/processed/{Path(args.dirpath).stem}/"
 
     # List all files
-    files_list   = glob.glob(f"{args.dirpath}*.autocorr")
-    autocorr_tmp = VMAutocorrelationObject(out_path=files_list[0])
+    files_list = sorted(glob.glob(f"{args.dirpath}*.autocorr"))
+    assert len(files_list) > 0, f"No files matches filename: {args.dirpath}*.autocorr"
 
-    # Initialize ensemble correlation object
+    # Initialize ensemble correlation object, or continue from existing average
     out_path = f"{ensemble_dir}{Path(args.dirpath).stem}"
     autocorr_obj = VMAutocorrelationObject(out_path=out_path)
-    autocorr_obj.copy_structure(autocorr_tmp.out_path)
-    
-    assert set(autocorr_obj.temporal) == set(autocorr_obj.spatial)
 
-    Nfiles = len(files_list)
-    for file in files_list:
-        # Load autocorrelations of one state
-        autocorr_tmp = VMAutocorrelationObject(out_path=file)
+    # Sums cannot be corrected for recomputed members, so the average is recomputed from all members
+    if args.overwrite or autocorr_obj.ensemble == {}:
+        reset_ensemble(autocorr_obj)
+    elif len(changed := changed_members(autocorr_obj, files_list)) > 0:
+        print(f"{len(changed)} members changed since they were added. Recomputing average from all members.")
+        reset_ensemble(autocorr_obj)
+
+    # Only read members that are not already in average
+    new_files = [file for file in files_list if file not in autocorr_obj.ensemble['members']]
+    print(f"Adding {len(new_files)} of {len(files_list)} members to ensemble average.")
+
+    if len(new_files) > 0:
+
+        # Read members in parallel
+        Npool = min(len(new_files), args.Npool)
+        with Pool(processes=Npool) as pool:
+            members = pool.map(load_member, new_files)
+
+        # Add sums and counts of each member
+        for member in members:
+            update_ensemble(autocorr_obj, member)
 
-        # Compute average
-        for key in autocorr_obj.temporal.keys():
-            autocorr_obj.temporal[key] += autocorr_tmp.temporal[key] / Nfiles
-            autocorr_obj.spatial[key]  += autocorr_tmp.spatial[key]  / Nfiles
+        # Compute pair-weighted average and standard error
+        reduce_ensemble(autocorr_obj)
 
-    # Get distance and time difference arrays
-    autocorr_obj.t_array = autocorr_tmp.t_array
-    autocorr_obj.r_array = autocorr_tmp.r_array
+        # Confidence bands from resampling ensemble members. Bands of fewer members are dropped.
+        for bands in [autocorr_obj.temporal_ci, autocorr_obj.temporal_ci_err, autocorr_obj.spatial_ci, autocorr_obj.spatial_ci_err]:
+            bands.clear()
+        if args.bootstrap > 0:
+            autocorr_obj.compute_confidence_bands(method=args.resampling, Nresamples=args.bootstrap, Npool=args.Npool)
 
-    autocorr_obj.save_pickle()
+        autocorr_obj.save_pickle()
 
+    # Convergence of average, e.g. for adaptive ensembles of run_ensemble.py
+    if args.status:
+        with open(args.status, 'w') as f:
+            json.dump(ensemble_status(autocorr_obj), f, indent=4)
 
 if __name__ == "__main__":
     main()
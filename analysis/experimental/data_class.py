@@ -6,9 +6,8 @@ import pandas as pd
 from pathlib import Path
 from datetime import datetime
 
-sys.path.append("code/preprocessing/utils")
-sys.path.append("code/analysis/")
-import masked_correlation_functions as compute
+sys.path.append("analysis/utils")
+import correlation_computations as compute
 
 
 class SegmentationData:
@@ -330,8 +329,8 @@ class AutocorrelationData:
 
 
 
-    def compute_spatial(self, positions, variable, variable_name, dr, r_max, t_avrg=False, overwrite=False):
-        """ Computes spatial autocorrelation """
+    def compute_spatial(self, positions, variable, variable_name, dr, r_max, t_avrg=False, overwrite=False, backend='numba', **sampling):
+        """ Computes spatial autocorrelation. Use backend='fft' for fields on a regular grid. """
 
         # Check if correlation exists
         if not overwrite:
@@ -343,7 +342,7 @@ class AutocorrelationData:
         fmax = variable.shape[-2]
 
         Cr = compute.general_spatial_correlation(positions[0][:fmax], positions[1][:fmax], variable,
-                                                 dr=dr, r_max=r_max, t_avrg=t_avrg)
+                                                 dr=dr, r_max=r_max, t_avrg=t_avrg, backend=backend, **sampling)
 
         # Update object
         self.spatial[variable_name]  = Cr['C_norm']#.compressed()
@@ -352,7 +351,7 @@ class AutocorrelationData:
 
 
 
-    def compute_temporal(self, variable, variable_name, t_max, t_avrg=False, overwrite=False):
+    def compute_temporal(self, variable, variable_name, t_max, t_avrg=False, overwrite=False, backend='numba'):
         """ Computes temporal autocorrelation """
 
         # Check if correlation exists
@@ -362,7 +361,7 @@ class AutocorrelationData:
                 return
 
         # Compute autocorrelation    
-        Ct = compute.general_temporal_correlation(variable, t_max=t_max, t_avrg=t_avrg)
+        Ct = compute.general_temporal_correlation(variable, t_max=t_max, t_avrg=t_avrg, backend=backend)
 
         # Update object
         self.temporal[variable_name] = Ct['C_norm']
@@ -0,0 +1,188 @@
+import numpy as np
+
+from scipy.stats import norm
+from multiprocessing import Pool
+
+
+def pooled_estimate(sums, counts, indices=None):
+    """
+    Computes correlation from partial sums of blocks (frames, time origins or ensemble members)
+
+    Parameters:
+    - sums: sum of correlation products in each block and bin, shape (Nblocks, Nbins)
+    - counts: number of pairs in each block and bin, shape (Nblocks, Nbins)
+    - indices: blocks to include, with repetition. All blocks if None.
+    """
+
+    if indices is None:
+        indices = np.arange(len(sums))
+
+    # blocks that are drawn several times count several times
+    weights = np.bincount(indices, minlength=len(sums))
+
+    S = weights @ sums
+    N = weights @ counts
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return S / N
+
+
+
+def equal_weight_blocks(sums, counts):
+    """
+    Blocks whose pooled estimate is the unweighted mean of the block correlations sums/counts,
+    like correlations averaged over frames or time origins. Blocks without pairs in a bin are left out of it.
+    """
+
+    correlations = np.ma.divide(sums, counts)
+    weights = (~np.ma.getmaskarray(correlations)).astype(float)
+
+    return np.ma.filled(correlations, 0) * weights, weights
+
+
+
+def _prepare_blocks(sums, counts):
+    """ Fills masked entries so they do not contribute """
+
+    counts = np.ma.filled(np.ma.asarray(counts, dtype=float), 0)
+    sums   = np.ma.filled(np.ma.asarray(sums,   dtype=float), 0)
+    sums[counts == 0] = 0
+
+    # drop blocks without any pairs
+    has_pairs = np.any(counts > 0, axis=1)
+
+    return sums[has_pairs], counts[has_pairs]
+
+
+
+def autocorrelation_time(sums, counts):
+    """
+    Integrated autocorrelation time, in blocks, of the correlations sums/counts of consecutive blocks
+    (frames or time origins), largest over bins. Autocorrelations are summed up to their first non-positive value.
+    """
+
+    correlations = np.ma.divide(sums, counts)
+
+    tau = 1.
+    for values in correlations.T:
+        x = values.compressed()
+        if len(x) < 3 or np.var(x) == 0:
+            continue
+
+        # autocorrelation function with FFT
+        x = x - np.mean(x)
+        fx  = np.fft.rfft(x, 2 * len(x))
+        acf = np.fft.irfft(fx * np.conj(fx))[:len(x)]
+        acf = acf / acf[0]
+
+        cut = np.argmax(acf <= 0) if np.any(acf <= 0) else len(x)
+        tau = max(tau, 1 + 2 * np.sum(acf[1:cut]))
+
+    return tau
+
+
+
+def block_length_of(sums, counts, block_length=None):
+    """ Block length between 1 and number of blocks, from autocorrelation time of blocks if None """
+
+    if block_length is None:
+        block_length = int(np.ceil(autocorrelation_time(sums, counts)))
+
+    return int(np.clip(block_length, 1, len(sums)))
+
+
+
+def _resample_chunk(sums, counts, index_sets):
+    """ Computes estimate of each resample in chunk """
+
+    return np.array([pooled_estimate(sums, counts, indices) for indices in index_sets])
+
+
+
+def _run_resamples(sums, counts, index_sets, Npool):
+    """ Spreads resamples over process pool """
+
+    if Npool == 1:
+        return _resample_chunk(sums, counts, index_sets)
+
+    # index sets may differ in length
+    chunks = [[index_sets[i] for i in chunk] for chunk in np.array_split(np.arange(len(index_sets)), Npool)]
+    with Pool(processes=Npool) as pool:
+        estimates = pool.starmap(_resample_chunk, [(sums, counts, chunk) for chunk in chunks])
+
+    return np.concatenate(estimates)
+
+
+
+def bootstrap(sums, counts, Nresamples=1000, level=0.95, seed=0, Npool=1, block_length=None):
+    """
+    Circular block bootstrap confidence band of pooled correlation, resampling runs of block_length
+    consecutive blocks with replacement, so that correlations between successive frames or time origins
+    are kept. block_length 1 resamples independent blocks, e.g. ensemble members.
+
+    Returns:
+    - band: masked array of shape (2, Nbins) with lower and upper limit
+    - err: bootstrap standard error
+    """
+
+    sums, counts = _prepare_blocks(sums, counts)
+    Nblocks = len(sums)
+    block_length = block_length_of(sums, counts, block_length)
+
+    # runs start anywhere and wrap around, until resamples have Nblocks blocks
+    rng = np.random.default_rng(seed)
+    starts = rng.integers(0, Nblocks, size=(Nresamples, int(np.ceil(Nblocks / block_length))))
+    index_sets = ((starts[:, :, None] + np.arange(block_length)) % Nblocks).reshape(Nresamples, -1)[:, :Nblocks]
+
+    estimates = _run_resamples(sums, counts, index_sets, Npool)
+
+    alpha = (1 - level) / 2
+    band = np.nanquantile(estimates, [alpha, 1 - alpha], axis=0)
+    err  = np.nanstd(estimates, axis=0, ddof=1)
+
+    return np.ma.masked_invalid(band), np.ma.masked_invalid(err)
+
+
+
+def jackknife(sums, counts, level=0.95, Npool=1, block_length=None):
+    """
+    Block jackknife confidence band of pooled correlation, leaving out one group of block_length
+    consecutive blocks at a time. block_length 1 leaves out single independent blocks, e.g. ensemble members.
+
+    Returns:
+    - band: masked array of shape (2, Nbins) with lower and upper limit
+    - err: jackknife standard error
+    """
+
+    sums, counts = _prepare_blocks(sums, counts)
+    Nblocks = len(sums)
+    block_length = block_length_of(sums, counts, block_length)
+
+    groups = np.array_split(np.arange(Nblocks), max(Nblocks // block_length, 1))
+    Ngroups = len(groups)
+
+    index_sets = [np.setdiff1d(np.arange(Nblocks), group) for group in groups]
+    estimates  = _run_resamples(sums, counts, index_sets, Npool)
+
+    estimate = pooled_estimate(sums, counts)
+    err = np.sqrt((Ngroups - 1) / Ngroups * np.nansum((estimates - np.nanmean(estimates, axis=0))**2, axis=0))
+
+    z = norm.ppf(1 - (1 - level) / 2)
+    band = np.array([estimate - z * err, estimate + z * err])
+
+    return np.ma.masked_invalid(band), np.ma.masked_invalid(err)
+
+
+
+def confidence_band(sums, counts, method='bootstrap', Nresamples=1000, level=0.95, seed=0, Npool=1, block_length=None):
+    """
+    Computes confidence band with block bootstrap or block jackknife.
+    Block length is estimated from the autocorrelation time of the blocks if None.
+    """
+
+    assert method in ['bootstrap', 'jackknife'], "method must be bootstrap or jackknife"
+
+    if method == 'bootstrap':
+        return bootstrap(sums, counts, Nresamples=Nresamples, level=level, seed=seed, Npool=Npool, block_length=block_length)
+    else:
+        return jackknife(sums, counts, level=level, Npool=Npool, block_length=block_length)
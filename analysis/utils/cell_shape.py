@@ -0,0 +1,110 @@
+import numpy as np
+
+
+def pad_polygons(polygons, Kmax=None, Ncells=None):
+    """
+    Packs polygons with different numbers of vertices into one array, padded with their first vertex.
+    Padding adds only zero-length edges, so sums over edges are unaffected.
+    Frames with fewer cells, e.g. before divisions, are padded with empty polygons at vertex (0, 0),
+    which have no vertices (Nvertices 0) and are to be masked.
+
+    Parameters:
+    - polygons: list of (Nvertices, 2) vertex positions, or list of such lists (one per frame)
+    - Kmax: number of vertices after padding. Largest polygon if None.
+    - Ncells: number of cells after padding. Largest number of cells if None.
+
+    Returns:
+    - vertices: shape (..., Ncells, Kmax, 2)
+    - Nvertices: number of vertices of each polygon, shape (..., Ncells)
+    """
+
+    # list of frames
+    if np.ndim(polygons[0][0]) == 2:
+        if Kmax is None:
+            Kmax = max(len(polygon) for frame in polygons for polygon in frame)
+        if Ncells is None:
+            Ncells = max(len(frame) for frame in polygons)
+        padded = [pad_polygons(frame, Kmax, Ncells) for frame in polygons]
+        return np.stack([vertices for vertices, _ in padded]), np.stack([Nvertices for _, Nvertices in padded])
+
+    Nvertices = np.zeros(len(polygons) if Ncells is None else Ncells, dtype=int)
+    Nvertices[:len(polygons)] = [len(polygon) for polygon in polygons]
+    if Kmax is None:
+        Kmax = np.max(Nvertices)
+
+    vertices = np.zeros((len(Nvertices), Kmax, 2))
+    for i, polygon in enumerate(polygons):
+        vertices[i, :Nvertices[i]] = polygon
+        vertices[i, Nvertices[i]:] = polygon[0]
+
+    return vertices, Nvertices
+
+
+
+def polygon_moments(vertices):
+    """
+    Area, centroid and second moment tensor of the area of padded polygons, from sums over edges.
+
+    Returns:
+    - area: shape (...)
+    - centroid: shape (..., 2)
+    - moments: central second moments <r r^T> over the polygon area, shape (..., 2, 2)
+    """
+
+    # relative to first vertex to limit round-off
+    origin = vertices[..., :1, :]
+    x0, y0 = (vertices - origin)[..., 0], (vertices - origin)[..., 1]
+    x1, y1 = np.roll(x0, -1, axis=-1), np.roll(y0, -1, axis=-1)
+
+    cross = x0 * y1 - x1 * y0
+    signed_area = np.sum(cross, axis=-1) / 2
+
+    cx  = np.sum((x0 + x1) * cross, axis=-1) / (6 * signed_area)
+    cy  = np.sum((y0 + y1) * cross, axis=-1) / (6 * signed_area)
+    Ixx = np.sum((x0**2 + x0 * x1 + x1**2) * cross, axis=-1) / (12 * signed_area)
+    Iyy = np.sum((y0**2 + y0 * y1 + y1**2) * cross, axis=-1) / (12 * signed_area)
+    Ixy = np.sum((x0 * y1 + 2 * x0 * y0 + 2 * x1 * y1 + x1 * y0) * cross, axis=-1) / (24 * signed_area)
+
+    # central moments
+    moments = np.stack([np.stack([Ixx - cx**2, Ixy - cx * cy], axis=-1),
+                        np.stack([Ixy - cx * cy, Iyy - cy**2], axis=-1)], axis=-2)
+    centroid = np.stack([cx, cy], axis=-1) + origin[..., 0, :]
+
+    return np.abs(signed_area), centroid, moments
+
+
+
+def cell_shapes(vertices):
+    """
+    Shape descriptors of padded polygons, for all cells (and frames) at once.
+
+    Returns dictionary with:
+    - area, perimeter, shape_index: perimeter / sqrt(area)
+    - centroid: shape (..., 2)
+    - moments: second moment tensor of the area, shape (..., 2, 2)
+    - Q: traceless shape tensor M / tr(M) - I/2, shape (..., 2, 2)
+    - aspect_ratio: sqrt of ratio of largest to smallest eigenvalue of the moment tensor (axis ratio for ellipses)
+    - orientation: angle of major axis in (-pi/2, pi/2]
+    """
+
+    area, centroid, moments = polygon_moments(vertices)
+
+    edges = np.roll(vertices, -1, axis=-2) - vertices
+    perimeter = np.sum(np.linalg.norm(edges, axis=-1), axis=-1)
+
+    # eigenvalues of symmetric 2x2 tensors
+    a, b, d = moments[..., 0, 0], moments[..., 0, 1], moments[..., 1, 1]
+    half_trace = (a + d) / 2
+    radius = np.sqrt(((a - d) / 2)**2 + b**2)
+    eig_major, eig_minor = half_trace + radius, half_trace - radius
+
+    Q = moments / (a + d)[..., None, None] - np.eye(2) / 2
+
+    return {'area':         area,
+            'perimeter':    perimeter,
+            'shape_index':  perimeter / np.sqrt(area),
+            'centroid':     centroid,
+            'moments':      moments,
+            'Q':            Q,
+            'aspect_ratio': np.sqrt(eig_major / eig_minor),
+            'orientation':  np.arctan2(2 * b, a - d) / 2}
@@ -0,0 +1,365 @@
+import numpy as np
+
+from numba import njit, prange
+
+
+# Correlations are computed from components A (reference/origin) and B (partner/lag) of the variables,
+# with the correlation product of two points j, k being sum_c A[c,j] * B[c,k]
+# and normalization by the rms sqrt(|mean_j sum_c A[c,j] * B[c,j]|).
+
+BACKENDS = ['python', 'numba', 'fft']
+
+
+#########################
+# Temporal correlations #
+#########################
+
+def python_temporal_kernel(A, B, valid, t_max):
+    """
+    Reference masked implementation of temporal correlation.
+
+    Parameters:
+    - A, B: components of variables, shape (Ncomp, Nframes, Npoints)
+    - valid: points that are not masked, shape (Nframes, Npoints)
+    - t_max: number of time differences to compute
+
+    Returns:
+    - C: normalized correlation for each time origin and time difference, shape (Nframes, t_max)
+    - N: number of points used for each time origin and time difference
+    """
+
+    Nframes = valid.shape[0]
+    C = np.zeros((Nframes, t_max))
+    N = np.zeros((Nframes, t_max))
+
+    for i in range(Nframes):
+
+        if not np.any(valid[i]):
+            continue
+
+        for lag in range(min(t_max, Nframes - i)):
+            j = i + lag
+
+            bool_ok = valid[i] * valid[j]
+            if not np.any(bool_ok):
+                continue
+
+            P_ij = np.sum(A[:, i, bool_ok] * B[:, j, bool_ok], axis=0)
+            P_ii = np.sum(A[:, i, bool_ok] * B[:, i, bool_ok], axis=0)
+            P_jj = np.sum(A[:, j, bool_ok] * B[:, j, bool_ok], axis=0)
+
+            # Normalize by the rms
+            C[i, lag] = np.mean(P_ij) / np.sqrt(abs(np.mean(P_ii) * np.mean(P_jj)))
+            N[i, lag] = np.sum(bool_ok)
+
+    return C, N
+
+
+
+@njit(parallel=True)
+def numba_temporal_kernel(A, B, valid, t_max):
+    """ Compiled implementation of python_temporal_kernel, parallel over time origins """
+
+    Ncomp, Nframes, Npoints = A.shape
+    C = np.zeros((Nframes, t_max))
+    N = np.zeros((Nframes, t_max))
+
+    for i in prange(Nframes):
+
+        for lag in range(min(t_max, Nframes - i)):
+            j = i + lag
+
+            P_ij, P_ii, P_jj, n = 0., 0., 0., 0
+            for k in range(Npoints):
+                if valid[i, k] and valid[j, k]:
+                    n += 1
+                    for c in range(Ncomp):
+                        P_ij += A[c, i, k] * B[c, j, k]
+                        P_ii += A[c, i, k] * B[c, i, k]
+                        P_jj += A[c, j, k] * B[c, j, k]
+
+            if n > 0:
+                C[i, lag] = (P_ij / n) / np.sqrt(abs((P_ii / n) * (P_jj / n)))
+                N[i, lag] = n
+
+    return C, N
+
+
+
+def temporal_kernel(backend):
+    """ Returns temporal correlation kernel of backend """
+
+    assert backend in BACKENDS, f"Unknown backend {backend}. Must be one of {BACKENDS}"
+
+    # normalization depends on time origin, so there is no FFT shortcut for temporal correlations
+    if backend == 'python':
+        return python_temporal_kernel
+    else:
+        return numba_temporal_kernel
+
+
+
+########################
+# Spatial correlations #
+########################
+
+def distance_bin_indices(r, r_bin_edges):
+    """
+    Bin of each distance. Bin 0 holds r=0, bin i>0 holds r_bin_edges[i] < r <= r_bin_edges[i+1].
+    Distances outside bins get index Nbins.
+    """
+
+    Nbins = len(r_bin_edges) - 1
+    inds  = np.searchsorted(r_bin_edges, r, side='left') - 1
+    inds[r == 0] = 0
+    inds[(inds < 0) + (inds >= Nbins)] = Nbins
+
+    return inds
+
+
+
+def python_spatial_kernel(xf, yf, Af, Bf, r_bin_edges, ref_inds):
+    """
+    Reference implementation of spatial correlation sums.
+
+    Parameters:
+    - xf, yf: coordinates of points
+    - Af, Bf: components of variables, shape (Ncomp, Npoints)
+    - r_bin_edges: edges of distance bins
+    - ref_inds: indices of reference points
+
+    Returns:
+    - Nf_in_rbin_ref: number of partners of each reference point in each bin, shape (Nref, Nbins)
+    - Cf_ref: sum of normalized correlation products of each reference point in each bin
+    """
+
+    Nbins = len(r_bin_edges) - 1
+    Nref  = len(ref_inds)
+    Nf_in_rbin_ref = np.zeros((Nref, Nbins))
+    Cf_ref         = np.zeros((Nref, Nbins))
+    varf_rms = np.sqrt(abs(np.mean(np.sum(Af * Bf, axis=0))))
+
+    for k, j in enumerate(ref_inds):
+
+        #Radial distances to the other points
+        rf_rel = np.sqrt((xf - xf[j])**2 + (yf - yf[j])**2)
+        inds   = distance_bin_indices(rf_rel, r_bin_edges)
+
+        products = np.sum(Af[:, j, None] * Bf, axis=0) / varf_rms**2
+
+        Nf_in_rbin_ref[k] = np.bincount(inds, minlength=Nbins + 1)[:Nbins]
+        Cf_ref[k]         = np.bincount(inds, weights=products, minlength=Nbins + 1)[:Nbins]
+
+    return Nf_in_rbin_ref, Cf_ref
+
+
+
+@njit(parallel=True)
+def numba_spatial_kernel(xf, yf, Af, Bf, r_bin_edges, ref_inds):
+    """ Compiled implementation of python_spatial_kernel, parallel over bins """
+
+    Ncomp = Af.shape[0]
+    Nbins = len(r_bin_edges)-1
+    Nref  = len(ref_inds)
+    Nf_in_rbin_ref = np.zeros((Nref, Nbins))
+    Cf_ref         = np.zeros((Nref, Nbins))
+
+    varf_ms = 0.
+    for c in range(Ncomp):
+        varf_ms += np.mean(Af[c] * Bf[c])
+    varf_rms = np.sqrt(abs(varf_ms))
+
+    for i in prange(Nbins):
+
+        for k in range(Nref):
+            j = ref_inds[k]
+
+            #Shift to coordinate system with point j at the center
+            xf_rel = xf - xf[j]
+            yf_rel = yf - yf[j]
+
+            #Radial distances to the other points
+            rf_rel = np.sqrt( xf_rel**2 + yf_rel**2)
+
+            if i==0:
+                bool_in_bin = rf_rel==0
+            else:
+                bool_in_bin = (rf_rel> r_bin_edges[i] ) * (rf_rel<= r_bin_edges[i+1] )
+
+            if np.any(bool_in_bin):
+                Nf_in_rbin_ref[k,i] = np.sum(bool_in_bin)
+
+                products = np.zeros(np.sum(bool_in_bin))
+                for c in range(Ncomp):
+                    products += Af[c, j] * Bf[c][bool_in_bin]
+
+                Cf_ref[k,i] = np.sum( products / (varf_rms ** 2) )
+
+    return Nf_in_rbin_ref, Cf_ref
+
+
+
+def stratified_reference_points(xf, yf, Nref, rng):
+    """
+    Draws Nref reference points, stratified on a square grid over the bounding box of the points
+    so that the sample covers the frame evenly. Returns sorted indices of reference points.
+
+    Parameters:
+    - xf, yf: coordinates of points
+    - Nref: number of reference points to draw
+    - rng: numpy random Generator
+    """
+
+    Npoints = len(xf)
+    if Nref >= Npoints:
+        return np.arange(Npoints)
+
+    # Square grid with on average 4 reference points per stratum
+    Nside = max(1, int(np.sqrt(Nref / 4)))
+    ix = np.minimum((Nside * (xf - xf.min()) / (np.ptp(xf) + 1e-12)).astype(int), Nside - 1)
+    iy = np.minimum((Nside * (yf - yf.min()) / (np.ptp(yf) + 1e-12)).astype(int), Nside - 1)
+    stratum = ix * Nside + iy
+
+    # Proportional allocation, remainder goes to strata with largest fractional part
+    Nin_stratum = np.bincount(stratum, minlength=Nside**2)
+    quota       = Nin_stratum * Nref / Npoints
+    allocation  = np.floor(quota).astype(int)
+    remainder   = Nref - np.sum(allocation)
+    fractional  = quota - allocation + 1e-9 * rng.random(len(quota))
+    allocation[np.argsort(fractional)[::-1][:remainder]] += 1
+
+    # Random order within each stratum, keep the first points of each
+    order = np.lexsort((rng.random(Npoints), stratum))
+    sorted_stratum = stratum[order]
+    rank = np.arange(Npoints) - np.searchsorted(sorted_stratum, sorted_stratum, side='left')
+
+    return np.sort(order[rank < allocation[sorted_stratum]])
+
+
+
+def ratio_standard_error(N_ref, C_ref, Npoints):
+    """
+    Standard error of C = sum(C_ref) / sum(N_ref) in each bin, estimated from the spread between
+    reference points. Includes finite population correction, so error is zero when all points are used.
+    """
+
+    Nref = N_ref.shape[0]
+    if Nref < 2:
+        return np.full(N_ref.shape[1], np.inf)
+
+    N_sum = np.sum(N_ref, axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        C = np.sum(C_ref, axis=0) / N_sum
+        residual_var = np.sum((C_ref - C * N_ref)**2, axis=0) / (Nref - 1)
+        err = np.sqrt((1 - Nref / Npoints) * Nref * residual_var) / N_sum
+
+    # bins without pairs carry no information
+    return np.where(N_sum > 0, err, np.nan)
+
+
+
+def sampled_bin_sums(kernel, xf, yf, Af, Bf, r_bin_edges, Nmax=5000, error_target=None, rng=None, Nref_min=100):
+    """
+    Sums correlation products over pairs in each distance bin. Uses all points as reference points,
+    or a seeded, stratified sample of reference points if there are more than Nmax points or an error target is set.
+    With an error target, the number of reference points is increased until the estimated standard error
+    of every bin is below error_target, but never beyond Nmax. The target is then not met, see Cf_err.
+
+    Returns:
+    - Nf_in_rbin_values: number of pairs used in each bin
+    - Cf_values: sum of normalized correlation products in each bin
+    - Nref: number of reference points used
+    - Cf_err: estimated standard error of correlation in each bin
+    """
+
+    Npoints = len(xf)
+
+    if rng is None:
+        rng = np.random.default_rng(0)
+
+    if error_target is None:
+        Nref = min(Npoints, Nmax)
+    else:
+        Nref = min(Npoints, Nmax, Nref_min)
+
+    while True:
+        ref_inds = stratified_reference_points(xf, yf, Nref, rng)
+        N_ref, C_ref = kernel(xf, yf, Af, Bf, r_bin_edges, ref_inds)
+
+        Cf_err = ratio_standard_error(N_ref, C_ref, Npoints)
+        max_err = np.nanmax(Cf_err) if np.any(np.isfinite(Cf_err)) else 0
+
+        if error_target is None or Nref >= min(Npoints, Nmax) or max_err <= error_target:
+            break
+
+        # standard error scales as 1/sqrt(Nref)
+        Nref = min(Npoints, Nmax, int(np.ceil(Nref * (max_err / error_target)**2)))
+
+    return np.sum(N_ref, axis=0), np.sum(C_ref, axis=0), len(ref_inds), Cf_err
+
+
+
+def fft_bin_sums(xf, yf, Af, Bf, r_bin_edges):
+    """
+    Sums correlation products over all pairs in each distance bin with FFTs, for points on a regular grid
+    (e.g. PIV fields or coarse-grained fields). Missing grid points are treated as masked.
+    The grid is zero-padded, so it is not assumed periodic.
+
+    Returns same as sampled_bin_sums, with all points as reference points and zero error.
+    """
+
+    # Infer grid from coordinates
+    ux, uy = np.unique(xf), np.unique(yf)
+    hx = np.min(np.diff(ux)) if len(ux) > 1 else 1.
+    hy = np.min(np.diff(uy)) if len(uy) > 1 else 1.
+    ix = np.rint((xf - ux[0]) / hx).astype(int)
+    iy = np.rint((yf - uy[0]) / hy).astype(int)
+
+    if not (np.allclose(ux[0] + ix * hx, xf) and np.allclose(uy[0] + iy * hy, yf)):
+        raise ValueError("fft backend requires points on a regular grid")
+
+    # Zero-padded grids
+    shape = (2 * (ix.max() + 1), 2 * (iy.max() + 1))
+    mask_grid = np.zeros(shape)
+    mask_grid[ix, iy] = 1
+
+    varf_rms = np.sqrt(abs(np.mean(np.sum(Af * Bf, axis=0))))
+
+    # sum_j A[j] * B[j + d] for every displacement d
+    S = np.zeros(shape)
+    for c in range(Af.shape[0]):
+        A_grid = np.zeros(shape)
+        B_grid = np.zeros(shape)
+        A_grid[ix, iy] = Af[c]
+        B_grid[ix, iy] = Bf[c]
+        S += np.real(np.fft.ifft2(np.conj(np.fft.fft2(A_grid)) * np.fft.fft2(B_grid)))
+
+    F_mask = np.fft.fft2(mask_grid)
+    N = np.rint(np.real(np.fft.ifft2(np.conj(F_mask) * F_mask)))
+
+    # Signed displacements of grid
+    dx = np.fft.fftfreq(shape[0], d=1 / shape[0]) * hx
+    dy = np.fft.fftfreq(shape[1], d=1 / shape[1]) * hy
+    r  = np.sqrt(dx[:, None]**2 + dy[None, :]**2).ravel()
+
+    Nbins = len(r_bin_edges) - 1
+    inds  = distance_bin_indices(r, r_bin_edges)
+
+    Nf_in_rbin_values = np.bincount(inds, weights=N.ravel(), minlength=Nbins + 1)[:Nbins]
+    Cf_values         = np.bincount(inds, weights=S.ravel(), minlength=Nbins + 1)[:Nbins] / varf_rms**2
+
+    return Nf_in_rbin_values, Cf_values, len(xf), np.zeros(Nbins)
+
+
+
+def spatial_bin_sums(backend, xf, yf, Af, Bf, r_bin_edges, Nmax=5000, error_target=None, rng=None):
+    """ Computes sums of correlation products in distance bins of one frame with backend """
+
+    assert backend in BACKENDS, f"Unknown backend {backend}. Must be one of {BACKENDS}"
+
+    if backend == 'fft':
+        return fft_bin_sums(xf, yf, Af, Bf, r_bin_edges)
+
+    kernel = python_spatial_kernel if backend == 'python' else numba_spatial_kernel
+
+    return sampled_bin_sums(kernel, xf, yf, Af, Bf, r_bin_edges, Nmax=Nmax, error_target=error_target, rng=rng)
@@ -1,166 +1,41 @@
 import numpy as np
 
-from tqdm  import tqdm
-from numba import njit, prange
-import warnings
+from tqdm import tqdm
 
-def scalar_temporal_correlation(var1, var2, Nframes, t_max=None):
+import correlation_backends as backends
 
-    '''
-    Computes temporal correlation of two scalars
-    '''
-    if t_max==None:
-        t_max = Nframes
 
-    delta_f = np.ma.masked_array(np.zeros(shape=(Nframes,Nframes)), True)  
-    C_norm  = np.ma.masked_array(np.zeros(shape=(Nframes,Nframes)), True)
-    N       = np.ma.masked_array(np.zeros(shape=(Nframes,Nframes)), True)
-
-    for i in tqdm(range(Nframes)):
-    
-        if  np.any(var1[i,:].mask==False):
-            Noki = len(var1[i,:].compressed())
-            
-            if Noki>0:
-                bool_oki = ~var1.mask[i,:]
-            
-                for j in range(i, Nframes):
-
-                    #If X not masked for this frame do
-                    if  np.any(var1[j,:].mask==False):
-                        Nokj = len(var1[j,:].compressed())
-                        
-                        #If at least one acceptable PIV vector
-                        if Nokj>0:        
-                            bool_okj = ~var1.mask[j,:]   
-                            bool_ok  = bool_oki * bool_okj
-                            
-                            var1_i = var1[i,bool_ok].compressed()
-                            var1_j = var1[j,bool_ok].compressed()
-                            
-                            var2_i = var2[i,bool_ok].compressed()
-                            var2_j = var2[j,bool_ok].compressed()
-                                                            
-                            # Normalize by the rms
-                            rms = np.ma.sqrt(abs( np.ma.mean(var1_i * var2_i) * np.ma.mean(var1_j * var2_j) ))
-                            C_norm[i,j-i] = np.ma.mean(var1_i * var2_j) / rms
-                            N[i,j] = np.min([Noki, Nokj])
-                        
-                            delta_f[i,j] = j-i
-
-    return C_norm[:,:t_max], N[:,:t_max], delta_f[:,:t_max]
-
-
-def scalar_vector_temporal_correlation(var1, vec2, Nframes, t_max=None):
-    '''
-    Computes temporal correlation of two scalars
-    '''
-    if t_max==None:
-        t_max = Nframes
+class CorrelationResult(dict):
+    """
+    Result of a spatial or temporal correlation, shared by the simulation and experimental pipelines.
+    Behaves as a dictionary, and keys can also be accessed as attributes.
+
+    Common keys:
+    - C_norm: normalized correlation (time averaged if t_avrg)
+    - C_sum:  partial sums of correlation per frame/time origin, used for resampling
+    - N:      number of pairs per frame/time origin and bin
+    - axis:   bin values (time differences or distances)
+    - kind:   't' or 'r'
+    """
+
+    def __getattr__(self, key):
+        try:
+            return self[key]
+        except KeyError:
+            raise AttributeError(key)
 
-    var2x, var2y = vec2
-
-    delta_f = np.ma.masked_array(np.zeros(shape=(Nframes,Nframes)), True)  
-    C_norm  = np.ma.masked_array(np.zeros(shape=(Nframes,Nframes)), True)
-    N       = np.ma.masked_array(np.zeros(shape=(Nframes,Nframes)), True)
-
-    for i in tqdm(range(Nframes)):
-    
-        if  np.any(var2x[i,:].mask==False):
-            Noki = len(var2x[i,:].compressed())
-            
-            if Noki>0:
-                bool_oki = ~var2x.mask[i,:] * ~var2y.mask[i,:]
-            
-                for j in range(i, Nframes):
-
-                    #If X not masked for this frame do
-                    if  np.any(var2x[j,:].mask==False):
-                        Nokj = len(var2x[j,:].compressed())
-                        
-                        #If at least one acceptable PIV vector
-                        if Nokj>0:        
-                            bool_okj = ~var2x.mask[j,:] * ~var2y.mask[j,:]
-                            bool_ok  = bool_oki * bool_okj
-                            
-                            var1_i = var1[i,bool_ok].compressed()
-                            var1_j = var1[j,bool_ok].compressed()
-                            
-                            var2x_i = var2x[i,bool_ok].compressed()
-                            var2x_j = var2x[j,bool_ok].compressed()
-
-                            var2y_i = var2y[i,bool_ok].compressed()
-                            var2y_j = var2y[j,bool_ok].compressed()
-                                                            
-                            #Normalize by the rms
-                            C_norm[i,j-i] = np.ma.mean(var1_i * (var2x_j + var2y_j)) /  np.ma.sqrt(abs( np.ma.mean(var1_i * (var2x_i + var2y_i)) * np.ma.mean(var1_j * (var2x_j + var2y_j)) ))
-                            
-                            N[i,j] = np.min([Noki, Nokj])
-                        
-                            delta_f[i,j] = j-i
-
-    return C_norm[:,:t_max], N[:,:t_max], delta_f[:,:t_max]
-    
-    
-
-def vector_temporal_correlation(vec1, vec2, Nframes, t_max=None):
-    '''
-    Computes temporal correlation of two scalars
-    '''
-    if t_max==None:
-        t_max = Nframes
-        
-    var1x, var1y = vec1
-    var2x, var2y = vec2
-
-    delta_f = np.ma.masked_array(np.zeros(shape=(Nframes,Nframes)), True)  
-    C_norm  = np.ma.masked_array(np.zeros(shape=(Nframes,Nframes)), True)
-    N       = np.ma.masked_array(np.zeros(shape=(Nframes,Nframes)), True)
-
-    for i in tqdm(range(Nframes)):
-    
-        if  np.any(var1x[i,:].mask==False):
-            Noki = len(var1x[i,:].compressed())
-            
-            if Noki>0:
-                bool_oki = ~var1x.mask[i,:] * ~var1y.mask[i,:]
-            
-                for j in range(i, Nframes):
-
-                    #If X not masked for this frame do
-                    if  np.any(var1x[j,:].mask==False):
-                        Nokj     = len(var1x[j,:].compressed())
-                        
-                        #If at least one acceptable PIV vector
-                        if Nokj>0:  
-                            bool_okj = ~var1x.mask[j,:] * ~var1y.mask[j,:]   
-                            bool_ok  = bool_oki * bool_okj
-                            
-                            var1x_i = var1x[i,bool_ok].compressed()
-                            var1x_j = var1x[j,bool_ok].compressed()
-
-                            var1y_i = var1y[i,bool_ok].compressed()
-                            var1y_j = var1y[j,bool_ok].compressed()
-
-                            var2x_i = var2x[i,bool_ok].compressed()
-                            var2x_j = var2x[j,bool_ok].compressed()
-
-                            var2y_i = var2y[i,bool_ok].compressed()
-                            var2y_j = var2y[j,bool_ok].compressed()
-                                                            
-                            #Normalize by the rms
-                            C_norm[i,j-i] = np.ma.mean(var1x_i * var2x_j + var1y_i * var2y_j) / np.ma.sqrt(abs( np.ma.mean(var1x_i*var2x_i + var1y_i*var2y_i ) * np.ma.mean(var1x_j*var2x_j + var1y_j*var2y_j ) ))
-                            N[i,j] = np.min([Noki, Nokj])                       
-                            delta_f[i,j] = j-i
-
-    return C_norm[:,:t_max], N[:,:t_max], delta_f[:,:t_max]
-
-
-
-def general_temporal_correlation(var1, var2=None, t_max=None, t_avrg=False):
 
-    if np.any(var2==None):
-        var2 = var1
+
+def variable_components(var1, var2):
+    """
+    Splits scalar (Nframes, Npoints) or vector (2, Nframes, Npoints) variables into components A and B,
+    such that the correlation product of two points j, k is sum_c A[c,j] * B[c,k]:
+    - scalar-scalar: var1 * var2
+    - scalar-vector: var1 * (var2x + var2y)
+    - vector-vector: var1x * var2x + var1y * var2y
+
+    Returns masked arrays A, B of shape (Ncomp, Nframes, Npoints)
+    """
 
     dim_var1 = np.shape(var1)
     dim_var2 = np.shape(var2)
@@ -168,413 +43,203 @@ def general_temporal_correlation(var1, var2=None, t_max=None, t_avrg=False):
     # len=2: variable is scalar, len=3: variable is vector
     assert len(dim_var1) in [2,3] and len(dim_var2) in [2,3]
 
-    if len(dim_var1) == 2:
-        Nframes = dim_var1[0]
+    if len(dim_var1) == 2 and len(dim_var2) == 2:
+        A, B = [var1], [var2]
+
+    elif len(dim_var1) == 2:
+        A, B = [var1, var1], [var2[0], var2[1]]
+
+    elif len(dim_var2) == 2:
+        A, B = [var2, var2], [var1[0], var1[1]]
+
+    else:
+        A, B = [var1[0], var1[1]], [var2[0], var2[1]]
+
+    return np.ma.array(A), np.ma.array(B)
+
+
+
+def valid_points(A, B):
+    """ Points where no component is masked, shape (Nframes, Npoints) """
+
+    return ~np.any(np.ma.getmaskarray(A), axis=0) * ~np.any(np.ma.getmaskarray(B), axis=0)
 
-        if len(dim_var2) == 2:
-            C_norm, N, delta_f = scalar_temporal_correlation(var1, var2, Nframes, t_max)
 
-        else:
 
-            var2x = var2[0]
-            var2y = var2[1]
-            C_norm, N, delta_f = scalar_vector_temporal_correlation(var1, [var2x, var2y], Nframes, t_max)
+#########################
+# Temporal correlations #
+#########################
 
+def temporal_correlation(A, B, t_max, backend='numba'):
+    """
+    Computes temporal correlation for all time origins.
 
-    if len(dim_var1) == 3:
-        Nframes = dim_var1[1]
-        var1x = var1[0]
-        var1y = var1[1]
+    Returns:
+    - C_norm: normalized correlation at [time origin, time difference], masked where no points
+    - N: number of points used at [time origin, time difference]
+    - delta_f: time difference in frames
+    """
 
-        if len(dim_var2) == 2:
+    valid  = valid_points(A, B)
+    kernel = backends.temporal_kernel(backend)
 
-            C_norm, N, delta_f = scalar_vector_temporal_correlation(var2, [var1x, var1y], Nframes, t_max)
+    C, N = kernel(np.ma.filled(A, 0).astype(float), np.ma.filled(B, 0).astype(float), valid, t_max)
 
-        else:
+    no_points = N == 0
+    C_norm  = np.ma.masked_array(C, no_points)
+    N       = np.ma.masked_array(N, no_points)
+    delta_f = np.ma.masked_array(np.tile(np.arange(t_max), (len(C), 1)), no_points)
 
-            var2x = var2[0]
-            var2y = var2[1]
-            C_norm, N, delta_f = vector_temporal_correlation([var1x, var1y], [var2x, var2y], Nframes, t_max)
+    return C_norm, N, delta_f
+
+
+
+def general_temporal_correlation(var1, var2=None, t_max=None, t_avrg=False, backend='numba'):
+    """
+    Computes temporal correlation of two scalar or vector variables.
+
+    Parameters:
+    - var1, var2: scalar (Nframes, Npoints) or vector (2, Nframes, Npoints) masked arrays. var2=var1 if None.
+    - t_max: number of time differences
+    - t_avrg: average over time origins
+    - backend: 'python' (reference) or 'numba'. Normalization depends on the time origin, so 'fft' uses 'numba'.
+    """
+
+    if np.any(var2==None):
+        var2 = var1
+
+    A, B = variable_components(var1, var2)
+
+    Nframes = A.shape[1]
+    if t_max==None:
+        t_max = Nframes
+
+    C_norm, N, delta_f = temporal_correlation(A, B, t_max, backend=backend)
+
+    # Per-origin partial sums, used for resampling
+    C_sum = C_norm * N
 
     if t_avrg:
-        C_norm = np.mean(C_norm, axis=0)                  
+        C_norm = np.mean(C_norm, axis=0)
+
+    COR = CorrelationResult(delta_f = delta_f,
+                            C_norm  = C_norm,
+                            C_sum   = C_sum,
+                            N       = N,
+                            axis    = np.arange(t_max),
+                            kind    = 't')
 
-    COR = {'delta_f': delta_f,
-             'C_norm':  C_norm,
-             'N':       N}
-            
     return COR
 
 
+
 ########################
 # Spatial correlations #
 ########################
 
-@njit(parallel=True)
-def scalar_spatial_correlation_loopv2(xf, yf, var1f, var2f, r_bin_edges): 
-    
-    Nbins = len(r_bin_edges)-1
-    Nf_in_rbin_values = np.zeros(Nbins)
-    Nf_in_rbin_mask = np.ones(Nbins, dtype=np.bool_)
-    
-    
-    Cf_values = np.zeros(Nbins)
-    Cf_mask = np.ones(Nbins, dtype=np.bool_)
-    varf_rms = np.sqrt(abs(np.mean(var1f*var2f)))
-    
-    for i in prange(Nbins):
-        
-        for j in range(len(var1f)):
-            
-            #Get the coordinates of PIV vector i location
-            xf_i = xf[j]
-            yf_i = yf[j]
-            
-            #Shift to coordinate system with vector i at the center, and only consider the other vectors than vector i
-            xf_rel = xf - xf_i
-            yf_rel = yf - yf_i
-
-            #Radial distances to the vectors
-            rf_rel = np.sqrt( xf_rel**2 + yf_rel**2)
-    
-            if i==0:
-                bool_in_bin = rf_rel==0
-            else:
-                bool_in_bin = (rf_rel> r_bin_edges[i] ) * (rf_rel<= r_bin_edges[i+1] )
-    
-    
-            if np.any(bool_in_bin):
-                Cf_mask[i] = False
-                
-                Nf_in_rbin_mask[i] = False
-                Nf_in_rbin_values[i] += np.sum(bool_in_bin)
-
-                var2f_in_bin = var2f[bool_in_bin]
-
-                var1var2 = var1f[j] * var2f_in_bin
-                
-                # + keeps the mask intact when none in bin
-                Cf_values[i] += np.sum( var1var2 / (varf_rms ** 2) )
-        
-    return Nf_in_rbin_values, Nf_in_rbin_mask, Cf_values, Cf_mask
-
-
-
-def scalar_spatial_correlation(x, y, var1, var2, dr, r_max, Nmax=5000, every_n_frames = 1):
-    
-    Nframes = x.shape[0]
-    
-    #Add a point at zero
-    r_bin_edges   = np.concatenate( ( [0],np.arange(0, r_max, dr) ) )
-    r_bin_centers = (r_bin_edges[1:] + r_bin_edges[:-1])/2
-
-    Nbins     = len(r_bin_centers)
-    C_norm    = np.ma.masked_array(np.zeros(shape = (Nframes, Nbins)), True)
-    N_in_rbin = np.ma.masked_array(np.zeros(shape = (Nframes, Nbins)), True)
-    
-    frame_axis = np.arange(0, Nframes, every_n_frames, dtype=int)
-    frame_axis_masked = np.ma.masked_array(np.arange(0, Nframes, dtype=int), True)
-    
-    for f in tqdm(frame_axis):
-        
-        if  np.any(var1[f,:].mask==False):
-        
-            Nok = len(var1[f,:].compressed())
-            
-            #If at least one acceptable PIV vector
-            if Nok>0:
-                
-                xf, yf, var1f, var2f  = x[f,:].compressed(),  y[f,:].compressed(),  var1[f,:].compressed(),  var2[f,:].compressed()
-                
-                if Nok>=Nmax:
-                    
-                    ind_selected = np.random.choice(np.arange(len(xf)), replace=False, size = Nmax)
-                    xf = xf[ind_selected]  
-                    yf = yf[ind_selected]  
-                    var1f = var1f[ind_selected]  
-                    var2f = var2f[ind_selected]  
-                        
-
-                frame_axis_masked.mask[f] = False   
-                            
-                Nf_in_rbin_values, Nf_in_rbin_mask, Cvf_norm_values, Cvf_mask = scalar_spatial_correlation_loopv2(xf, yf, var1f, var2f, r_bin_edges)
-                
-                C_norm[f,:]         = Cvf_norm_values
-                C_norm.mask[f,:]    = Cvf_mask
-                N_in_rbin[f,:]      = Nf_in_rbin_values
-                N_in_rbin.mask[f,:] = Nf_in_rbin_mask
+def spatial_correlation(x, y, A, B, dr, r_max, backend='numba', Nmax=5000, error_target=None, seed=0, every_n_frames=1):
+    """
+    Computes spatial correlation in each frame.
 
-
-    C_norm = C_norm/N_in_rbin
-              
-    return C_norm, N_in_rbin, r_bin_centers, frame_axis_masked
-
-
-
-@njit(parallel=True)
-def scalar_vector_spatial_correlation_loopv2(xf, yf, var1f, vec2f, r_bin_edges): 
-    
-    var2xf, var2yf = vec2f
-
-    Nbins = len(r_bin_edges)-1
-    Nf_in_rbin_values = np.zeros(Nbins)
-    Nf_in_rbin_mask = np.ones(Nbins, dtype=np.bool_)
-    
-    
-    Cf_values = np.zeros(Nbins)
-    Cf_mask  = np.ones(Nbins, dtype=np.bool_)
-    varf_rms = np.sqrt(np.mean(var1f*var2xf + var1f*var2yf))
-    
-    for i in prange(Nbins):
-        
-        for j in range(len(var2xf)):
-            
-            #Get the coordinates of PIV vector i location
-            xf_i = xf[j]
-            yf_i = yf[j]
-            
-            #Shift to coordinate system with vector i at the center, and only consider the other vectors than vector i
-            xf_rel = xf - xf_i
-            yf_rel = yf - yf_i
-
-            #Radial distances to the vectors
-            rf_rel = np.sqrt( xf_rel**2 + yf_rel**2)
-    
-            if i==0:
-                bool_in_bin = rf_rel==0
-            else:
-                bool_in_bin = (rf_rel> r_bin_edges[i] ) * (rf_rel<= r_bin_edges[i+1] )
-    
-    
-            if np.any(bool_in_bin):
-                Cf_mask[i] = False
-                
-                Nf_in_rbin_mask[i] = False
-                Nf_in_rbin_values[i] += np.sum(bool_in_bin)
-
-                var1f_in_bin = var1f[bool_in_bin]
-
-                var1var2 = var1f_in_bin * var2xf[j] + var1f_in_bin * var2yf[j]
-                
-                # + keeps the mask intact when none in bin
-                Cf_values[i] += np.sum( var1var2 / (varf_rms ** 2) )
-        
-    return Nf_in_rbin_values, Nf_in_rbin_mask, Cf_values, Cf_mask
-
-
-
-def scalar_vector_spatial_correlation(x, y, var1, vec2, dr, r_max, Nmax=5000, every_n_frames = 1):
-    
-    var2x, var2y = vec2
+    Returns:
+    - C_norm: normalized correlation at [frame, distance bin]
+    - N_in_rbin: number of pairs used at [frame, distance bin]
+    - r_bin_centers: distance bins
+    - frame_axis_masked: frames, masked where not computed
+    - N_ref: number of reference points used in each frame
+    - C_err: estimated standard error from sampling reference points
+    """
 
     Nframes = x.shape[0]
-    
+    rng     = np.random.default_rng(seed)
+    valid   = valid_points(A, B) * ~np.ma.getmaskarray(x) * ~np.ma.getmaskarray(y)
+
     #Add a point at zero
     r_bin_edges   = np.concatenate( ( [0],np.arange(0, r_max, dr) ) )
     r_bin_centers = (r_bin_edges[1:] + r_bin_edges[:-1])/2
 
     Nbins     = len(r_bin_centers)
     C_norm    = np.ma.masked_array(np.zeros(shape = (Nframes, Nbins)), True)
+    C_err     = np.ma.masked_array(np.zeros(shape = (Nframes, Nbins)), True)
     N_in_rbin = np.ma.masked_array(np.zeros(shape = (Nframes, Nbins)), True)
-    
-    frame_axis = np.arange(0, Nframes, every_n_frames, dtype=int)
-    frame_axis_masked = np.ma.masked_array(np.arange(0, Nframes, dtype=int), True)
-    
-    for f in tqdm(frame_axis):
-        
-        if  np.any(var2x[f,:].mask==False):
-        
-            Nok = len(var2x[f,:].compressed())
-            
-            #If at least one acceptable PIV vector
-            if Nok>0:
-                
-                xf, yf =     x[f,:].compressed(),      y[f,:].compressed()
-                var1f  =  var1[f,:].compressed()
-                vec2f  = var2x[f,:].compressed(),  var2y[f,:].compressed()
-
-                if Nok>=Nmax:
-                    
-                    ind_selected = np.random.choice(np.arange(len(xf)), replace=False, size = Nmax)
-                    xf = xf[ind_selected]  
-                    yf = yf[ind_selected]  
-                    var1f = var1f[ind_selected]  
-                    var2f = var2f[ind_selected]  
-                        
-
-                frame_axis_masked.mask[f] = False   
-                            
-                Nf_in_rbin_values, Nf_in_rbin_mask, Cvf_norm_values, Cvf_mask = scalar_vector_spatial_correlation_loopv2(xf, yf, var1f, vec2f, r_bin_edges)
-                
-                C_norm[f,:]         = Cvf_norm_values
-                C_norm.mask[f,:]    = Cvf_mask
-                N_in_rbin[f,:]      = Nf_in_rbin_values
-                N_in_rbin.mask[f,:] = Nf_in_rbin_mask
-
-
-    C_norm = C_norm/N_in_rbin
-              
-    return  C_norm, N_in_rbin, r_bin_centers, frame_axis_masked
-
-
-
-@njit(parallel=True)
-def vector_spatial_correlation_loopv2(xf, yf, vec1f, vec2f, r_bin_edges):
-
-    var1xf, var1yf = vec1f
-    var2xf, var2yf = vec2f
-    
-    Nbins = len(r_bin_edges)-1
-    Nf_in_rbin_values = np.zeros(Nbins)
-    Nf_in_rbin_mask   = np.ones(Nbins, dtype=np.bool_)
-    
-    Cvf_norm_values = np.zeros(Nbins)
-    Cvf_mask = np.ones(Nbins, dtype=np.bool_)
-    vf_rms   = np.sqrt(np.mean(var1xf*var2xf + var1yf*var2yf))
-    
-    
-    for i in prange(Nbins):
-    
-        for j in range(len(var1xf)):
-
-            #Get the coordinates of PIV vector i location
-            xf_i = xf[j]
-            yf_i = yf[j]
-            
-            #Shift to coordinate system with vector i at the center, and only consider the other vectors than vector i
-            xf_rel = xf - xf_i
-            yf_rel = yf - yf_i
-        
-            #Radial distances to the vectors
-            rf_rel = np.sqrt( xf_rel**2 + yf_rel**2)
-    
-            if i==0:
-                bool_in_bin = rf_rel==0
-            else:
-                bool_in_bin = (rf_rel> r_bin_edges[i] ) * (rf_rel<= r_bin_edges[i+1] )
-    
-            if np.any(bool_in_bin):
-                Cvf_mask[i] = False
-                
-                Nf_in_rbin_mask[i] = False
-                Nf_in_rbin_values[i] += np.sum(bool_in_bin)
-
-                var1xf_in_bin = var1xf[bool_in_bin]
-                var1yf_in_bin = var1yf[bool_in_bin]
-            
-                vxvx_vyvy = var1xf_in_bin * var2xf[j] + var1yf_in_bin * var2yf[j]
-                
-                # + keeps the mask intact when none in bin
-                Cvf_norm_values[i]+= np.sum( vxvx_vyvy/(vf_rms * vf_rms) )
-    
-
-    return Nf_in_rbin_values, Nf_in_rbin_mask, Cvf_norm_values, Cvf_mask
-
-
-
-def vector_spatial_correlation(x, y, vec1, vec2, dr, r_max):
-
-    var1x, var1y = vec1
-    var2x, var2y = vec2
-
-    #Add a point at zero
-    r_bin_edges   = np.concatenate( ( [0],np.arange(0, r_max, dr) ) )
-    r_bin_centers = (r_bin_edges[1:] + r_bin_edges[:-1])/2
-    
-    Nframes = x.shape[0]
-    Nbins   = len(r_bin_centers)
+    N_ref     = np.zeros(Nframes, dtype=int)
 
-    C_norm    = np.ma.masked_array(np.zeros(shape = (Nframes, Nbins)), True)
-    N_in_rbin = np.ma.masked_array(np.zeros(shape = (Nframes, Nbins)), True)
-    
-    frame_axis        = np.arange(0, Nframes, 1, dtype=int)
+    frame_axis        = np.arange(0, Nframes, every_n_frames, dtype=int)
     frame_axis_masked = np.ma.masked_array(np.arange(0, Nframes, dtype=int), True)
-    
 
     for f in tqdm(frame_axis):
-        
-        if  np.any(var1x[f,:].mask==False):
-            
-            Nok = len(var1x[f,:].compressed())
-            
-            #If at least one acceptable PIV vector
-            if Nok>0:
-                
-                xf, yf =     x[f,:].compressed(),      y[f,:].compressed()
-                vec1f  = var1x[f,:].compressed(),  var1y[f,:].compressed()
-                vec2f  = var2x[f,:].compressed(),  var2y[f,:].compressed()
-                        
-                frame_axis_masked.mask[f] = False   
-                            
-                Nf_in_rbin_values, Nf_in_rbin_mask, Cvf_norm_values, Cvf_mask   =   vector_spatial_correlation_loopv2(xf, yf, vec1f, vec2f, r_bin_edges)
-                
-                C_norm[f,:]      = Cvf_norm_values
-                C_norm.mask[f,:] = Cvf_mask
-
-                N_in_rbin[f,:]      = Nf_in_rbin_values
-                N_in_rbin.mask[f,:] = Nf_in_rbin_mask
 
+        #If at least one acceptable point
+        if np.any(valid[f]):
 
-    C_norm = C_norm/N_in_rbin
-    
-    return C_norm, N_in_rbin, r_bin_centers, frame_axis_masked
-
+            bool_ok = valid[f]
+            xf, yf  = np.ma.getdata(x[f])[bool_ok], np.ma.getdata(y[f])[bool_ok]
+            Af      = np.ma.getdata(A[:, f])[:, bool_ok].astype(float)
+            Bf      = np.ma.getdata(B[:, f])[:, bool_ok].astype(float)
 
+            frame_axis_masked.mask[f] = False
 
+            Nf_in_rbin_values, Cf_values, N_ref[f], Cf_err = backends.spatial_bin_sums(backend, xf, yf, Af, Bf, r_bin_edges,
+                                                                                         Nmax=Nmax, error_target=error_target, rng=rng)
 
-def general_spatial_correlation(x, y, var1, var2=None, dr=40, r_max=500, t_avrg=False):
+            no_pairs = Nf_in_rbin_values == 0
 
-    if np.any(var2==None):
-        var2 = var1
+            C_norm[f,:]         = Cf_values
+            C_norm.mask[f,:]    = no_pairs
+            C_err[f,:]          = Cf_err
+            C_err.mask[f,:]     = no_pairs
+            N_in_rbin[f,:]      = Nf_in_rbin_values
+            N_in_rbin.mask[f,:] = no_pairs
 
-    dim_var1 = np.shape(var1)
-    dim_var2 = np.shape(var2)
 
-    # len=2: variable is scalar, len=3: variable is vector
-    assert len(dim_var1) in [2,3] and len(dim_var2) in [2,3]
-
-    if len(dim_var1) == 2:
-
-        if len(dim_var2) == 2:
-            # print("scalar spatial correlation")
+    C_norm = C_norm/N_in_rbin
 
-            C_norm, N_in_rbin, r_bin_centers, frame_axis_masked = scalar_spatial_correlation(x, y, var1, var2, dr, r_max)
+    return C_norm, N_in_rbin, r_bin_centers, frame_axis_masked, N_ref, C_err
 
-        else:
-            # print("scalar-vector spatial correlation")
 
-            var2x = var2[0]
-            var2y = var2[1]
 
-            C_norm, N_in_rbin, r_bin_centers, frame_axis_masked = scalar_vector_spatial_correlation(x, y, var1, [var2x, var2y], dr, r_max)
+def general_spatial_correlation(x, y, var1, var2=None, dr=40, r_max=500, t_avrg=False, Nmax=5000, error_target=None, seed=0, backend='numba'):
+    """
+    Computes spatial correlation of two scalar or vector variables.
 
+    With more than Nmax points in a frame, or if error_target is given, only a seeded, spatially stratified
+    sample of reference points is used. With error_target, the sample grows until the estimated standard error
+    of every bin is below error_target, up to Nmax reference points, which bounds the cost. Frames where the target
+    is not met are reported. The number of pairs used in each bin is returned as N_pairs_in_rbin,
+    and the number of reference points in each frame as N_ref_points.
 
-    if len(dim_var1) == 3:
+    Backends: 'python' (reference), 'numba', or 'fft' (exact, for points on a regular grid).
+    """
 
-        var1x = var1[0]
-        var1y = var1[1]
+    if np.any(var2==None):
+        var2 = var1
 
-        if len(dim_var2) == 2:
-            # print("scalar-vector spatial correlation")
+    A, B = variable_components(var1, var2)
 
-            C_norm, N_in_rbin, r_bin_centers, frame_axis_masked = scalar_vector_spatial_correlation(x, y, var2, [var1x, var1y], dr, r_max)
+    C_norm, N_in_rbin, r_bin_centers, frame_axis_masked, N_ref, C_err = spatial_correlation(x, y, A, B, dr, r_max, backend=backend,
+                                                                                            Nmax=Nmax, error_target=error_target, seed=seed)
 
-        else:
-            # print("vector spatial correlation")
+    if error_target is not None:
+        Nmissed = np.sum(np.ma.filled(np.ma.max(C_err, axis=1), 0) > error_target)
+        if Nmissed > 0:
+            print(f"Error target {error_target} not met with at most Nmax={Nmax} reference points in {Nmissed} frames")
 
-            var2x = var2[0]
-            var2y = var2[1]
+    # Per-frame partial sums, used for resampling
+    C_sum = C_norm * N_in_rbin
 
-            C_norm, N_in_rbin, r_bin_centers, frame_axis_masked = vector_spatial_correlation(x, y, [var1x, var1y], [var2x, var2y], dr, r_max)
-                  
     if t_avrg:
         C_norm = np.mean(C_norm, axis=0)
 
-    
-    COR = {'C_norm':          C_norm,
-           'N_pairs_in_rbin': N_in_rbin,
-           'r_bin_centers':   np.ma.array(r_bin_centers, mask=C_norm.mask),
-           'frame_axis':      frame_axis_masked}
-            
-    return COR
 
+    COR = CorrelationResult(C_norm          = C_norm,
+                            C_sum           = C_sum,
+                            C_err           = C_err,
+                            N               = N_in_rbin,
+                            N_pairs_in_rbin = N_in_rbin,
+                            N_ref_points    = N_ref,
+                            r_bin_centers   = np.ma.array(r_bin_centers, mask=np.ma.getmaskarray(C_norm) if t_avrg else np.all(np.ma.getmaskarray(C_norm), axis=0)),
+                            axis            = r_bin_centers,
+                            frame_axis      = frame_axis_masked,
+                            kind            = 'r')
+
+    return COR
@@ -8,6 +8,11 @@ from datetime import datetime
 
 sys.path.append("analysis/utils/")
 import correlation_computations as compute
+import bootstrap
+import structure_factor
+import dynamic_correlations
+import msd
+import t1_events
 
 data_dir = "data/simulated/raw/"
 obj_dir  = "data/simulated/processed/"
@@ -41,8 +46,25 @@ class VMAutocorrelationObject:
         self.spatial  = {}
         self.t_array  = {}
         self.r_array  = {}
+        self.temporal_N   = {}
+        self.spatial_N    = {}
+        self.temporal_err = {}
+        self.spatial_err  = {}
+        self.temporal_blocks = {}
+        self.spatial_blocks  = {}
+        self.temporal_ci = {}
+        self.spatial_ci  = {}
+        self.temporal_ci_err = {}
+        self.spatial_ci_err  = {}
+        self.spectral = {}
+        self.q_array  = {}
+        self.dynamic  = {}
+        self.displacement = {}
+        self.rearrangements = {}
+        self.ensemble = {}
         self.log = {'t': {},
-                    'r': {}}
+                    'r': {},
+                    'q': {}}
 
         # Check if the state file exists and load it if it does
         if os.path.exists(f"{path_addition}{self.out_path}"):
@@ -69,6 +91,22 @@ class VMAutocorrelationObject:
         self.spatial  = state.get('spatial', {})
         self.t_array  = state.get('t_array', {})
         self.r_array  = state.get('r_array', {})
+        self.temporal_N   = state.get('temporal_N', {})
+        self.spatial_N    = state.get('spatial_N', {})
+        self.temporal_err = state.get('temporal_err', {})
+        self.spatial_err  = state.get('spatial_err', {})
+        self.temporal_blocks = state.get('temporal_blocks', {})
+        self.spatial_blocks  = state.get('spatial_blocks', {})
+        self.temporal_ci = state.get('temporal_ci', {})
+        self.spatial_ci  = state.get('spatial_ci', {})
+        self.temporal_ci_err = state.get('temporal_ci_err', {})
+        self.spatial_ci_err  = state.get('spatial_ci_err', {})
+        self.spectral = state.get('spectral', {})
+        self.q_array  = state.get('q_array', {})
+        self.dynamic  = state.get('dynamic', {})
+        self.displacement = state.get('displacement', {})
+        self.rearrangements = state.get('rearrangements', {})
+        self.ensemble = state.get('ensemble', {})
         self.log      = state.get('log', {})
 
         print(f"State loaded from {path_addition}{self.out_path}.")
@@ -102,6 +140,22 @@ class VMAutocorrelationObject:
             'spatial':  self.spatial,
             't_array':  self.t_array,
             'r_array':  self.r_array,
+            'temporal_N':   self.temporal_N,
+            'spatial_N':    self.spatial_N,
+            'temporal_err': self.temporal_err,
+            'spatial_err':  self.spatial_err,
+            'temporal_blocks': self.temporal_blocks,
+            'spatial_blocks':  self.spatial_blocks,
+            'temporal_ci': self.temporal_ci,
+            'spatial_ci':  self.spatial_ci,
+            'temporal_ci_err': self.temporal_ci_err,
+            'spatial_ci_err':  self.spatial_ci_err,
+            'spectral': self.spectral,
+            'q_array':  self.q_array,
+            'dynamic':  self.dynamic,
+            'displacement': self.displacement,
+            'rearrangements': self.rearrangements,
+            'ensemble': self.ensemble,
             'log':      self.log
         }
         
@@ -113,8 +167,11 @@ class VMAutocorrelationObject:
 
 
 
-    def compute_spatial(self, positions, variable, variable_name, dr, r_max, t_avrg=False, overwrite=False):
-        """ Computes spatial autocorrelation """
+    def compute_spatial(self, positions, variable, variable_name, dr, r_max, t_avrg=False, overwrite=False, Nmax=5000, error_target=None, seed=0, backend='numba'):
+        """ 
+        Computes spatial autocorrelation. With more than Nmax cells, or if error_target is given,
+        a seeded stratified sample of reference cells is used (see general_spatial_correlation).
+        """
 
         # Check if correlation exists
         if not overwrite:
@@ -124,16 +181,30 @@ class VMAutocorrelationObject:
 
         # Compute autocorrelation
         Cr = compute.general_spatial_correlation(positions[:,:,0], positions[:,:,1], variable,
-                                                 dr=dr, r_max=r_max, t_avrg=t_avrg)
+                                                 dr=dr, r_max=r_max, t_avrg=t_avrg,
+                                                 Nmax=Nmax, error_target=error_target, seed=seed, backend=backend)
+        print(f"{variable_name}: {np.mean(Cr['N_ref_points']):.0f} reference cells per frame on average")
+
+        # Number of pairs in each bin, summed over frames if time averaged
+        N_pairs = Cr['N_pairs_in_rbin']
+        if t_avrg:
+            N_pairs = np.ma.sum(N_pairs, axis=0)
 
         # Update object
-        self.spatial[variable_name]  = Cr['C_norm'].compressed()
-        self.r_array[variable_name]  = Cr['r_bin_centers'].compressed()
+        self.spatial[variable_name]   = Cr['C_norm'].compressed()
+        self.r_array[variable_name]   = Cr['r_bin_centers'].compressed()
+        self.spatial_N[variable_name] = np.ma.array(N_pairs, mask=np.ma.getmaskarray(Cr['C_norm'])).compressed()
+
+        # Keep per-frame correlations of bins that are kept, weighted equally as in the average over frames
+        if t_avrg:
+            kept_bins = ~np.ma.getmaskarray(Cr['C_norm'])
+            sums, counts = bootstrap.equal_weight_blocks(Cr['C_sum'][:, kept_bins], Cr['N_pairs_in_rbin'][:, kept_bins])
+            self.spatial_blocks[variable_name] = {'sums': sums, 'counts': counts}
         self.log['r'][variable_name] = datetime.today().strftime('%Y/%m/%d_%H:%M')
 
 
 
-    def compute_temporal(self, variable, variable_name, t_max, df=1, t_avrg=False, overwrite=False):
+    def compute_temporal(self, variable, variable_name, t_max, df=1, t_avrg=False, overwrite=False, backend='numba'):
         """ Computes temporal autocorrelation """
 
         # Check if correlation exists
@@ -143,9 +214,165 @@ class VMAutocorrelationObject:
                 return
 
         # Compute autocorrelation    
-        Ct = compute.general_temporal_correlation(variable, t_max=t_max, t_avrg=t_avrg)
+        Ct = compute.general_temporal_correlation(variable, t_max=t_max, t_avrg=t_avrg, backend=backend)
+
+        # Number of cell pairs at each time difference, summed over time origins if time averaged
+        N_pairs = Ct['N']
+        if t_avrg:
+            N_pairs = np.ma.sum(N_pairs, axis=0)
 
         # Update object
-        self.temporal[variable_name] = Ct['C_norm']
-        self.t_array[variable_name]  = np.arange(t_max) * df
+        self.temporal[variable_name]   = Ct['C_norm']
+        self.t_array[variable_name]    = np.arange(t_max) * df
+        self.temporal_N[variable_name] = np.ma.filled(N_pairs, 0)
+
+        # Keep per-origin correlations, weighted equally as in the average over time origins
+        if t_avrg:
+            sums, counts = bootstrap.equal_weight_blocks(Ct['C_sum'], Ct['N'])
+            self.temporal_blocks[variable_name] = {'sums': sums, 'counts': counts}
         self.log['t'][variable_name] = datetime.today().strftime('%Y/%m/%d_%H:%M')
+
+
+
+    def compute_spectral(self, positions, system_size, q_max, dq, heights=None, velocities=None, method='direct', Ngrid=64, overwrite=False):
+        """
+        Computes radially averaged structure factor 'SS', and height 'hh' and longitudinal/transverse velocity
+        'vv_L'/'vv_T' spectra, averaged over frames. See structure_factor.compute_spectra.
+        """
+
+        # Check if spectra exist
+        if not overwrite:
+            if 'SS' in self.spectral.keys():
+                print("Spectra already exist.")
+                return
+
+        spectra = structure_factor.compute_spectra(positions, system_size, q_max, dq, heights=heights, velocities=velocities,
+                                                   method=method, Ngrid=Ngrid)
+
+        # Update object
+        for key, (q_bin_centers, spectrum, Nq_in_bin) in spectra['radial'].items():
+            name = 'SS' if key == 'S' else key
+
+            self.spectral[name] = spectrum.compressed()
+            self.q_array[name]  = q_bin_centers.compressed()
+            self.log.setdefault('q', {})[name] = datetime.today().strftime('%Y/%m/%d_%H:%M')
+
+
+
+    def compute_dynamic(self, positions, q_norms, a, df=1, Nlags=50, origin_step=1, remove_drift=True, overwrite=False):
+        """
+        Computes self-intermediate scattering function 'Fs' (Nq, Nlags) and overlap 'Q' at log-spaced time differences 't',
+        with the overlap of every time origin 'Q_origin' and the relaxation times 'tau_Fs' and 'tau_Q'.
+        See dynamic_correlations.self_intermediate_scattering.
+        """
+
+        # Check if dynamic correlations exist
+        if not overwrite:
+            if 'Fs' in self.dynamic.keys():
+                print("Dynamic correlations already exist.")
+                return
+
+        result = dynamic_correlations.self_intermediate_scattering(positions, q_norms, Nlags=Nlags, origin_step=origin_step,
+                                                                   a=a, remove_drift=remove_drift)
+        t = result['lags'] * df
+
+        # Update object
+        self.dynamic = {'t':        t,
+                        'q':        result['q'],
+                        'a':        a,
+                        'Fs':       result['Fs'],
+                        'Q':        result['Q'],
+                        'Q_origin': result['Q_origin'],
+                        'tau_Fs':   np.array([dynamic_correlations.relaxation_time(t, Fs) for Fs in result['Fs']]),
+                        'tau_Q':    dynamic_correlations.relaxation_time(t, result['Q'])}
+
+        self.log.setdefault('d', {})['Fs'] = datetime.today().strftime('%Y/%m/%d_%H:%M')
+
+
+
+    def compute_displacements(self, positions, df=1, remove_drift=True, overwrite=False):
+        """
+        Computes mean squared displacement 'msd' and non-Gaussian parameter 'alpha2' at time differences 't',
+        and mean displacement between frames 'mean_dr'. See msd.compute_displacements.
+        """
+
+        # Check if displacements exist
+        if not overwrite:
+            if 'msd' in self.displacement.keys():
+                print("Displacements already exist.")
+                return
+
+        self.displacement = msd.compute_displacements(positions, df=df, remove_drift=remove_drift)
+        self.displacement['remove_drift'] = remove_drift
+
+        self.log.setdefault('m', {})['msd'] = datetime.today().strftime('%Y/%m/%d_%H:%M')
+
+
+
+    def compute_rearrangements(self, graph, positions, system_size, cell_properties={}, df=1, dr=1, r_max=10, window=0, nT1=None, overwrite=False):
+        """
+        Detects T1 transitions from changes of the neighbour graph between frames, and computes their rate 'rate'
+        (and mean 'mean_rate'), pair correlation of positions 'g' at distances 'r', and rates conditioned on
+        cell properties (e.g. {'h': heights, 'V': volumes}). See t1_events.
+
+        If the cumulative number of T1s of the simulation nT1 is given for every frame, it is kept in 'nT1'
+        to check for transitions missed between frames.
+        """
+
+        # Check if rearrangements exist
+        if not overwrite:
+            if 'events' in self.rearrangements.keys():
+                print("Rearrangements already exist.")
+                return
+
+        Nframes, Ncells = np.shape(positions)[:2]
+        events = t1_events.detect_t1(graph, positions=positions, system_size=system_size)
+
+        rate, mean_rate = t1_events.t1_rates(events, Nframes, Ncells, df=df)
+        r, g = t1_events.event_pair_correlation(events['position'], events['frame'], system_size, dr, r_max, window=window)
+
+        # Update object
+        self.rearrangements = {'events':    events,
+                               't':         np.arange(1, Nframes) * df,
+                               'rate':      rate,
+                               'mean_rate': mean_rate,
+                               'r':         r,
+                               'g':         g,
+                               'conditional': {name: t1_events.conditional_t1_rate(events, values, df=df)
+                                               for name, values in cell_properties.items()}}
+
+        if nT1 is not None:
+            self.rearrangements['nT1'] = np.diff(nT1)
+
+        print(f"{len(events['frame'])} T1 transitions, {np.mean(events['paired']):.0%} with a gained edge between common neighbours")
+        self.log.setdefault('T1', {})['events'] = datetime.today().strftime('%Y/%m/%d_%H:%M')
+
+
+
+    def compute_confidence_bands(self, method='bootstrap', Nresamples=1000, level=0.95, seed=0, Npool=1, block_length=None):
+        """
+        Computes confidence bands by resampling stored blocks of frames/time origins,
+        or of ensemble members for ensemble averages. Resampled standard errors are kept in
+        temporal_ci_err/spatial_ci_err, separate from the standard errors of ensemble averages.
+
+        Parameters:
+        - method: 'bootstrap' or 'jackknife'
+        - Nresamples: number of bootstrap resamples
+        - level: confidence level of band
+        - seed: seed of bootstrap resampling
+        - Npool: number of processes to spread resamples over
+        - block_length: number of consecutive frames/time origins resampled together. Default: 1 for
+          ensemble members, which are independent, else estimated from the autocorrelation time.
+        """
+
+        if block_length is None and self.ensemble.get('members'):
+            block_length = 1
+
+        for blocks, ci, err in [(self.temporal_blocks, self.temporal_ci, self.temporal_ci_err),
+                                (self.spatial_blocks,  self.spatial_ci,  self.spatial_ci_err)]:
+
+            for key, block in blocks.items():
+                ci[key], err[key] = bootstrap.confidence_band(block['sums'], block['counts'],
+                                                              method=method, Nresamples=Nresamples,
+                                                              level=level, seed=seed, Npool=Npool,
+                                                              block_length=block_length)
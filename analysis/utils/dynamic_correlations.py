@@ -0,0 +1,250 @@
+import numpy as np
+
+from numba import njit, prange
+
+
+def log_spaced_lags(Nframes, Nlags, lag_min=1):
+    """ Unique, logarithmically spaced time differences (in frames) between lag_min and Nframes-1 """
+
+    lags = np.geomspace(lag_min, Nframes - 1, Nlags)
+
+    return np.unique(np.round(lags).astype(int))
+
+
+
+def wave_vector_directions(q_norms, Ndir=8):
+    """
+    Wave vectors with norms q_norms in Ndir directions over half a circle, for isotropic averages.
+    Returns qx, qy of shape (Nq, Ndir).
+    """
+
+    angles = np.pi * np.arange(Ndir) / Ndir
+    q_norms = np.atleast_1d(np.asarray(q_norms, dtype=float))
+
+    return q_norms[:, None] * np.cos(angles)[None, :], q_norms[:, None] * np.sin(angles)[None, :]
+
+
+
+@njit(parallel=True)
+def self_displacement_kernel(positions, lags, origins, qx, qy, a, remove_drift):
+    """
+    Self-intermediate scattering function and overlap of every (lag, time origin) pair.
+
+    Parameters:
+    - positions: unwrapped positions, shape (Nframes, Ncells, 2)
+    - lags: time differences in frames
+    - origins: time origins in frames
+    - qx, qy: wave vectors, shape (Nq, Ndir). F_s is averaged over the Ndir directions.
+    - a: overlap cutoff, cells moving less than a overlap
+    - remove_drift: subtract centre-of-mass displacement
+
+    Returns:
+    - Fs: shape (Nq, Nlags, Norigins)
+    - Q: fraction of overlapping cells, shape (Nlags, Norigins)
+    - valid: whether t0 + lag is within trajectory, shape (Nlags, Norigins)
+    """
+
+    Nframes, Ncells, _ = positions.shape
+    Nq, Ndir = qx.shape
+    Nlags, Norigins = len(lags), len(origins)
+
+    Fs    = np.zeros((Nq, Nlags, Norigins))
+    Q     = np.zeros((Nlags, Norigins))
+    valid = np.zeros((Nlags, Norigins), dtype=np.bool_)
+
+    for l in prange(Nlags):
+        for o in range(Norigins):
+            t0 = origins[o]
+            t1 = t0 + lags[l]
+            if t1 >= Nframes:
+                continue
+            valid[l, o] = True
+
+            # centre-of-mass displacement
+            dx_cm, dy_cm = 0., 0.
+            if remove_drift:
+                for i in range(Ncells):
+                    dx_cm += positions[t1, i, 0] - positions[t0, i, 0]
+                    dy_cm += positions[t1, i, 1] - positions[t0, i, 1]
+                dx_cm /= Ncells
+                dy_cm /= Ncells
+
+            overlap = 0.
+            for i in range(Ncells):
+                dx = positions[t1, i, 0] - positions[t0, i, 0] - dx_cm
+                dy = positions[t1, i, 1] - positions[t0, i, 1] - dy_cm
+
+                if dx*dx + dy*dy < a*a:
+                    overlap += 1
+
+                for iq in range(Nq):
+                    for idir in range(Ndir):
+                        Fs[iq, l, o] += np.cos(qx[iq, idir] * dx + qy[iq, idir] * dy)
+
+            Q[l, o] = overlap / Ncells
+            for iq in range(Nq):
+                Fs[iq, l, o] /= Ncells * Ndir
+
+    return Fs, Q, valid
+
+
+
+def self_intermediate_scattering(positions, q_norms, lags=None, Nlags=50, origin_step=1, a=0.3, Ndir=8, remove_drift=True):
+    """
+    Computes self-intermediate scattering function F_s(q,t) and overlap function Q(t) averaged over time origins.
+
+    Parameters:
+    - positions: unwrapped cell positions, shape (Nframes, Ncells, 2), e.g. from vm_output.get_cell_positions
+    - q_norms: wave vector norms
+    - lags: time differences in frames. Nlags log-spaced lags if None.
+    - origin_step: number of frames between time origins
+    - a: overlap cutoff length
+    - Ndir: number of wave vector directions for isotropic average
+    - remove_drift: subtract centre-of-mass displacement
+
+    Returns:
+    - dictionary with 'lags', 'q', 'Fs' (Nq, Nlags), 'Q' (Nlags),
+      and per time origin 'Fs_origin', 'Q_origin' as masked arrays
+    """
+
+    positions = np.ascontiguousarray(np.ma.getdata(positions), dtype=float)
+    Nframes   = positions.shape[0]
+
+    if lags is None:
+        lags = log_spaced_lags(Nframes, Nlags)
+    lags    = np.asarray(lags, dtype=np.int64)
+    origins = np.arange(0, Nframes, origin_step, dtype=np.int64)
+
+    qx, qy = wave_vector_directions(q_norms, Ndir)
+    Fs, Q, valid = self_displacement_kernel(positions, lags, origins, qx, qy, float(a), remove_drift)
+
+    Fs_origin = np.ma.array(Fs, mask=np.broadcast_to(~valid, Fs.shape))
+    Q_origin  = np.ma.array(Q,  mask=~valid)
+
+    return {'lags':      lags,
+            'q':         np.atleast_1d(q_norms),
+            'Fs':        np.ma.mean(Fs_origin, axis=-1),
+            'Q':         np.ma.mean(Q_origin,  axis=-1),
+            'Fs_origin': Fs_origin,
+            'Q_origin':  Q_origin}
+
+
+
+def relaxation_time(lags, correlation, threshold=np.exp(-1)):
+    """
+    First time the correlation decays below threshold, interpolated linearly in log(time).
+    Returns nan if the correlation never decays below threshold.
+    """
+
+    correlation = np.ma.filled(correlation, np.nan)
+    below = np.where(correlation < threshold)[0]
+
+    if len(below) == 0:
+        return np.nan
+
+    i = below[0]
+    if i == 0:
+        return lags[0]
+
+    # interpolate between last point above and first point below threshold
+    t0, t1 = np.log(lags[i-1]), np.log(lags[i])
+    c0, c1 = correlation[i-1], correlation[i]
+
+    return np.exp(t0 + (threshold - c0) * (t1 - t0) / (c1 - c0))
+
+
+
+@njit(parallel=True)
+def overlap_moments_kernel(positions, lags, origin_step, a, remove_drift):
+    """
+    Sums over time origins of the overlap Q and Q^2 at each lag, without storing overlaps of every origin.
+
+    Returns:
+    - sum_Q, sum_Q2: shape (Nlags,)
+    - Norigins: number of time origins at each lag
+    """
+
+    Nframes, Ncells, _ = positions.shape
+    Nlags = len(lags)
+
+    sum_Q    = np.zeros(Nlags)
+    sum_Q2   = np.zeros(Nlags)
+    Norigins = np.zeros(Nlags, dtype=np.int64)
+
+    for l in prange(Nlags):
+        for t0 in range(0, Nframes - lags[l], origin_step):
+            t1 = t0 + lags[l]
+
+            # centre-of-mass displacement
+            dx_cm, dy_cm = 0., 0.
+            if remove_drift:
+                for i in range(Ncells):
+                    dx_cm += positions[t1, i, 0] - positions[t0, i, 0]
+                    dy_cm += positions[t1, i, 1] - positions[t0, i, 1]
+                dx_cm /= Ncells
+                dy_cm /= Ncells
+
+            overlap = 0.
+            for i in range(Ncells):
+                dx = positions[t1, i, 0] - positions[t0, i, 0] - dx_cm
+                dy = positions[t1, i, 1] - positions[t0, i, 1] - dy_cm
+                if dx*dx + dy*dy < a*a:
+                    overlap += 1
+            overlap /= Ncells
+
+            sum_Q[l]    += overlap
+            sum_Q2[l]   += overlap * overlap
+            Norigins[l] += 1
+
+    return sum_Q, sum_Q2, Norigins
+
+
+
+def overlap_moments(positions, lags, a, origin_step=1, remove_drift=True):
+    """
+    Sums of overlap Q and Q^2 over time origins of one trajectory, to be accumulated over ensemble members.
+
+    Returns:
+    - dictionary with 'lags', 'sum_Q', 'sum_Q2', 'Norigins' and 'Ncells'
+    """
+
+    positions = np.ascontiguousarray(np.ma.getdata(positions), dtype=float)
+    lags = np.asarray(lags, dtype=np.int64)
+
+    sum_Q, sum_Q2, Norigins = overlap_moments_kernel(positions, lags, origin_step, float(a), remove_drift)
+
+    return {'lags': lags, 'sum_Q': sum_Q, 'sum_Q2': sum_Q2, 'Norigins': Norigins, 'Ncells': positions.shape[1]}
+
+
+
+def merge_overlap_moments(moments1, moments2):
+    """ Adds overlap sums of two trajectories or ensembles with the same lags and number of cells """
+
+    if moments1 is None:
+        return moments2
+
+    assert np.array_equal(moments1['lags'], moments2['lags']), "Overlap moments must be computed at the same lags"
+    assert moments1['Ncells'] == moments2['Ncells'], "Overlap moments must be computed with the same number of cells"
+
+    return {'lags':     moments1['lags'],
+            'sum_Q':    moments1['sum_Q']    + moments2['sum_Q'],
+            'sum_Q2':   moments1['sum_Q2']   + moments2['sum_Q2'],
+            'Norigins': moments1['Norigins'] + moments2['Norigins'],
+            'Ncells':   moments1['Ncells']}
+
+
+
+def four_point_susceptibility(moments):
+    """
+    Dynamic susceptibility chi4(t) = N (<Q(t)^2> - <Q(t)>^2), with averages over time origins and ensemble members.
+
+    Returns:
+    - mean overlap Q, chi4, both masked at lags without time origins
+    """
+
+    Norigins = np.ma.masked_equal(moments['Norigins'], 0)
+
+    mean_Q  = moments['sum_Q']  / Norigins
+    mean_Q2 = moments['sum_Q2'] / Norigins
+
+    return mean_Q, moments['Ncells'] * (mean_Q2 - mean_Q**2)
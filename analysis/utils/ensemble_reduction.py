@@ -0,0 +1,135 @@
+import numpy as np
+
+
+def empty_accumulator():
+    """ Returns empty accumulator of weighted sums for one correlation """
+
+    return {'axis': np.array([]),   # r or t values of bins
+            'W':    np.array([]),   # sum of weights (number of pairs)
+            'S':    np.array([]),   # weighted sum of correlation
+            'Q':    np.array([]),   # weighted sum of squared correlation
+            'W2':   np.array([]),   # sum of squared weights
+            'M':    np.array([])}   # number of members contributing to bin
+
+
+
+def _expand_accumulator(acc, axis):
+    """ Expands accumulator to union of its own and new bin values """
+
+    union = np.union1d(acc['axis'], axis)
+    if len(union) == len(acc['axis']):
+        return acc
+
+    inds = np.searchsorted(union, acc['axis'])
+    expanded = {'axis': union}
+    for key in ['W', 'S', 'Q', 'W2', 'M']:
+        expanded[key] = np.zeros(len(union))
+        expanded[key][inds] = acc[key]
+
+    return expanded
+
+
+
+def add_member(acc, axis, correlation, counts):
+    """
+    Adds correlation of one ensemble member to accumulator.
+
+    Parameters:
+    - acc: accumulator, as returned by empty_accumulator()
+    - axis: r or t values of bins
+    - correlation: correlation of member in each bin
+    - counts: number of pairs used for correlation in each bin. Used as weights.
+    """
+
+    axis        = np.ma.filled(np.ma.asarray(axis, dtype=float), np.nan)
+    correlation = np.ma.filled(np.ma.asarray(correlation, dtype=float), np.nan)
+    counts      = np.ma.filled(np.ma.asarray(counts, dtype=float), 0)
+
+    assert len(axis) == len(correlation) == len(counts), "axis, correlation and counts must have same length"
+
+    # masked bins do not contribute
+    valid = np.isfinite(axis) * np.isfinite(correlation) * (counts > 0)
+    axis, correlation, counts = axis[valid], correlation[valid], counts[valid]
+
+    acc  = _expand_accumulator(acc, axis)
+    inds = np.searchsorted(acc['axis'], axis)
+
+    acc['W'][inds]  += counts
+    acc['S'][inds]  += counts * correlation
+    acc['Q'][inds]  += counts * correlation**2
+    acc['W2'][inds] += counts**2
+    acc['M'][inds]  += 1
+
+    return acc
+
+
+
+def merge_accumulators(acc1, acc2):
+    """ Merges two accumulators, e.g. from separate batches of members """
+
+    acc = _expand_accumulator(acc1, acc2['axis'])
+    inds = np.searchsorted(acc['axis'], acc2['axis'])
+
+    for key in ['W', 'S', 'Q', 'W2', 'M']:
+        acc[key][inds] += acc2[key]
+
+    return acc
+
+
+
+def reduce_accumulator(acc):
+    """
+    Computes pair-weighted ensemble mean and standard error from accumulator.
+
+    Returns:
+    - axis: r or t values of bins
+    - mean: weighted mean of correlation
+    - err: standard error of weighted mean. Masked where less than two members contribute.
+    - counts: total number of pairs in bin
+    """
+
+    W, M = acc['W'], acc['M']
+    empty = W == 0
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = acc['S'] / W
+        var  = np.maximum(acc['Q'] / W - mean**2, 0)
+
+        # effective number of members of weighted mean, with Bessel correction
+        n_eff = W**2 / acc['W2']
+        err   = np.sqrt(var / n_eff * M / (M - 1))
+
+    mean = np.ma.array(mean, mask=empty)
+    err  = np.ma.array(err,  mask=empty + (M < 2))
+
+    return acc['axis'], mean, err, W
+
+
+
+def member_blocks(axis, members):
+    """
+    Aligns partial sums of ensemble members on common bins, for resampling over members.
+
+    Parameters:
+    - axis: common r or t values of bins
+    - members: list of (axis, correlation, counts) of each member
+
+    Returns:
+    - sums, counts: arrays of shape (Nmembers, Nbins)
+    """
+
+    sums   = np.zeros([len(members), len(axis)])
+    counts = np.zeros([len(members), len(axis)])
+
+    for m, (member_axis, correlation, member_counts) in enumerate(members):
+        member_axis   = np.ma.filled(np.ma.asarray(member_axis, dtype=float), np.nan)
+        correlation   = np.ma.filled(np.ma.asarray(correlation, dtype=float), np.nan)
+        member_counts = np.ma.filled(np.ma.asarray(member_counts, dtype=float), 0)
+
+        valid = np.isin(member_axis, axis) * np.isfinite(correlation) * (member_counts > 0)
+        inds  = np.searchsorted(axis, member_axis[valid])
+
+        sums[m, inds]   = member_counts[valid] * correlation[valid]
+        counts[m, inds] = member_counts[valid]
+
+    return sums, counts
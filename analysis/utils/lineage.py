@@ -0,0 +1,148 @@
+import pickle
+import numpy as np
+
+from operator import itemgetter
+
+
+def load_lineage(path):
+    """
+    Loads division events (time, mother, daughter) saved with vm_functions.save_lineage,
+    or appended in chunks with vm_functions.append_lineage
+    """
+
+    chunks = []
+    with open(path, "rb") as dump:
+        while True:
+            try:
+                chunks.append(pickle.load(dump))
+            except EOFError:
+                break
+
+    if len(chunks) == 0:
+        return {'time': np.zeros(0), 'mother': np.zeros(0, dtype=int), 'daughter': np.zeros(0, dtype=int)}
+
+    return {key: np.concatenate([chunk[key] for chunk in chunks]) for key in ['time', 'mother', 'daughter']}
+
+
+
+def cell_tracks(list_vm, lineage=None):
+    """
+    Assigns cells of all frames to tracks. A track is one cell between its birth and its division (or the end).
+    At a division, the track of the mother ends and two daughter tracks start, with the mother track as parent.
+    Tracks are identified by centre index and number of divisions involving that index, so reused indices
+    start new tracks.
+
+    Parameters:
+    - list_vm: frames
+    - lineage: division events from load_lineage. No divisions if None.
+
+    Returns dictionary of arrays:
+    - offsets: entries of track n are entries offsets[n]:offsets[n+1], shape (Ntracks+1,)
+    - frame, vertex: frame and centre index of every entry, in track order
+    - order: entry order of values listed frame by frame (see track_values)
+    - birth, death: first frame and last frame + 1 of every track
+    - parent: track of mother, -1 for cells present initially
+    - vertex_track: centre index of every track
+    """
+
+    Nframes = len(list_vm)
+    times   = np.array([vm.time for vm in list_vm])
+
+    # Centre indices of every frame, listed frame by frame
+    centres = [np.asarray(vm.getVertexIndicesByType("centre"), dtype=np.int64) for vm in list_vm]
+    frames  = np.repeat(np.arange(Nframes), [len(c) for c in centres])
+    vertex  = np.concatenate(centres)
+
+    # Division events, assigned to the first frame at or after division
+    if lineage is None or len(lineage['time']) == 0:
+        event_frame, mother, daughter = np.zeros((3, 0), dtype=np.int64)
+    else:
+        event_frame = np.searchsorted(times, np.asarray(lineage['time']), side='left')
+        mother      = np.asarray(lineage['mother'], dtype=np.int64)
+        daughter    = np.asarray(lineage['daughter'], dtype=np.int64)
+
+    # Number of events involving each centre index up to each frame
+    stride     = np.int64(Nframes + 1)
+    event_keys = np.sort(np.concatenate([mother * stride + event_frame, daughter * stride + event_frame]))
+
+    def epoch(centre, frame, side='right'):
+        return np.searchsorted(event_keys, centre * stride + frame, side=side) - np.searchsorted(event_keys, centre * stride, side='left')
+
+    # Tracks are unique (vertex, epoch)
+    Nepochs = np.int64(len(event_keys) + 1)
+    unique_keys, entry_track = np.unique(vertex * Nepochs + epoch(vertex, frames), return_inverse=True)
+
+    def find_track(centre, centre_epoch):
+        keys = centre * Nepochs + centre_epoch
+        track = np.clip(np.searchsorted(unique_keys, keys), 0, len(unique_keys) - 1)
+        return np.where(unique_keys[track] == keys, track, -1)
+
+    order   = np.lexsort((frames, entry_track))
+    counts  = np.bincount(entry_track, minlength=len(unique_keys))
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+
+    birth = frames[order][offsets[:-1]]
+    death = frames[order][offsets[1:] - 1] + 1
+    vertex_track = unique_keys // Nepochs
+
+    # Parent of both daughter tracks is the track of the mother before division
+    parent = np.full(len(unique_keys), -1)
+    mother_track = find_track(mother, epoch(mother, event_frame, side='left'))
+    for centre in [mother, daughter]:
+        centre_track = find_track(centre, epoch(centre, event_frame))
+        exists = (centre_track >= 0) * (mother_track >= 0)
+        parent[centre_track[exists]] = mother_track[exists]
+
+    return {'offsets':      offsets,
+            'frame':        frames[order],
+            'vertex':       vertex[order],
+            'order':        order,
+            'birth':        birth,
+            'death':        death,
+            'parent':       parent,
+            'vertex_track': vertex_track}
+
+
+
+def track_values(tracks, frame_values):
+    """
+    Reorders values listed frame by frame (as concatenated per-frame arrays) into track order.
+    Values of track n are then values[tracks['offsets'][n]:tracks['offsets'][n+1]].
+    """
+
+    return np.concatenate(frame_values)[tracks['order']]
+
+
+
+def get_track_property(list_vm, tracks, frame_property):
+    """ Gets property frame_property(vm, centres) of all cells of all frames, in track order """
+
+    return track_values(tracks, [np.asarray(frame_property(vm, vm.getVertexIndicesByType("centre"))) for vm in list_vm])
+
+
+
+def get_track_positions(list_vm, tracks):
+    """ Get unwrapped cell positions in track order """
+
+    return get_track_property(list_vm, tracks, lambda vm, centres: np.reshape(itemgetter(*centres)(vm.getPositions(wrapped=False)), (-1, 2)))
+
+
+
+def get_track_heights(list_vm, tracks):
+    """ Get cell heights in track order """
+
+    return get_track_property(list_vm, tracks, lambda vm, centres: np.ravel(itemgetter(*centres)(vm.vertexForces["surface"].height)))
+
+
+
+def get_track_volumes(list_vm, tracks):
+    """ Get cell volumes in track order """
+
+    return get_track_property(list_vm, tracks, lambda vm, centres: np.ravel(itemgetter(*centres)(vm.vertexForces["surface"].volume)))
+
+
+
+def tracks_alive(tracks, frame):
+    """ Indices of tracks alive at frame """
+
+    return np.where((tracks['birth'] <= frame) * (tracks['death'] > frame))[0]
@@ -0,0 +1,118 @@
+import numpy as np
+
+
+def correlate(a, b):
+    """
+    Correlation c[m] = sum_t a[t+m] * b[t] over all time origins t, along the first axis, using FFT.
+    Arrays are zero-padded to avoid circular wrapping.
+    """
+
+    Nframes = a.shape[0]
+    n = 2 * Nframes
+
+    fa = np.fft.rfft(a, n=n, axis=0)
+    fb = np.fft.rfft(b, n=n, axis=0)
+
+    return np.fft.irfft(fa * np.conj(fb), n=n, axis=0)[:Nframes]
+
+
+
+def origin_sums(values):
+    """
+    Sum over time origins t of values[t+m] + values[t], for every lag m, in O(T).
+    """
+
+    Nframes = values.shape[0]
+    sums = np.zeros_like(values)
+
+    total = 2 * np.sum(values, axis=0)
+    for m in range(Nframes):
+        if m > 0:
+            total = total - values[m-1] - values[Nframes-m]
+        sums[m] = total
+
+    return sums
+
+
+
+def mean_squared_displacement(positions, remove_drift=True):
+    """
+    Computes mean squared and mean quartic displacements over all time origins, with the FFT algorithm, in O(T log T) per cell.
+    Uses |a - b|^2 = a^2 + b^2 - 2 a.b and its square, where a = r(t+m) and b = r(t).
+
+    Parameters:
+    - positions: unwrapped positions, shape (Nframes, Ncells, 2)
+    - remove_drift: subtract centre-of-mass displacement
+
+    Returns:
+    - msd: mean squared displacement at lags 0, ..., Nframes-1 (in frames)
+    - m4: mean quartic displacement at the same lags
+    """
+
+    positions = np.ma.getdata(positions).astype(float)
+    Nframes, Ncells, _ = positions.shape
+
+    if remove_drift:
+        positions = positions - np.mean(positions, axis=1, keepdims=True)
+
+    # Displacements are invariant under constant shifts. Centring each cell limits round-off in quartic terms.
+    r  = positions - np.mean(positions, axis=0, keepdims=True)
+    r2 = np.sum(r**2, axis=-1)
+
+    # a^2 + b^2 - 2 a.b
+    a_dot_b = correlate(r[..., 0], r[..., 0]) + correlate(r[..., 1], r[..., 1])
+    sum_r2  = origin_sums(r2) - 2 * a_dot_b
+
+    # a^4 + b^4 + 4 (a.b)^2 + 2 a^2 b^2 - 4 a^2 (a.b) - 4 b^2 (a.b)
+    a_dot_b_2 = (correlate(r[..., 0]**2, r[..., 0]**2)
+                 + correlate(r[..., 1]**2, r[..., 1]**2)
+                 + 2 * correlate(r[..., 0] * r[..., 1], r[..., 0] * r[..., 1]))
+    a2_b2     = correlate(r2, r2)
+    a2_a_dot_b = correlate(r2 * r[..., 0], r[..., 0]) + correlate(r2 * r[..., 1], r[..., 1])
+    b2_a_dot_b = correlate(r[..., 0], r2 * r[..., 0]) + correlate(r[..., 1], r2 * r[..., 1])
+    sum_r4 = origin_sums(r2**2) + 4 * a_dot_b_2 + 2 * a2_b2 - 4 * a2_a_dot_b - 4 * b2_a_dot_b
+
+    # Average over time origins and cells
+    Norigins = (Nframes - np.arange(Nframes))[:, None]
+    msd = np.mean(sum_r2 / Norigins, axis=1)
+    m4  = np.mean(sum_r4 / Norigins, axis=1)
+
+    # Round-off can make the zero lag slightly nonzero
+    msd[0], m4[0] = 0, 0
+
+    return msd, m4
+
+
+
+def non_gaussian_parameter(msd, m4, dim=2):
+    """ Non-Gaussian parameter alpha_2 = d <dr^4> / ((d+2) <dr^2>^2) - 1, masked at zero displacement """
+
+    msd = np.ma.masked_equal(msd, 0)
+
+    return dim * m4 / ((dim + 2) * msd**2) - 1
+
+
+
+def compute_displacements(positions, df=1, remove_drift=True):
+    """
+    Computes mean squared displacement and non-Gaussian parameter of a trajectory, and the mean displacement between frames.
+
+    Parameters:
+    - positions: unwrapped positions, shape (Nframes, Ncells, 2), e.g. from vm_output.get_cell_positions
+    - df: time between frames
+    - remove_drift: subtract centre-of-mass displacement
+
+    Returns:
+    - dictionary with time differences 't', 'msd', 'alpha2' and 'mean_dr'
+    """
+
+    msd, m4 = mean_squared_displacement(positions, remove_drift=remove_drift)
+
+    # Mean displacement between consecutive frames, as time scale for plots
+    positions = np.ma.getdata(positions)
+    mean_dr = np.mean(np.linalg.norm(np.diff(positions, axis=0), axis=-1))
+
+    return {'t':       np.arange(len(msd)) * df,
+            'msd':     msd,
+            'alpha2':  non_gaussian_parameter(msd, m4),
+            'mean_dr': mean_dr}
@@ -0,0 +1,168 @@
+import numpy as np
+import scipy.sparse as sparse
+import scipy.sparse.csgraph as csgraph
+
+
+def cell_index_map(cells):
+    """ Array mapping vertex indices of cell centres to cell indices 0, ..., Ncells-1 (and -1 for other vertices) """
+
+    index_map = np.full(max(cells) + 1, -1, dtype=int)
+    index_map[list(cells)] = np.arange(len(cells))
+
+    return index_map
+
+
+
+def frame_edges(vm, cells, index_map):
+    """
+    Edges (i, j) with i < j between neighbouring cells of one frame, in the order of cells.
+    Neighbours that are not in cells, e.g. daughters of later divisions, are left out.
+    """
+
+    neighbours = [vm.getNeighbouringCellIndices(cell) for cell in cells]
+    degree     = np.array([len(cell_neighbours) for cell_neighbours in neighbours])
+
+    rows = np.repeat(np.arange(len(cells)), degree)
+
+    # vertices beyond the map were created after the frame of cells
+    neighbour_indices = np.concatenate(neighbours).astype(int) if np.sum(degree) > 0 else np.zeros(0, dtype=int)
+    in_map = neighbour_indices < len(index_map)
+    cols   = np.full(len(neighbour_indices), -1, dtype=int)
+    cols[in_map] = index_map[neighbour_indices[in_map]]
+
+    # keep each edge once, and only edges between cells
+    keep = (cols >= 0) * (rows < cols)
+
+    return np.stack([rows[keep], cols[keep]], axis=-1)
+
+
+
+def neighbour_edges(list_vm):
+    """
+    Neighbour graphs of all frames as one edge list with frame offsets, with cells in the order of the first frame.
+    Edges of frame f are edges[offsets[f]:offsets[f+1]], with each pair of neighbours stored once.
+
+    Returns:
+    - dictionary with 'edges' (Nedges, 2), 'offsets' (Nframes+1,) and 'Ncells'
+    """
+
+    # indices of cell centres (from first frame)
+    cells = list_vm[0].getVertexIndicesByType("centre")
+    index_map = cell_index_map(cells)
+
+    edges   = [frame_edges(vm, cells, index_map) for vm in list_vm]
+    offsets = np.concatenate([[0], np.cumsum([len(frame) for frame in edges])])
+
+    return {'edges':   np.concatenate(edges).astype(np.int32),
+            'offsets': offsets,
+            'Ncells':  len(cells)}
+
+
+
+def frame_adjacency(graph, frame):
+    """ Symmetric sparse (CSR) adjacency matrix of one frame of a neighbour graph """
+
+    edges  = graph['edges'][graph['offsets'][frame]:graph['offsets'][frame+1]]
+    Ncells = graph['Ncells']
+
+    rows = np.concatenate([edges[:, 0], edges[:, 1]])
+    cols = np.concatenate([edges[:, 1], edges[:, 0]])
+    data = np.ones(len(rows), dtype=np.int8)
+
+    return sparse.csr_matrix((data, (rows, cols)), shape=(Ncells, Ncells))
+
+
+
+def adjacency_matrices(list_vm):
+    """ Sparse adjacency matrix of every frame, with cells in the order of the first frame """
+
+    graph = neighbour_edges(list_vm)
+
+    return [frame_adjacency(graph, frame) for frame in range(len(graph['offsets']) - 1)]
+
+
+
+def neighbour_counts(graph):
+    """ Number of neighbours of every cell in every frame, shape (Nframes, Ncells) """
+
+    Nframes = len(graph['offsets']) - 1
+    frames  = np.repeat(np.arange(Nframes), np.diff(graph['offsets']))
+
+    counts = np.zeros((Nframes, graph['Ncells']), dtype=int)
+    np.add.at(counts, (frames, graph['edges'][:, 0]), 1)
+    np.add.at(counts, (frames, graph['edges'][:, 1]), 1)
+
+    return counts
+
+
+
+def topological_distances(graph, frame, sources=None, max_distance=None):
+    """
+    Number of neighbour steps between cells in one frame, from breadth-first search.
+
+    Parameters:
+    - graph: neighbour graph from neighbour_edges
+    - frame: frame index
+    - sources: cells to compute distances from. All cells if None.
+    - max_distance: distances above max_distance are not searched, and masked
+
+    Returns:
+    - distances: shape (Nsources, Ncells), masked where cells are not connected within max_distance
+    """
+
+    adjacency = frame_adjacency(graph, frame)
+    limit = np.inf if max_distance is None else max_distance
+
+    distances = np.atleast_2d(csgraph.dijkstra(adjacency, unweighted=True, indices=sources, limit=limit))
+    not_connected = np.isinf(distances)
+
+    return np.ma.array(np.where(not_connected, -1, distances).astype(int), mask=not_connected)
+
+
+
+def neighbour_retention(adjacency, lags=None, origin_step=1):
+    """
+    Fraction of neighbours at a time origin that are still neighbours a lag later, averaged over cells and time origins.
+    All time origins of one lag are treated at once, with a single elementwise product of frames stacked as rows.
+
+    Parameters:
+    - adjacency: list of sparse adjacency matrices, one per frame
+    - lags: time differences in frames. All time differences if None.
+    - origin_step: number of frames between time origins
+
+    Returns:
+    - lags
+    - sum over time origins of the fraction of kept neighbours, averaged over cells
+    - number of time origins of each lag
+    """
+
+    Nframes = len(adjacency)
+    Ncells  = adjacency[0].shape[0]
+
+    if lags is None:
+        lags = np.arange(Nframes)
+    lags = np.asarray(lags, dtype=int)
+
+    stacked = sparse.vstack(adjacency, format='csr')
+    degree  = np.asarray(stacked.sum(axis=1)).reshape(Nframes, Ncells).astype(float)
+
+    retention_sum = np.zeros(len(lags))
+    Norigins      = np.zeros(len(lags), dtype=int)
+
+    for l, lag in enumerate(lags):
+        origins = np.arange(0, Nframes - lag, origin_step)
+        if len(origins) == 0:
+            continue
+
+        # rows of all cells at all time origins, and a lag later
+        rows  = (origins[:, None] * Ncells + np.arange(Ncells)[None, :]).ravel()
+        kept  = stacked[rows].multiply(stacked[rows + lag * Ncells])
+        kept  = np.asarray(kept.sum(axis=1)).reshape(len(origins), Ncells)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fraction = np.ma.masked_invalid(kept / degree[origins])
+
+        retention_sum[l] = np.sum(np.ma.mean(fraction, axis=1))
+        Norigins[l]      = len(origins)
+
+    return lags, retention_sum, Norigins
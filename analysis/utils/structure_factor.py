@@ -0,0 +1,204 @@
+import numpy as np
+
+
+def wave_vectors(system_size, q_max, q_min=0):
+    """
+    Wave vectors q = 2 pi (nx / Lx, ny / Ly) allowed by the periodic box, with q_min < |q| <= q_max.
+    Only one of q and -q is kept, since spectra of real fields are symmetric.
+
+    Parameters:
+    - system_size: box size (Lx, Ly)
+    - q_max, q_min: range of wave vector norms
+    """
+
+    Lx, Ly = system_size
+    nx_max = int(q_max * Lx / (2 * np.pi))
+    ny_max = int(q_max * Ly / (2 * np.pi))
+
+    nx, ny = np.meshgrid(np.arange(0, nx_max + 1), np.arange(-ny_max, ny_max + 1), indexing='ij')
+    nx, ny = nx.ravel(), ny.ravel()
+
+    # keep half plane
+    half = (nx > 0) + ((nx == 0) * (ny > 0))
+    q = 2 * np.pi * np.array([nx[half] / Lx, ny[half] / Ly]).T
+
+    q_norm = np.linalg.norm(q, axis=1)
+    in_range = (q_norm > q_min) * (q_norm <= q_max)
+
+    return q[in_range]
+
+
+
+def fourier_transform(positions, values, q, chunk_size=2048):
+    """
+    Direct Fourier transform sum_j values_j exp(-i q . r_j) of every frame, in O(N Nq) per frame.
+
+    Parameters:
+    - positions: positions of points, shape (Nframes, Npoints, 2)
+    - values: values carried by points, shape (Nframes, Npoints, Ncomp). Use ones for the density.
+    - q: wave vectors, shape (Nq, 2)
+    - chunk_size: number of wave vectors treated at once, to bound memory
+
+    Returns:
+    - transform: shape (Nframes, Nq, Ncomp)
+    """
+
+    Nframes = positions.shape[0]
+    transform = np.zeros((Nframes, len(q), values.shape[-1]), dtype=complex)
+
+    for f in range(Nframes):
+        for start in range(0, len(q), chunk_size):
+            q_chunk = q[start:start + chunk_size]
+            phase = np.exp(-1j * positions[f] @ q_chunk.T)          # (Npoints, Nq)
+            transform[f, start:start + chunk_size] = phase.T @ values[f]
+
+    return transform
+
+
+
+def deposit_on_grid(positions, values, system_size, Ngrid):
+    """
+    Periodic cloud-in-cell deposition of values on a Ngrid x Ngrid grid.
+
+    Returns:
+    - grid: shape (Nframes, Ngrid, Ngrid, Ncomp)
+    """
+
+    Nframes, Npoints, Ncomp = values.shape
+    grid = np.zeros((Nframes, Ngrid, Ngrid, Ncomp))
+
+    # position in grid units, and weights of the 4 closest grid points
+    s  = (positions / np.asarray(system_size)) * Ngrid
+    i0 = np.floor(s).astype(int)
+    w1 = s - i0
+    w0 = 1 - w1
+
+    frames = np.repeat(np.arange(Nframes), Npoints)
+    for dx, wx in [(0, w0[..., 0]), (1, w1[..., 0])]:
+        for dy, wy in [(0, w0[..., 1]), (1, w1[..., 1])]:
+            ix = ((i0[..., 0] + dx) % Ngrid).ravel()
+            iy = ((i0[..., 1] + dy) % Ngrid).ravel()
+            np.add.at(grid, (frames, ix, iy), (wx * wy)[..., None].reshape(-1, 1) * values.reshape(-1, Ncomp))
+
+    return grid
+
+
+
+def gridded_fourier_transform(positions, values, system_size, Ngrid, q_max):
+    """
+    Fourier transform from FFT of cloud-in-cell deposited values, corrected for the deposition window.
+    Aliasing makes it accurate for q well below the Nyquist wave vector pi Ngrid / L.
+
+    Returns:
+    - transform: shape (Nframes, Nq, Ncomp)
+    - q: wave vectors, shape (Nq, 2), in the same half plane as wave_vectors()
+    """
+
+    Lx, Ly = system_size
+    grid = deposit_on_grid(positions, values, system_size, Ngrid)
+    grid_transform = np.fft.fft2(grid, axes=(1, 2))
+
+    # wave vectors of grid
+    kx = np.fft.fftfreq(Ngrid, d=1 / Ngrid)
+    ky = np.fft.fftfreq(Ngrid, d=1 / Ngrid)
+    nx, ny = np.meshgrid(kx, ky, indexing='ij')
+
+    half   = (nx > 0) + ((nx == 0) * (ny > 0))
+    q_grid = 2 * np.pi * np.stack([nx / Lx, ny / Ly], axis=-1)
+    keep   = half * (np.linalg.norm(q_grid, axis=-1) <= q_max)
+
+    # cloud-in-cell window
+    window = (np.sinc(nx / Ngrid) * np.sinc(ny / Ngrid))**2
+
+    transform = grid_transform[:, keep] / window[keep][None, :, None]
+
+    return transform, q_grid[keep]
+
+
+
+def radial_average(q, spectrum, dq):
+    """
+    Averages spectrum over wave vectors in shells of width dq, and over frames.
+
+    Parameters:
+    - q: wave vectors, shape (Nq, 2)
+    - spectrum: shape (Nframes, Nq)
+    - dq: shell width
+
+    Returns:
+    - q_bin_centers, mean spectrum in each shell, number of wave vectors in each shell
+    """
+
+    q_norm = np.linalg.norm(q, axis=1)
+    q_bin_edges = np.arange(0, q_norm.max() + dq, dq)
+    inds = np.digitize(q_norm, q_bin_edges) - 1
+
+    Nbins = len(q_bin_edges) - 1
+    Nq_in_bin = np.bincount(inds, minlength=Nbins)[:Nbins]
+    spectrum_sum = np.bincount(inds, weights=np.mean(spectrum, axis=0), minlength=Nbins)[:Nbins]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_spectrum = np.ma.masked_invalid(spectrum_sum / Nq_in_bin)
+
+    q_bin_centers = (q_bin_edges[1:] + q_bin_edges[:-1]) / 2
+
+    return np.ma.array(q_bin_centers, mask=mean_spectrum.mask), mean_spectrum, Nq_in_bin
+
+
+
+def compute_spectra(positions, system_size, q_max, dq, heights=None, velocities=None, method='direct', Ngrid=64):
+    """
+    Computes static structure factor S(q), and optionally height-fluctuation and velocity spectra, for every frame.
+
+    Parameters:
+    - positions: cell positions, shape (Nframes, Ncells, 2). Unwrapped positions can be used.
+    - system_size: box size (Lx, Ly)
+    - q_max: largest wave vector norm
+    - dq: width of shells for radial averaging
+    - heights: cell heights, shape (Nframes, Ncells)
+    - velocities: cell velocities, shape (Nframes, Ncells, 2)
+    - method: 'direct' (sum of complex exponentials) or 'grid' (FFT of cloud-in-cell deposition)
+    - Ngrid: number of grid points per side with method 'grid'
+
+    Returns:
+    - dictionary of spectra per frame ('S', 'hh', 'vv_L', 'vv_T'), with wave vectors 'q',
+      and radially averaged spectra in 'radial' as (q_bin_centers, mean, Nq_in_bin)
+    """
+
+    assert method in ['direct', 'grid'], "method must be direct or grid"
+
+    positions = np.ma.getdata(positions).astype(float)
+    Nframes, Ncells, _ = positions.shape
+
+    # Values to transform: density, height fluctuations, velocity components
+    values = [np.ones((Nframes, Ncells))]
+    if heights is not None:
+        heights = np.ma.getdata(heights).astype(float)
+        values.append(heights - np.mean(heights, axis=1, keepdims=True))
+    if velocities is not None:
+        velocities = np.ma.getdata(velocities).astype(float)
+        values += [velocities[..., 0], velocities[..., 1]]
+    values = np.stack(values, axis=-1)
+
+    if method == 'direct':
+        q = wave_vectors(system_size, q_max)
+        transform = fourier_transform(positions, values, q)
+    else:
+        transform, q = gridded_fourier_transform(positions, values, system_size, Ngrid, q_max)
+
+    spectra = {'q': q, 'S': np.abs(transform[..., 0])**2 / Ncells}
+
+    if heights is not None:
+        spectra['hh'] = np.abs(transform[..., 1])**2 / Ncells
+
+    if velocities is not None:
+        vx_q, vy_q = transform[..., -2], transform[..., -1]
+        q_hat = q / np.linalg.norm(q, axis=1, keepdims=True)
+
+        # longitudinal and transverse components
+        spectra['vv_L'] = np.abs(q_hat[:, 0] * vx_q + q_hat[:, 1] * vy_q)**2 / Ncells
+        spectra['vv_T'] = np.abs(-q_hat[:, 1] * vx_q + q_hat[:, 0] * vy_q)**2 / Ncells
+
+    spectra['radial'] = {key: radial_average(q, spectrum, dq) for key, spectrum in spectra.items() if key != 'q'}
+
+    return spectra
@@ -0,0 +1,187 @@
+import numpy as np
+
+import neighbour_graph
+
+
+def edge_keys(graph):
+    """
+    Hashes every edge (i, j), i < j, of every frame of a neighbour graph into one int64 key,
+    frame * Ncells^2 + i * Ncells + j, so that edge sets of all frames are compared with sorted array operations.
+
+    Returns:
+    - keys: shape (Nedges,)
+    - frames: frame of every edge
+    """
+
+    Ncells  = np.int64(graph['Ncells'])
+    Nframes = len(graph['offsets']) - 1
+    frames  = np.repeat(np.arange(Nframes, dtype=np.int64), np.diff(graph['offsets']))
+    edges   = graph['edges'].astype(np.int64)
+
+    return frames * Ncells**2 + edges[:, 0] * Ncells + edges[:, 1], frames
+
+
+
+def edge_changes(graph):
+    """
+    Edges lost and gained between consecutive frames, for the whole trajectory at once.
+
+    Returns:
+    - lost: (frame, i, j) of edges of frame that are not in frame+1, shape (Nlost, 3)
+    - gained: (frame, k, l) of edges of frame+1 that are not in frame, shape (Ngained, 3)
+    """
+
+    Ncells = np.int64(graph['Ncells'])
+    keys, frames = edge_keys(graph)
+    last_frame = len(graph['offsets']) - 2
+
+    # keys of next frame, shifted to the current frame
+    shifted = keys - Ncells**2
+
+    lost_keys   = keys[(frames < last_frame) * ~np.isin(keys, shifted)]
+    gained_keys = shifted[(frames > 0) * ~np.isin(shifted, keys)]
+
+    def decode(k):
+        frame, pair = np.divmod(k, Ncells**2)
+        return np.stack([frame, pair // Ncells, pair % Ncells], axis=-1)
+
+    return decode(lost_keys), decode(gained_keys)
+
+
+
+def detect_t1(graph, positions=None, system_size=None):
+    """
+    Detects T1 transitions as edges (i, j) lost between consecutive frames. Each is paired with the edge (k, l)
+    gained between the two common neighbours k, l of i and j, if it exists.
+
+    Parameters:
+    - graph: neighbour graph from neighbour_graph.neighbour_edges
+    - positions: cell positions, shape (Nframes, Ncells, 2), to locate events
+    - system_size: box size (Lx, Ly), for periodic midpoints
+
+    Returns:
+    - dictionary with 'frame' (transition frame -> frame+1), 'cells' (i, j, k, l, with -1 if unpaired),
+      'paired' and 'position' (midpoint of i and j)
+    """
+
+    lost, gained = edge_changes(graph)
+    Ncells = np.int64(graph['Ncells'])
+    gained_keys = gained[:, 0] * Ncells**2 + gained[:, 1] * Ncells + gained[:, 2]
+
+    # common neighbours of cells losing an edge
+    cells = np.full((len(lost), 4), -1, dtype=int)
+    cells[:, :2] = lost[:, 1:]
+
+    adjacency, adjacency_frame = None, -1
+    for e, (frame, i, j) in enumerate(lost):
+        if frame != adjacency_frame:
+            adjacency, adjacency_frame = neighbour_graph.frame_adjacency(graph, frame), frame
+
+        common = np.intersect1d(adjacency.indices[adjacency.indptr[i]:adjacency.indptr[i+1]],
+                                adjacency.indices[adjacency.indptr[j]:adjacency.indptr[j+1]])
+        if len(common) == 2:
+            cells[e, 2:] = np.sort(common)
+
+    # keep common neighbours only if they gained an edge
+    candidate_keys = lost[:, 0] * Ncells**2 + cells[:, 2] * Ncells + cells[:, 3]
+    cells[~np.isin(candidate_keys, gained_keys) + (cells[:, 2] < 0), 2:] = -1
+
+    events = {'frame':  lost[:, 0],
+              'cells':  cells,
+              'paired': cells[:, 2] >= 0}
+
+    if positions is not None:
+        positions = np.ma.getdata(positions)
+        r_i = positions[lost[:, 0], lost[:, 1]]
+        r_j = positions[lost[:, 0], lost[:, 2]]
+
+        # midpoint with minimum image convention
+        d = r_j - r_i
+        if system_size is not None:
+            d -= np.asarray(system_size) * np.rint(d / np.asarray(system_size))
+            events['position'] = (r_i + d / 2) % np.asarray(system_size)
+        else:
+            events['position'] = r_i + d / 2
+
+    return events
+
+
+
+def t1_rates(events, Nframes, Ncells, df=1):
+    """
+    Number of T1 transitions per cell and unit time, in every transition between frames and on average.
+    """
+
+    counts = np.bincount(events['frame'], minlength=Nframes - 1)[:Nframes - 1]
+    rate   = counts / (Ncells * df)
+
+    return rate, np.mean(rate)
+
+
+
+def event_pair_correlation(positions, frames, system_size, dr, r_max, window=0):
+    """
+    Pair correlation g(r) of event positions, among events at most window frames apart, with periodic distances.
+    g(r) = 1 for events placed independently and uniformly, and g(r) > 1 at short distances for clustered events.
+
+    Returns:
+    - r_bin_centers, g(r) masked where no pairs are expected
+    """
+
+    system_size = np.asarray(system_size, dtype=float)
+    r_bin_edges = np.arange(0, r_max + dr, dr)
+    Nbins = len(r_bin_edges) - 1
+
+    order     = np.argsort(frames, kind='stable')
+    positions = np.asarray(positions)[order]
+    frames    = np.asarray(frames)[order]
+
+    counts    = np.zeros(Nbins)
+    Npairs    = 0
+    for e in range(len(frames)):
+        # later events within time window
+        end = np.searchsorted(frames, frames[e] + window, side='right')
+        others = slice(e + 1, end)
+
+        d = positions[others] - positions[e]
+        d -= system_size * np.rint(d / system_size)
+        r = np.linalg.norm(d, axis=-1)
+
+        counts += np.histogram(r, bins=r_bin_edges)[0]
+        Npairs += end - e - 1
+
+    # Expected number of pairs in each shell for uniform positions
+    shell_area = np.pi * (r_bin_edges[1:]**2 - r_bin_edges[:-1]**2)
+    expected   = np.ma.masked_equal(Npairs * shell_area / np.prod(system_size), 0)
+
+    return (r_bin_edges[1:] + r_bin_edges[:-1]) / 2, counts / expected
+
+
+
+def conditional_t1_rate(events, values, Nbins=10, df=1):
+    """
+    Rate of involvement of cells in T1 transitions (as one of the cells losing the edge),
+    conditioned on a cell property (e.g. height or volume) in the frame before the transition.
+
+    Parameters:
+    - values: cell property, shape (Nframes, Ncells)
+    - Nbins: number of quantile bins of values
+
+    Returns:
+    - bin centers of values, rate per cell and unit time in each bin
+    """
+
+    values = np.ma.getdata(values)[:-1]
+    bin_edges = np.quantile(values, np.linspace(0, 1, Nbins + 1))
+    inds = np.clip(np.digitize(values, bin_edges) - 1, 0, Nbins - 1)
+
+    # cell-frames in each bin, and cell-frames involved in transitions
+    Ncell_frames = np.bincount(inds.ravel(), minlength=Nbins)
+    frames = np.repeat(events['frame'], 2)
+    cells  = events['cells'][:, :2].ravel()
+    Ninvolved = np.bincount(inds[frames, cells], minlength=Nbins)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rate = np.ma.masked_invalid(Ninvolved / (Ncell_frames * df))
+
+    return (bin_edges[1:] + bin_edges[:-1]) / 2, rate
@@ -1,9 +1,14 @@
+import sys
 import pickle
 import numpy as np
 
 from operator import itemgetter
 from cells.bind import VertexModel, getPolygonsCell
 
+sys.path.append("analysis/utils/")
+import neighbour_graph
+import cell_shape
+
 
 def load(file, init_time=100, df=1):
     """ Loads vm object and returns as list """
@@ -42,6 +47,12 @@ def get_cell_positions(list_vm):
     return positions
 
 
+def get_system_size(list_vm):
+    """ Get size of periodic box """
+
+    return np.array(list_vm[0].systemSize)
+
+
 def get_cell_heights(list_vm):
     """ Get cell heights """
 
@@ -87,56 +98,38 @@ def get_cell_velocities(list_vm):
 
 
 def get_neighbour_matrix(list_vm):
-    """ Get cell volumes """
-
-    # indices of cell centres (from first frame)
-    cells = list_vm[0].getVertexIndicesByType("centre")
-
-    neighbours_matrix = np.zeros([len(list_vm), max(cells)+1, max(cells)+1])
-
-    for frame in range(len(list_vm)):
-        for cell in cells:
-            neighbours = list_vm[frame].getNeighbouringCellIndices(cell)
-            neighbours_matrix[frame, cell, neighbours] = 1
-
+    """
+    Get neighbour graph of every frame, as an edge list with frame offsets (see neighbour_graph.neighbour_edges).
+    Cells are in the order of the other cell properties. Use neighbour_graph.frame_adjacency for sparse matrices.
+    """
 
-    return neighbours
+    return neighbour_graph.neighbour_edges(list_vm)
 
 
-def get_cell_aspect_ratios(list_vm):
-
-    cells = list_vm[0].getVertexIndicesByType("centre")
-
-    aspect_ratio = []
-
-    for vm in list_vm:  
-        polygons = getPolygonsCell(vm)
-        centers  = itemgetter(*cells)(list_vm[0].getPositions(wrapped=True))
-
-        centered_polygons = [np.array(polygon) - np.array(center) for polygon, center in zip(polygons, centers)]
+def get_cell_shapes(list_vm):
+    """
+    Get shape descriptors of cell polygons in every frame (see cell_shape.cell_shapes):
+    area, perimeter, shape_index, centroid, moments, Q, aspect_ratio and orientation.
+    Frames with fewer cells than the largest frame (e.g. with divisions) are padded with masked cells.
+    """
 
+    # polygons of all frames, padded to same number of vertices and cells
+    vertices, Nvertices = cell_shape.pad_polygons([getPolygonsCell(vm) for vm in list_vm])
 
-        cov = [np.cov(polygon, rowvar=False, bias=False) for polygon in polygons]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        shapes = cell_shape.cell_shapes(vertices)
 
-        # eigen-decomposition
-        eigvals, eigvecs = np.linalg.eigh(cov)  # returns sorted (ascending) eigenvalues for symmetric matrices
+    # mask padded cells
+    padding = Nvertices == 0
+    for key, value in shapes.items():
+        mask = np.broadcast_to(padding.reshape(padding.shape + (1,) * (np.ndim(value) - padding.ndim)), np.shape(value))
+        shapes[key] = np.ma.array(value, mask=mask)
+    shapes['Nvertices'] = Nvertices
 
-        # eigenvalues are in ascending order (smallest first), so:
-        minor_idx = 0
-        major_idx = 1
+    return shapes
 
-        # directions (unit vectors)
-        minor_dir = eigvecs[:, minor_idx]
-        major_dir = eigvecs[:, major_idx]
 
-        proj_major = [np.array(polygon).dot(major) for polygon, major in zip(polygons, major_dir)]
-        proj_minor = [np.array(polygon).dot(minor) for polygon, minor in zip(polygons, minor_dir)]
-
-        major_length = np.array([major.max() - major.min() for major in proj_major])
-        minor_length = np.array([minor.max() - minor.min() for minor in proj_minor])
-
-        aspect_ratio.append(major_length / minor_length)
-
-
-    return np.array(aspect_ratio)
+def get_cell_aspect_ratios(list_vm):
+    """ Get cell aspect ratios, from the second moment tensor of cell polygons """
 
+    return np.ma.array(get_cell_shapes(list_vm)['aspect_ratio'])
@@ -16,6 +16,9 @@ import config_functions as config
 sys.path.append("exe/utils")
 from vm_functions import hexagon_side
 
+sys.path.append("analysis/utils")
+import bootstrap
+
 sys.path.append("analysis/experimental")
 from data_class import AutocorrelationData, SegmentationData
 
@@ -24,6 +27,18 @@ fig_dir = f"results/{date}/"
 Path(fig_dir).mkdir(parents=True, exist_ok=True)
 
 
+def select_correlations(cellcorr, var, param):
+    """ Experimental correlations of param of every frame: spatial (r), temporal (t) or temporal per cell """
+
+    if var == "r":
+        return cellcorr.spatial[param]
+    elif var == "t":
+        return cellcorr.temporal[param]
+    else:
+        return cellcorr.temporal_cell[param]
+
+
+
 # Define paths
 config_dir = "data/simulated/configs/"
 
@@ -45,6 +60,9 @@ parser.add_argument('-r', '--return_plot', action="store_true")
 parser.add_argument('--xlog', action="store_true")
 parser.add_argument('--ylog', action="store_true")
 parser.add_argument('--log',  action="store_true")
+parser.add_argument('-b', '--bootstrap', type=int, help="Number of resamples of experimental frames for confidence band (0: none)", default=0)
+parser.add_argument('--Npool',           type=int, help="Number of processes for resampling", default=1)
+parser.add_argument('--block_length',    type=int, help="Number of consecutive frames resampled together. Default: from autocorrelation time", default=None)
 args = parser.parse_args()
 
 
@@ -69,17 +87,16 @@ if args.param == "vv":
 
 
 # take mean of correlations at this density
-if args.var == "r":
-    mean_correlation = np.ma.mean(cellcorr.spatial[args.param][mask], axis=0)
-    std_correlation  = np.ma.std(cellcorr.spatial[args.param][mask], axis=0)
+frame_correlations = select_correlations(cellcorr, args.var, args.param)[mask]
+mean_correlation   = np.ma.mean(frame_correlations, axis=0)
+std_correlation    = np.ma.std(frame_correlations, axis=0)
 
-elif args.var == "t":
-    mean_correlation = np.ma.mean(cellcorr.temporal[args.param][mask], axis=0)
-    std_correlation  = np.ma.std(cellcorr.temporal[args.param][mask], axis=0)
-
-else:
-    mean_correlation = np.ma.mean(cellcorr.temporal_cell[args.param][mask], axis=0)
-    std_correlation  = np.ma.std( cellcorr.temporal_cell[args.param][mask], axis=0)
+# block bootstrap over frames at this density, each frame weighted equally as in the mean
+if args.bootstrap > 0:
+    frame_counts = (~np.ma.getmaskarray(frame_correlations)).astype(float)
+    ci_correlation, _ = bootstrap.confidence_band(frame_correlations, frame_counts,
+                                                  Nresamples=args.bootstrap, Npool=args.Npool,
+                                                  block_length=args.block_length)
 
 # plot simulation
 fig = initialize_figure(args.param, args, args.figscale)
@@ -109,18 +126,16 @@ if args.filepattern != None:
 
 if args.var == "r":
     plt.plot(cellcorr.r_array[args.param], mean_correlation, "b--", label="Exp")
-    # plt.fill_between(cellcorr.r_array[args.param], 
-    #                  mean_correlation - 1.96*std_correlation, 
-    #                  mean_correlation + 1.96*std_correlation,
-    #                  alpha=0.5, color="b")
+    if args.bootstrap > 0:
+        plt.fill_between(cellcorr.r_array[args.param], ci_correlation[0], ci_correlation[1],
+                         alpha=0.3, color="b", linewidth=0)
     out_path = f"{fig_dir}spatial_autocorrelation_{args.param}.png"
 
 else:
     plt.plot(cellcorr.t_array[args.param] * args.frame_to_h, mean_correlation, "b--", label="Exp")
-    # plt.fill_between(cellcorr.t_array[args.param] * args.frame_to_h, 
-    #                  mean_correlation - 1.96*std_correlation, 
-    #                  mean_correlation + 1.96*std_correlation,
-    #                  alpha=0.5, color="b")
+    if args.bootstrap > 0:
+        plt.fill_between(cellcorr.t_array[args.param] * args.frame_to_h, ci_correlation[0], ci_correlation[1],
+                         alpha=0.3, color="b", linewidth=0)
     out_path = f"{fig_dir}temporal_autocorrelation_{args.param}.png"
 
 
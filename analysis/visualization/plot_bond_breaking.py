@@ -3,20 +3,33 @@ import sys
 import argparse
 from pathlib import Path
 from glob import glob
-from tqdm import tqdm
+from multiprocessing import Pool
 
 import numpy as np
 import matplotlib as mpl
 import matplotlib.pyplot as plt
 
-from cells.bind import getPercentageKeptNeighbours
-
 sys.path.append("analysis/utils")
 import vm_output_handling as vm_output
+import neighbour_graph
+
+
+def file_retention(d, path, Nframes, origin_step):
+    """ Sums of kept-neighbour fractions over time origins of one file in directory d """
+
+    list_vm, init_vm = vm_output.load(path)
+    adjacency = neighbour_graph.adjacency_matrices(list_vm[:Nframes])
+
+    lags, retention_sum, Norigins = neighbour_graph.neighbour_retention(adjacency, origin_step=origin_step)
+
+    return d, retention_sum, Norigins
+
 
 parser = argparse.ArgumentParser(description="Run several runs")
 parser.add_argument('dirs',   nargs='*',  help="directories")
 parser.add_argument('-N', '--Nframes', type=int, help="number of frames", default=900)
+parser.add_argument('-s', '--origin_step', type=int, help="number of frames between time origins", default=1)
+parser.add_argument('-P', '--Npool', type=int, help="number of parallel processes", default=16)
 args = parser.parse_args()
 
 
@@ -24,22 +37,28 @@ args = parser.parse_args()
 
 # # dir_path = "data/simulated/raw/nodivision_20250919_N30_L64_Lambda100_v0100_taup400/*"
 
-bond_breaking = np.zeros([len(args.dirs), args.Nframes])
-
-d = 0
-for dir in tqdm(args.dirs):
+# All files of all directories are processed in one pool
+commands = []
+for d, dir in enumerate(args.dirs):
     for path in glob(dir+"/*"):
+        commands.append((d, path, args.Nframes, args.origin_step))
+
+with Pool(processes=max(1, min(len(commands), args.Npool))) as pool:
+    results = pool.starmap(file_retention, commands)
+
+# Average over time origins of all files in directory
+retention_sum = np.zeros([len(args.dirs), args.Nframes])
+Norigins      = np.zeros([len(args.dirs), args.Nframes])
 
-        list_vm, init_vm = vm_output.load(path)
+for d, file_sum, file_Norigins in results:
+    retention_sum[d, :len(file_sum)] += file_sum
+    Norigins[d, :len(file_Norigins)] += file_Norigins
 
-        for i in range(len(list_vm)):
-            neighbour_dict = getPercentageKeptNeighbours(list_vm[0], list_vm[i])
-            bond_breaking[d,i] += np.mean(list(neighbour_dict.values()))
-    
-    d += 1
+with np.errstate(divide='ignore', invalid='ignore'):
+    bond_breaking = retention_sum / Norigins
 
 np.save("bond_breaking_correlation.npy", bond_breaking)
 
 fig = plt.figure()
 plt.plot(bond_breaking[0])
-plt.savefig("Bond_breaking_correlation.png")
\ No newline at end of file
+plt.savefig("Bond_breaking_correlation.png")
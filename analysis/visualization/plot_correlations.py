@@ -105,20 +105,29 @@ def initialize_figure(varname, args, fig_scale=1):
 
 def compute_average_displacement(file):
     """
-    Compute time scale as average displacement
+    Compute time scale as average displacement between two frames.
+    Cached in the correlation object, so raw frames are only loaded the first time.
+    Ensemble averages have no raw file of their own and use a member of the ensemble.
     """
-    fname = Path(file).stem
-    path = glob.glob(f"data/simulated/raw/{fname}/*")[0]
+    corr_obj = VMAutocorrelationObject(out_path=file)
 
-    # load raw data
-    list_vm,_ = vm_output.load(path)
+    if 'mean_dr' not in corr_obj.displacement.keys():
+        path = corr_obj.in_path
+        if not os.path.exists(path):
+            fname = Path(file).stem
+            path = glob.glob(f"data/simulated/raw/{fname}/*")[0]
 
-    # extract cell positions
-    cell_positions = vm_output.get_cell_positions(list_vm)
+        # load raw data
+        list_vm,_ = vm_output.load(path)
 
-    # compute average displacement between two frames
-    dr_arr = np.sqrt(np.diff(cell_positions[:,:,0], axis=0)**2 + np.diff(cell_positions[:,:,1], axis=0)**2)
-    dr = np.mean(dr_arr)
+        # extract cell positions
+        cell_positions = vm_output.get_cell_positions(list_vm)
+
+        # compute and cache displacements
+        corr_obj.compute_displacements(cell_positions)
+        corr_obj.save_pickle()
+
+    dr = corr_obj.displacement['mean_dr']
     print(dr)
     
     return dr
@@ -152,11 +161,8 @@ def plot_correlation(path, label, color, args):
         elif args.units == "exp":
             x = corr_obj.r_array[args.param]
 
-        y = corr_obj.spatial[args.param]
-        plt.plot(x[(x <= args.xlim) * (y <= args.ylim)], y[(x <= args.xlim) * (y <= args.ylim)],
-                    args.fmt,
-                    color=color,
-                    label=label)
+        y  = corr_obj.spatial[args.param]
+        ci = corr_obj.spatial_ci.get(args.param, None)
     
     else:
         # vmean = compute_average_displacement(path)
@@ -167,12 +173,20 @@ def plot_correlation(path, label, color, args):
         elif args.units == "exp":
             #print(vmean, config_file["experimental"]["rhex"], config_file["experimental"]["vmean"])
             x = corr_obj.t_array[args.param] # * (vmean * config_file["experimental"]["rhex"]) / config_file["experimental"]["vmean"]
-            y = corr_obj.temporal[args.param]
 
-        plt.plot(x[(x <= args.xlim) * (y <= args.ylim)], y[(x <= args.xlim) * (y <= args.ylim)],
-                    args.fmt,
-                    color=color, 
-                    label=label)
+        y  = corr_obj.temporal[args.param]
+        ci = corr_obj.temporal_ci.get(args.param, None)
+
+    in_range = (x <= args.xlim) * (y <= args.ylim)
+    plt.plot(x[in_range], y[in_range],
+                args.fmt,
+                color=color,
+                label=label)
+
+    # Confidence band, if computed
+    if ci is not None:
+        plt.fill_between(x[in_range], ci[0][in_range], ci[1][in_range],
+                         color=color, alpha=0.3, linewidth=0)
 
 
 
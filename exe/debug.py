@@ -4,13 +4,14 @@ import pickle
 import traceback
 import subprocess
 import numpy as np
-import scipy as sc
 from tempfile import mkdtemp
 
 from cells.plot import plot
 from cells.bind import VertexModel
 from cells.init import movie_sh_fname
 
+from utils.initial_conditions import set_cell_volumes
+
 
 
 def main():
@@ -59,9 +60,8 @@ def main():
     vm.addSurfaceForce("surface", Lambda, V0, tauV)                 # surface tension force
     vm.setPairFrictionIntegrator(eta)                               # add pair dissipation
 
-    vm.vertexForces["surface"].volume = dict(map(                   # set cell volume
-        lambda i: (i, sc.stats.truncnorm((Vmin-V0)/stdV0, (Vmax-V0)/stdV0, loc=V0, scale=stdV0).rvs()),
-        vm.vertexForces["surface"].volume))
+    set_cell_volumes(vm, 'truncnorm', seed,                         # set cell volume
+                     Vmin=Vmin, Vmax=Vmax, loc=V0, scale=stdV0)
 
 
 
@@ -8,6 +8,9 @@ import matplotlib.pyplot as plt
 from operator import itemgetter
 from tempfile import mkdtemp
 
+from utils.vm_functions import new_lineage, append_lineage, cell_divisions
+from utils.initial_conditions import set_cell_volumes
+
 # PARAMETERS
 
 seed = 0                                # random number generator seed
@@ -33,9 +36,8 @@ vm.initRegularTriangularLattice(size=N, hexagonArea=A0) # initialise periodic sy
 # forces
 vm.addActiveBrownianForce("abp", v0, taup)      # centre active Brownian force
 vm.addSurfaceForce("surface", Lambda, V0, tauV) # surface tension force
-vm.vertexForces["surface"].volume = dict(map(   # set cell volume
-    lambda i: (i, np.random.uniform(low=V0 - stdV0, high=V0 + stdV0)),
-    vm.vertexForces["surface"].volume))
+set_cell_volumes(vm, 'uniform', seed,           # set cell volume
+                 low=V0 - stdV0, high=V0 + stdV0)
 
 # SIMULATION
 
@@ -52,6 +54,11 @@ index = 0
 
 # output
 with open("out.p", "wb") as dump: pass
+with open("lineage.p", "wb") as dump: pass
+lineage = new_lineage()                                 # division events
+Nsaved = 0                                              # division events saved
+rng = np.random.default_rng(seed)                       # division decisions
+division_stats = {}                                     # divisions and wall time of every division step
 
 # simulation
 fig, ax = plot(vm, fig=None, ax=None)                   # initialise plot with first frame
@@ -60,6 +67,7 @@ plt.show()
 while True:
     # output
     with open("out.p", "ab") as dump: pickle.dump(vm, dump)
+    Nsaved = append_lineage("lineage.p", lineage, Nsaved)
     # plot
     try:
         # update plot
@@ -79,14 +87,10 @@ while True:
     # integrate
     vm.nintegrate(period, dt, delta, epsilon)
     # divide
-    volumes = vm.vertexForces["surface"].volume.copy()
-    heights = vm.vertexForces["surface"].height.copy()
-    for i in vm.getVertexIndicesByType("centre"):                   # loop over cell centres
-        if np.random.rand() < (volumes[i] - Vth)/Vth:               # probability of dividing
-            j = vm.splitCellAtMax(i)                                # divide
-            volumes[i] = heights[i]*vm.getVertexToNeighboursArea(i) # mother cell keeps same height
-            volumes[j] = heights[i]*vm.getVertexToNeighboursArea(j) # daughter gets height of mother
-    vm.vertexForces["surface"].volume = volumes
+    cell_divisions(vm, Vth, lineage=lineage, rng=rng, stats=division_stats)
+
+print("%i divisions in %.3f s of division steps." % (sum(division_stats.get('Ndivisions', [])), sum(division_stats.get('time', []))),
+    file=sys.stderr)
 
 # make movie
 subprocess.call([movie_sh_fname,
@@ -18,12 +18,17 @@ from cells.init import movie_sh_fname
 from utils.config_functions   import *
 from utils.vm_functions       import *
 from utils.plotting_functions import plot
+from utils.initial_conditions import set_cell_volumes
+from utils.equilibration      import equilibrated_state, supports_reseeding, fork
+from utils.seeds              import claim_filename
+from utils                    import steady_state
 from utils.exception_handlers import save_snapshot
 
 from run_ensemble import create_dirname
 
 import matplotlib
 matplotlib.use("Agg")
+import matplotlib.pyplot as plt
 
 
 # Define paths
@@ -47,7 +52,9 @@ def create_filename(config_file, ensemble=False):
 
 
 
-def main():
+def parse_arguments(argv=None):
+    """ Parses command-line arguments, or the argument list argv of an in-process ensemble member """
+
     # Command-line argument parsing
     parser = argparse.ArgumentParser(description="Run simulation constant cell volume and active brownian motion")
     parser.add_argument('-d', '--dir',    type=str,  help='Save in subfolders data/*/dir/. Creates dir if not existing.', default='')
@@ -57,12 +64,28 @@ def main():
     parser.add_argument('--frames_dir',   type=str,  help='Where to save frames',    default='../../../../hdd_data/silja/VertexModel_data/simulated/frames/')
     parser.add_argument('--ensemble',                help='Defines whether run is part of ensemble execution', action='store_true')
     parser.add_argument('--init_time',    type=int,  help='Number of initialisation frames', default=100)
-    args = parser.parse_args()
+    parser.add_argument('--volume_cache', type=str,  help='Directory to cache initial volume tables in', default=None)
+    parser.add_argument('--equilibration_cache', type=str, help='Directory of equilibrated states shared by members with the same parameters', default=None)
+    parser.add_argument('--steady_state',            help='Detect end of transient from running means of heights, volumes and velocities, instead of --init_time', action='store_true')
+    parser.add_argument('--steady_window', type=int, help='Number of frames of running windows compared in steady-state detection', default=25)
+    parser.add_argument('--steady_tolerance', type=float, help='Largest drift of running means, in units of fluctuations', default=0.2)
+    parser.add_argument('--production_frames', type=int, help='Stop after this number of frames after the transient. Default: run all frames', default=None)
+
+    return parser.parse_args(argv)
+
+
+
+def run(args):
+    """ Runs one simulation. Importable, so ensemble workers run many members in the same process. """
 
 
 
     # CONFIG
 
+    # Members forking from a cached state need their own noise
+    if args.equilibration_cache and not supports_reseeding(VertexModel):
+        raise RuntimeError("--equilibration_cache requires a VertexModel binding with setSeed, so forked members can be reseeded.")
+
     # Load config file
     config_path = args.config
     config_file = load_config(config_path)
@@ -127,7 +150,6 @@ def main():
     
     # Save simulation-specific config file
     fname = create_filename(config_file, args.ensemble)
-    print("Simulation name: ", fname)
 
 
     # DEFINE PATHS
@@ -137,42 +159,68 @@ def main():
         args.dir = f"{args.dir}/"
     path_to_config = f"{Path(config_path).parent}/{args.dir}"
     path_to_output = f"{output_path}/{args.dir}"
-    path_to_frames = f"{args.frames_dir}/{args.dir}/{fname}"
 
     Path(path_to_config).mkdir(parents=True, exist_ok=True)
     Path(path_to_output).mkdir(parents=True, exist_ok=True)
+
+    # Ensemble members have unique seeds, so a rerun of a member overwrites its own output and config.
+    # Other runs claim their output file, so concurrent runs with the same name do not overwrite each other.
+    if not args.ensemble:
+        fname = claim_filename(path_to_output, fname, '.p')
+    print("Simulation name: ", fname)
+
+    path_to_frames = f"{args.frames_dir}/{args.dir}/{fname}"
     Path(path_to_frames).mkdir(parents=True, exist_ok=True)
 
        
     # Save frames in temporary directory
     print("Save frames to temp directory \"%s\"." % path_to_frames, file=sys.stderr)
 
+    # Transient skipped by analysis, updated once the run ends
+    config_file['simulation']['init_time'] = args.init_time
     save_config(f"{path_to_config}{fname}.json", config_file)
 
 
 
     # INITIALISATION
 
-    # Set seed
-    np.random.seed(seed)
-
-    # Vertex model object
-    vm = VertexModel(np.random.randint(1e5))                        # initialise vertex model object
-    vm.initRegularTriangularLattice(size=Ngrid, hexagonArea=A0)     # initialise periodic system
+    def initialise(seed):
+        # Set seed
+        np.random.seed(seed)
 
-    # Add forces
-    vm.addActiveBrownianForce("abp", v0, taup)                     # centre active Brownian force
-    vm.addSurfaceForce("surface", gamma, Lambda, V0, tauV)         # surface tension force
-    vm.setPairFrictionIntegrator(eta)                              # add pair dissipation
+        # Vertex model object
+        vm = VertexModel(seed)                                          # initialise vertex model object
+        vm.initRegularTriangularLattice(size=Ngrid, hexagonArea=A0)     # initialise periodic system
 
-    # vm.vertexForces["surface"].volume = dict(map(                   # set cell volume
-    #     lambda i: (i, sc.stats.truncnorm((Vmin-V0)/stdV0, (Vmax-V0)/stdV0, loc=V0, scale=stdV0).rvs()),
-    #     vm.vertexForces["surface"].volume))
-    
-    vm.vertexForces["surface"].volume = dict(map(                   # set cell volume
-        lambda i: (i, sc.stats.skewnorm(a=skew, loc=V0, scale=stdV0).rvs()),
-        vm.vertexForces["surface"].volume))
+        # Add forces
+        vm.addActiveBrownianForce("abp", v0, taup)                     # centre active Brownian force
+        vm.addSurfaceForce("surface", gamma, Lambda, V0, tauV)         # surface tension force
+        vm.setPairFrictionIntegrator(eta)                              # add pair dissipation
 
+        # vm.vertexForces["surface"].volume = dict(map(                   # set cell volume
+        #     lambda i: (i, sc.stats.truncnorm((Vmin-V0)/stdV0, (Vmax-V0)/stdV0, loc=V0, scale=stdV0).rvs()),
+        #     vm.vertexForces["surface"].volume))
+        
+        set_cell_volumes(vm, 'skewnorm', seed, cache_dir=args.volume_cache,   # set cell volume
+                         a=skew, loc=V0, scale=stdV0)
+
+        return vm
+
+    def equilibrate(seed):
+        vm = initialise(seed)
+        vm.nintegrate(args.init_time * period, dt, delta, epsilon)     # transient of init_time frames
+        return vm
+
+    # Fork from equilibrated state shared by all members of parameter point, or start from lattice
+    init_frames = 0
+    if args.equilibration_cache:
+        np.random.seed(seed)
+        state_path  = equilibrated_state(args.equilibration_cache, config_file, equilibrate,
+                                         extra={'script': Path(__file__).stem, 'init_time': args.init_time})
+        vm          = fork(state_path, seed)
+        init_frames = args.init_time
+    else:
+        vm = initialise(seed)
 
 
 
@@ -185,20 +233,54 @@ def main():
     fig, ax = plot(vm, fig=None, ax=None, cbar_zero=cbar_zero)      # initialise plot with first frame
 
 
-    # simulation
-    frame = 0
-    for step in range(0, Nframes):
+    # steady-state detection replaces fixed transient once it ends
+    init_time = args.init_time
+    detector  = steady_state.new_detector(args.steady_window, args.steady_tolerance) if args.steady_state else None
+
+    # forked states already ran init_frames transient frames, which are recorded as their transient,
+    # since the detector would not see them
+    if detector is not None and init_frames > 0:
+        detector['transient_end'] = init_time = init_frames
+
+    # simulation (transient frames are skipped when forking from equilibrated state)
+    frame = init_frames
+    for step in range(init_frames, Nframes):
         # output is appended to file
         with open(f"{path_to_output}{fname}.p", "ab") as dump: pickle.dump(vm, dump)
 
+        # detect end of transient
+        if detector is not None and detector['transient_end'] is None:
+            if steady_state.update(detector, vm, frame) is not None:
+                init_time = detector['transient_end']
+                print(f"Transient ended at frame {init_time}", file=sys.stderr)
+
         # plot snapshot
-        if frame > args.init_time:
+        if frame > init_time:
             save_snapshot(vm, fig, ax, path_to_frames, frame, cbar_zero=cbar_zero)
         frame += 1
 
+        # stop once enough steady-state frames are simulated
+        if detector is not None and steady_state.production_done(detector, frame, args.production_frames):
+            break
+
         # integrate
         vm.nintegrate(period, dt, delta, epsilon)
 
+    plt.close(fig)                                                  # workers run many members
+
+    # Record transient and number of frames of this run
+    if detector is not None and detector['transient_end'] is None:
+        print(f"No steady state detected. Keeping init_time {args.init_time}", file=sys.stderr)
+    config_file['simulation']['init_time'] = init_time
+    config_file['simulation']['Nframes']   = frame
+    save_config(f"{path_to_config}{fname}.json", config_file)
+
+    return f"{path_to_output}{fname}.p"
+
+
+
+def main():
+    run(parse_arguments())
    
     os.system('stty sane')
 
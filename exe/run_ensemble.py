@@ -1,33 +1,51 @@
+import os
+import sys
 import time
 import glob
 import shutil
 import argparse
 import platform
+import tempfile
+import traceback
 import subprocess
+import importlib.util
 import numpy as np
 
 from pathlib import Path
 from datetime import datetime
 from multiprocessing import Pool
 from utils.config_functions import *
+from utils.equilibration    import config_key
+from utils.seeds            import ensemble_entropy, spawn_seeds
+from utils import job_queue
+from utils import resources
 
 
 # Define paths
 config_path = "data/simulated/configs/"
 output_path = "data/simulated/raw/"
 movies_path = "data/simulated/videos/"
+processed_path = "data/simulated/processed/"
 
 if platform.node() != 'silja-work':
     print(f"Running simulation from {platform.node()}")
     config_path = "../../../../hdd_data/silja/VertexModel_data/simulated/configs/"
     output_path = "../../../../hdd_data/silja/VertexModel_data/simulated/raw/"
+    processed_path = "../../../../hdd_data/silja/VertexModel_data/simulated/processed/"
     #movies_path = "../../../../hdd_data/silja/VertexModel_data/simulated/videos/"
     print(f"Saving output in {output_path}")
 
 
-def create_dirname(script, config_file, filename=False):
+# Simulation script and module, imported once in every worker process
+_script     = None
+_simulation = None
+
+
+def create_dirname(script, config_file, filename=False, seed=None):
     """
-    Generates standard name and creates directory
+    Generates standard name and creates directory.
+    With the ensemble seed, the name identifies one ensemble, so ensembles of the same parameters
+    do not share member directories.
     """
     
     # Simulation parameters
@@ -47,6 +65,8 @@ def create_dirname(script, config_file, filename=False):
     # Name on directory
     timestamp = datetime.now().strftime('%Y%m%d')
     directory = f"{Path(script).stem}_{timestamp}_N{Ngrid}_L{Lgrid}_gamma{gamma}_v0{v0}_taup{taup}_eta{eta}"
+    if seed is not None:
+        directory = f"{directory}_seed{seed}"
 
 
     if not filename:
@@ -59,17 +79,394 @@ def create_dirname(script, config_file, filename=False):
 
 
 
-def generate_seed(digits):
-    """ Generates random seed below 1e<digits> """
-    return int(time.time()) % 10 ** digits
-
-
 def run_simulation(command):
     """ Runs a single simulation command. """
     result = subprocess.run(command, check=True)
     return result
 
 
+
+def member_commands(script, config, output_dir, seed, Nruns, equilibration_cache=None, start=0):
+    """
+    Commands of all members of an ensemble, with distinct member seeds spawned from the ensemble seed.
+    Members start, ..., start+Nruns-1 extend an ensemble whose first start members already ran.
+    """
+
+    commands = []
+    for member_seed in spawn_seeds(seed, Nruns, start=start):
+        command = [
+            'python', 
+            script,
+            '--dir',    output_dir,
+            '--config', config,
+            '--params', 'seed', str(member_seed),
+            '--ensemble'
+        ]
+        if equilibration_cache:
+            command += ['--equilibration_cache', equilibration_cache]
+        commands.append(command)
+
+    return commands
+
+
+
+def merge_member_configs(member_dir, output_dir, seed, Nruns):
+    """
+    Saves one config for the ensemble in output_dir, from the configs members saved in member_dir,
+    and deletes member_dir. member_dir only holds members of this ensemble, see create_dirname. Members of an ensemble config saved before with the same seed are kept,
+    so ensembles can be merged again after adding members.
+    """
+
+    # Load random config. Nothing to merge if another process already merged the members.
+    member_configs = glob.glob(f"{member_dir}/*.json")
+    if len(member_configs) == 0:
+        return False
+    config_file = load_config(member_configs[0])
+    
+    # Update with ensemble seed, and record seeds of members
+    update_value(config_file, key='seed', val=seed)
+    member_seeds = set(get_value(load_config(path), 'seed') for path in member_configs)
+
+    # Longest transient detected in members, so that analysis skips it in all members
+    init_times = [load_config(path)['simulation'].get('init_time') for path in member_configs]
+
+    if Path(f"{config_path}{output_dir}.json").exists():
+        previous = load_config(f"{config_path}{output_dir}.json")
+        if previous.get('seeds', {}).get('entropy') == seed:
+            member_seeds.update(previous['seeds']['members'])
+            init_times.append(previous['simulation'].get('init_time'))
+
+    config_file['seeds'] = {'entropy': seed, 'members': sorted(member_seeds)}
+
+    init_times = [init_time for init_time in init_times if init_time is not None]
+    if init_times:
+        config_file['simulation']['init_time'] = max(init_times)
+    
+    # Add number of runs/states in ensemble
+    config_file['Nruns'] = Nruns
+
+    # Save and delete folder
+    save_config(f"{config_path}{output_dir}.json", config_file)
+    shutil.rmtree(member_dir, ignore_errors=True)
+
+    return True
+
+
+
+def load_simulation(script):
+    """
+    Imports simulation script as a module. Returns None if the script cannot run members in-process,
+    i.e. does not define parse_arguments(argv) and run(args).
+    """
+
+    # scripts import utils/ and run_ensemble relative to their directory
+    script_dir = str(Path(script).resolve().parent)
+    if script_dir not in sys.path:
+        sys.path.insert(0, script_dir)
+
+    spec   = importlib.util.spec_from_file_location(Path(script).stem, script)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    if hasattr(module, 'parse_arguments') and hasattr(module, 'run'):
+        return module
+    return None
+
+
+
+def init_worker(script, in_process=True, worker_resources=None):
+    """
+    Pool initializer importing the simulation once per worker, so imports and compilation are paid once.
+    Also assigns cores and threads to the worker, with worker_resources from resources.pool_resources.
+    """
+    global _script, _simulation
+    if worker_resources is not None:
+        resources.init_worker(*worker_resources)
+    _script     = script
+    _simulation = load_simulation(script) if in_process else None
+
+
+
+def member_output(command):
+    """
+    Output file of an ensemble member command, named by member seed as in the simulation scripts.
+    None for commands that are not ensemble members.
+    """
+
+    if '--ensemble' not in command or '--dir' not in command:
+        return None
+
+    seed = command_params(command).get('seed')
+
+    return f"{output_path}{command[command.index('--dir') + 1]}/{Path(command[1]).stem}_seed{seed}.p"
+
+
+
+def run_member(command):
+    """
+    Runs one member in the worker process, or as a subprocess if the script cannot run in-process.
+    Failures are returned instead of raised, so one failing member does not stop the ensemble.
+
+    Returns:
+    - command, output file (None in subprocess unless an ensemble member), traceback (None if successful), wall time in seconds
+    """
+
+    start = time.time()
+    try:
+        if _simulation is None:
+            run_simulation(command)
+            output = member_output(command)
+        else:
+            output = _simulation.run(_simulation.parse_arguments(command[2:]))
+        return command, output, None, time.time() - start
+
+    except (Exception, SystemExit):
+        return command, None, traceback.format_exc(), time.time() - start
+
+
+
+def report_members(results, Nmembers, Nworkers, elapsed):
+    """
+    Prints failed members and throughput of members run in a pool.
+
+    Returns:
+    - list of (command, traceback) of failed members
+    """
+
+    failures = [(command, error) for command, output, error, wall_time in results if error is not None]
+
+    Ncompleted = len(results) - len(failures)
+    print(f"{Ncompleted}/{Nmembers} runs completed with {Nworkers} workers in {elapsed/3600:.2f} h "
+          f"({3600 * Ncompleted / elapsed:.1f} runs per hour)")
+    for command, _ in failures:
+        print(f"Failed: {' '.join(command)}", file=sys.stderr)
+
+    return failures
+
+
+
+def start_pool(script, Nworkers, in_process=True, threads=None, pin=False):
+    """ Pool of Nworkers simulation workers, each with its own cores and thread budget """
+
+    plan = resources.plan_resources(Nworkers, threads=threads, pin=pin)
+    resources.log_resources(plan)
+
+    return Pool(processes=Nworkers, initializer=init_worker, initargs=(script, in_process, resources.pool_resources(plan)))
+
+
+
+def run_members(script, commands, Npool, in_process=True, threads=None, pin=False, outputs=None):
+    """
+    Runs all member commands in a pool of at most Npool workers (and at most one per core and member).
+    Reports failed members and throughput. Output files of completed members are appended to outputs, if given.
+
+    Returns:
+    - list of (command, traceback) of failed members
+    """
+
+    Nworkers = max(1, min(Npool, len(commands), len(resources.available_cores())))
+    results  = []
+
+    start = time.time()
+    with start_pool(script, Nworkers, in_process, threads, pin) as pool:
+        for n, result in enumerate(pool.imap_unordered(run_member, commands), 1):
+            command, output, error, wall_time = result
+            if error is not None:
+                print(f"Member {' '.join(command[2:])} failed:\n{error}", file=sys.stderr)
+            print(f"{n}/{len(commands)} members done ({wall_time:.0f} s)", file=sys.stderr)
+            results.append(result)
+
+            if outputs is not None and error is None and output is not None:
+                outputs.append(output)
+
+    return report_members(results, len(commands), Nworkers, time.time() - start)
+
+
+
+def command_params(command):
+    """ Parameters given to a simulation command with --params, as dictionary """
+
+    if '--params' not in command:
+        return {}
+
+    start = command.index('--params') + 1
+    end   = next((i for i in range(start, len(command)) if command[i].startswith('--')), len(command))
+
+    return dict(zip(command[start:end:2], command[start+1:end:2]))
+
+
+
+def queue_jobs(commands):
+    """ Job records of member commands, with output directory, seed and hash of parameter point """
+
+    jobs = []
+    for command in commands:
+        params = command_params(command)
+
+        config_file = load_config(command[command.index('--config') + 1])
+        for key, value in params.items():
+            update_value(config_file, key, value)
+
+        jobs.append({'command':     command,
+                     'output_dir':  command[command.index('--dir') + 1] if '--dir' in command else None,
+                     'config_hash': config_key(config_file),
+                     'seed':        int(params['seed']) if 'seed' in params else None})
+
+    return jobs
+
+
+
+def queue_worker(queue_path):
+    """ Claims and runs pending jobs of the pool's script from the queue until none are left """
+
+    queue   = job_queue.connect(queue_path)
+    results = []
+
+    while (job := job_queue.claim(queue, script=_script)) is not None:
+        result = run_member(job['command'])
+        command, output, error, wall_time = result
+
+        job_queue.finish(queue, job['id'], output=output, error=error, wall_time=wall_time)
+        if error is not None:
+            print(f"Member {' '.join(command[2:])} failed:\n{error}", file=sys.stderr)
+        print(f"Job {job['id']} finished ({wall_time:.0f} s)", file=sys.stderr)
+        results.append(result)
+
+    queue.close()
+
+    return results
+
+
+
+def merge_queue_ensembles(queue_path):
+    """
+    Merges member configs of every ensemble of the queue whose jobs have all finished.
+    Ensembles are merged again when failed members are resumed. Merges are claimed in the queue,
+    so processes draining the same queue do not merge the same ensemble.
+    """
+
+    queue = job_queue.connect(queue_path)
+
+    for output_dir, member_dir, seed in job_queue.ensembles(queue):
+        Ndone = job_queue.claim_merge(queue, output_dir)
+        if Ndone is None or not merge_member_configs(member_dir, output_dir, seed, Ndone):
+            continue
+
+        count = job_queue.counts(queue, output_dir)
+        print(f"Results saved in: {output_dir}")
+        if count['failed'] > 0:
+            print(f"{count['failed']} members of {output_dir} failed. Resume with: python exe/run_queue.py {queue_path}")
+
+    queue.close()
+
+
+
+def run_queue(script, queue_path, Npool, in_process=True, threads=None, pin=False):
+    """
+    Drains the pending jobs of script from a persistent job queue with at most Npool workers,
+    and merges configs of finished ensembles. Other processes may drain the same queue at the same time.
+
+    Returns:
+    - list of (command, traceback) of members failed in this run
+    """
+
+    queue    = job_queue.connect(queue_path)
+    Npending = job_queue.counts(queue)['pending']
+    queue.close()
+
+    if Npending > 0:
+        Nworkers = max(1, min(Npool, Npending, len(resources.available_cores())))
+
+        start = time.time()
+        with start_pool(script, Nworkers, in_process, threads, pin) as pool:
+            results = sum(pool.map(queue_worker, [queue_path] * Nworkers), [])
+        failures = report_members(results, Npending, Nworkers, time.time() - start)
+    else:
+        failures = []
+
+    merge_queue_ensembles(queue_path)
+
+    return failures
+
+
+
+def ensemble_error(output_dir, new_files, observables, var, Npool):
+    """
+    Computes correlations of new members with analysis/compute_correlations.py, adds them to the ensemble average
+    with analysis/compute_ensemble_average.py (which only reads members not yet in the average),
+    and returns the largest standard error of the observables relative to their correlation at zero.
+
+    Parameters:
+    - output_dir: ensemble directory
+    - new_files: output files of members not yet in the average
+    - observables: correlations to monitor, e.g. ['hh', 'VV']
+    - var: 't' (temporal) or 'r' (spatial) correlations
+    - Npool: max number of parallel processes
+    """
+
+    # Correlations of new members, in parallel processes sharing the cores
+    Nworkers = max(1, min(Npool, len(new_files), len(resources.available_cores())))
+    threads  = max(1, len(resources.available_cores()) // Nworkers)
+    param    = observables[0] if len(observables) == 1 else 'all'
+
+    commands = [['python', 'analysis/compute_correlations.py', path, '--var', var, '--param', param,
+                 '--Npool', '1', '--threads', str(threads)] for path in new_files]
+    with Pool(processes=Nworkers) as pool:
+        pool.map(run_simulation, commands)
+
+    # Incremental ensemble average
+    with tempfile.TemporaryDirectory() as status_dir:
+        run_simulation(['python', 'analysis/compute_ensemble_average.py', f"{processed_path}{output_dir}/",
+                        '--Npool', str(Npool), '--status', f"{status_dir}/status.json"])
+        status = load_config(f"{status_dir}/status.json")
+
+    errors = [status[var].get(key, {}).get('relative_error') for key in observables]
+    if None in errors:
+        return np.inf
+
+    return max(errors)
+
+
+
+def run_adaptive(args, output_dir):
+    """
+    Runs members in waves until the relative standard error of the ensemble-averaged observables
+    falls below args.error_target, or args.max_runs members ran. The first wave has args.Nruns members.
+    """
+
+    Nstarted, Ncompleted, error = 0, 0, np.inf
+
+    while Nstarted < args.max_runs:
+        Nwave = min(args.Nruns if Nstarted == 0 else args.wave, args.max_runs - Nstarted)
+
+        commands = member_commands(args.script, args.config, output_dir, args.seed, Nwave,
+                                   equilibration_cache=args.equilibration_cache, start=Nstarted)
+        new_files = []
+        failures  = run_members(args.script, commands, args.Npool, in_process=not args.subprocess, threads=args.threads, pin=args.pin,
+                                outputs=new_files)
+
+        Nstarted   += Nwave
+        Ncompleted += Nwave - len(failures)
+        if len(new_files) == 0:
+            continue
+
+        # Ensemble config is needed to compute correlations of members
+        merge_member_configs(f"{config_path}{output_dir}", output_dir, args.seed, Ncompleted)
+
+        # Only outputs of members completed in this wave enter the average
+        error = ensemble_error(output_dir, sorted(new_files), args.observables, args.correlation, args.Npool)
+
+        print(f"{Ncompleted} members: relative standard error {error:.3g} of {', '.join(args.observables)} (target {args.error_target})")
+        if error <= args.error_target:
+            break
+
+    if error > args.error_target:
+        print(f"Error target not reached with the maximum of {args.max_runs} members")
+
+    return Ncompleted
+
+
+
 def main():
 
     # Command-line argument parsing
@@ -81,6 +478,18 @@ def main():
     parser.add_argument('-c', '--config', type=str,  help='Path to config file',          default='../../../../hdd_data/silja/VertexModel_data/simulated/configs/config.json')
     
     parser.add_argument('--pair_dissipation', action="store_true", help="Adding pair-dissipation.")
+    parser.add_argument('--equilibration_cache', type=str, help="Directory of equilibrated states members fork from", default=None)
+    parser.add_argument('--subprocess',       action="store_true", help="Run every member in its own Python subprocess instead of in-process workers.")
+    parser.add_argument('--queue',            type=str,  help="SQLite job queue to run members from, resumable with exe/run_queue.py", default=None)
+    parser.add_argument('--threads',          type=int,  help="Threads per worker (numba, OpenMP, BLAS). Default: cores per worker", default=None)
+    parser.add_argument('--pin',              action="store_true", help="Pin every worker to its cores.")
+
+    # adaptive ensemble size
+    parser.add_argument('--error_target',     type=float, help="Add members in waves until relative standard error of observables is below target. First wave has Nruns members.", default=None)
+    parser.add_argument('--observables',      nargs='*',  help="Correlations monitored by --error_target (hh, AA, VV, vv)", default=['hh'])
+    parser.add_argument('--correlation',      type=str,   help="Monitor temporal (t) or spatial (r) correlations",  default='t')
+    parser.add_argument('--wave',             type=int,   help="Number of members added in every wave. Default: Npool", default=None)
+    parser.add_argument('--max_runs',         type=int,   help="Maximum number of members in adaptive ensemble",  default=100)
     args = parser.parse_args()
 
     # Load configurations
@@ -88,47 +497,44 @@ def main():
 
     # Set simulation seed
     if args.seed == None:
-        args.seed = generate_seed(3)
-    np.random.seed(args.seed)
+        args.seed = ensemble_entropy()
 
-    # Create subfolder for ensemble
-    output_dir = create_dirname(args.script, config_file)
+    # Create subfolder for ensemble, named by its seed so that its members are merged alone
+    output_dir = create_dirname(args.script, config_file, seed=args.seed)
+
+    # Add members until ensemble average converges
+    if args.error_target is not None:
+        args.wave = args.wave or args.Npool
+        Ncompleted = run_adaptive(args, output_dir)
+
+        if Ncompleted == 0:
+            sys.exit(f"All simulations failed. No ensemble config saved in: {output_dir}")
+        print(f"Simulations completed. Results saved in: {output_dir}")
+        return
 
     # Prepare the commands for each run
-    commands = []
-    for run in range(args.Nruns):
-        command = [
-            'python', 
-            args.script,
-            '--dir',    output_dir,
-            '--config', args.config,
-            '--params', 'seed', str(np.random.randint(1e3)),
-            '--ensemble'
-        ]
-        commands.append(command)
+    commands = member_commands(args.script, args.config, output_dir, args.seed, args.Nruns,
+                               equilibration_cache=args.equilibration_cache)
 
-    # Use multiprocessing to run the simulations in parallel
-    with Pool(processes=args.Npool) as pool:
+    # Run members through persistent job queue, which also merges the ensemble config
+    if args.queue:
+        queue = job_queue.connect(args.queue)
+        job_queue.add_jobs(queue, queue_jobs(commands))
+        job_queue.add_ensemble(queue, output_dir, f"{config_path}{output_dir}", args.seed)
+        queue.close()
 
-        # Execute the list of commands in parallel
-        pool.map(run_simulation, commands)
+        run_queue(args.script, args.queue, args.Npool, in_process=not args.subprocess, threads=args.threads, pin=args.pin)
+        return
 
-    print(f"All simulations completed. Results saved in: {output_dir}")
+    # Run members in parallel, in-process in workers that import the script once
+    failures = run_members(args.script, commands, args.Npool, in_process=not args.subprocess, threads=args.threads, pin=args.pin)
 
+    if len(failures) == args.Nruns:
+        sys.exit(f"All simulations failed. No ensemble config saved in: {output_dir}")
 
-    # Load random config
-    path_to_random_run = glob.glob(f"{config_path}{output_dir}/*.json")[0]
-    config_file = load_config(path_to_random_run)
-    
-    # Update with ensemble seed
-    update_value(config_file, key='seed', val=args.seed)
-    
-    # Add number of runs/states in ensemble
-    config_file['Nruns'] = args.Nruns
+    print(f"Simulations completed. Results saved in: {output_dir}")
 
-    # Save and delete folder
-    save_config(f"{config_path}{output_dir}.json", config_file)
-    shutil.rmtree(f"{config_path}{output_dir}")
+    merge_member_configs(f"{config_path}{output_dir}", output_dir, args.seed, args.Nruns - len(failures))
 
 if __name__ == "__main__":
     main()
@@ -1,28 +1,55 @@
 """ Dummy script that might be included later """
-import time
-import glob
-import shutil
+import copy
 import argparse
-import subprocess
 import numpy as np
 
 from pathlib import Path
-from datetime import datetime
-from multiprocessing import Pool
+from tempfile import TemporaryDirectory
+from contextlib import nullcontext
 from utils.config_functions import *
 
-from run_ensemble import create_dirname
+from run_ensemble import create_dirname, member_commands, merge_member_configs, run_members, queue_jobs, run_queue
+from utils import job_queue
+from utils.seeds import ensemble_entropy, spawn_seeds
 
 
-def generate_seed(digits):
-    """ Generates random seed below 1e<digits> """
-    return int(time.time()) % 10 ** digits
+def point_configs(config, param, param_range, directory):
+    """
+    Writes one config per parameter value to directory. The scanned config is never rewritten,
+    so scans started at the same time from the same config do not interfere.
 
+    Returns:
+    - paths to configs of parameter points
+    """
+
+    base_config = load_config(config)
+
+    paths = []
+    for param_value in param_range:
+        config_file = copy.deepcopy(base_config)
+        update_value(config_file, key=param, val=param_value)
+
+        path = f"{directory}/{Path(config).stem}_{param}{param_value}.json"
+        save_config(path, config_file)
+        paths.append(path)
+
+    return paths
+
+
+
+def point_dirnames(script, paths, param, param_range, seeds):
+    """
+    Ensemble directory of every parameter point, named by its seed, with the parameter appended
+    if the standard names coincide
+    """
+
+    dirnames = [create_dirname(script, load_config(path), filename=True, seed=seed) for path, seed in zip(paths, seeds)]
+
+    if len(set(dirnames)) < len(dirnames):
+        dirnames = [f"{dirname}_{param}{param_value}" for dirname, param_value in zip(dirnames, param_range)]
+
+    return dirnames
 
-def run_simulation(command):
-    """ Runs a single simulation command. """
-    result = subprocess.run(command, check=True)
-    return result
 
 
 def main():
@@ -39,6 +66,10 @@ def main():
     parser.add_argument('-c', '--config', type=str,   help='Path to config file', default='../../../../hdd_data/silja/VertexModel_data/simulated/configs/config_nodivision.json')
     parser.add_argument('--ensemble',                 help='Defines whether run is part of ensemble execution', action='store_true')
     parser.add_argument('--identical',                help='Run all simulations with identical seed', action='store_true')
+    parser.add_argument('--subprocess',               help='Run every simulation in its own Python subprocess', action='store_true')
+    parser.add_argument('--queue',        type=str,   help='SQLite job queue to run simulations from, resumable with exe/run_queue.py', default=None)
+    parser.add_argument('--threads',      type=int,   help='Threads per worker (numba, OpenMP, BLAS). Default: cores per worker', default=None)
+    parser.add_argument('--pin',                      help='Pin every worker to its cores', action='store_true')
     args = parser.parse_args()
 
     assert args.range != None or args.list != None, f"Must provide either range or list of values for {args.param}"
@@ -55,42 +86,63 @@ def main():
 
     # Set simulation seed
     if args.seed == None:
-        args.seed = generate_seed(3)
-    np.random.seed(args.seed)
+        args.seed = ensemble_entropy()
 
+    # Distinct seed of every parameter point
+    seeds = spawn_seeds(args.seed, Nparam)
 
-    if args.ensemble:
 
-        # Prepare the commands for each run
-        commands = []
-        for run, param in zip(range(Nparam),param_range):
-
-            # Update config
-            config_file = load_config(args.config)
-            update_value(config_file, key=args.param, val=param)
-            save_config(args.config, config_file)
-
-            command = [
-                'python', 
-                'exe/run_ensemble.py',
-                args.script,
-                '--Nruns',  str(args.Nruns),
-                '--Npool',  str(args.Npool),
-                '--seed',   str(np.random.randint(1e3)),
-                '--config', args.config
-            ]
+    if args.ensemble:
 
-            run_simulation(command)
+        # Point configs are kept next to the queue, so that the scan can be resumed
+        if args.queue:
+            scan_context = nullcontext(f"{Path(args.queue).parent}/{Path(args.queue).stem}_configs")
+        else:
+            scan_context = TemporaryDirectory(prefix="param_scan_")
+
+        with scan_context as scan_dir:
+            Path(scan_dir).mkdir(parents=True, exist_ok=True)
+
+            # Immutable config of each parameter point
+            paths    = point_configs(args.config, args.param, param_range, scan_dir)
+            dirnames = point_dirnames(args.script, paths, args.param, param_range, seeds)
+
+            # Members of all parameter points share one pool
+            commands = []
+            for path, output_dir, seed in zip(paths, dirnames, seeds):
+                commands += member_commands(args.script, path, output_dir, seed, args.Nruns)
+
+            if args.queue:
+                queue = job_queue.connect(args.queue)
+                job_queue.add_jobs(queue, queue_jobs(commands))
+                for output_dir, seed in zip(dirnames, seeds):
+                    job_queue.add_ensemble(queue, output_dir, f"{scan_dir}/{output_dir}", seed)
+                queue.close()
+
+                run_queue(args.script, args.queue, args.Npool, in_process=not args.subprocess, threads=args.threads, pin=args.pin)
+                return
+
+            failures = run_members(args.script, commands, args.Npool, in_process=not args.subprocess, threads=args.threads, pin=args.pin)
+            failed_dirs = [command[command.index('--dir') + 1] for command, _ in failures]
+
+            # Ensemble config of each parameter point
+            for output_dir, seed in zip(dirnames, seeds):
+                Ncompleted = args.Nruns - failed_dirs.count(output_dir)
+                if Ncompleted == 0:
+                    print(f"All simulations failed. No ensemble config saved in: {output_dir}")
+                    continue
+                merge_member_configs(f"{scan_dir}/{output_dir}", output_dir, seed, Ncompleted)
+                print(f"Results saved in: {output_dir}")
 
     else:
         
         # Prepare the commands for each run
         commands = []
-        for run, param in zip(range(Nparam), param_range):
+        for param, point_seed in zip(param_range, seeds):
             if args.identical:
                 seed = str(args.seed)
             else:
-                seed = str(np.random.randint(1e3))
+                seed = str(point_seed)
 
             command = [
                 'python',
@@ -101,9 +153,15 @@ def main():
             ]
             commands.append(command)
 
-        # Use multiprocessing to run the simulations in parallel
-        with Pool(processes=args.Npool) as pool:
-            pool.map(run_simulation, commands)
+        if args.queue:
+            queue = job_queue.connect(args.queue)
+            job_queue.add_jobs(queue, queue_jobs(commands))
+            queue.close()
+
+            run_queue(args.script, args.queue, args.Npool, in_process=not args.subprocess, threads=args.threads, pin=args.pin)
+            return
+
+        run_members(args.script, commands, args.Npool, in_process=not args.subprocess, threads=args.threads, pin=args.pin)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,43 @@
+""" Resumes a job queue of run_ensemble.py or run_param_scan.py, e.g. after a reboot """
+import argparse
+
+from utils import job_queue
+
+from run_ensemble import run_queue, merge_queue_ensembles
+
+
+def main():
+
+    # Command-line argument parsing
+    parser = argparse.ArgumentParser(description="Run pending, failed and interrupted jobs of a job queue. Run from the directory the jobs were queued from.")
+    parser.add_argument('queue',          type=str,  help='Path to SQLite job queue')
+    parser.add_argument('-P', '--Npool',  type=int,  help="Number of parallel processes", default=16)
+    parser.add_argument('--skip_failed',             help='Only run pending and interrupted jobs, not failed ones', action='store_true')
+    parser.add_argument('--subprocess',              help='Run every job in its own Python subprocess', action='store_true')
+    parser.add_argument('--threads',      type=int,  help='Threads per worker (numba, OpenMP, BLAS). Default: cores per worker', default=None)
+    parser.add_argument('--pin',                     help='Pin every worker to its cores', action='store_true')
+    args = parser.parse_args()
+
+    queue = job_queue.connect(args.queue)
+
+    # Failed jobs, and jobs of workers that are no longer alive, are pending again
+    Nreset = job_queue.requeue(queue, statuses=[] if args.skip_failed else ['failed'])
+    count  = job_queue.counts(queue)
+    print(f"Resuming {args.queue}: {count['pending']} pending ({Nreset} requeued), {count['running']} running, {count['done']} done")
+
+    scripts = job_queue.scripts(queue)
+    queue.close()
+
+    # Other instances of this script may drain the same queue at the same time
+    for script in scripts:
+        run_queue(script, args.queue, args.Npool, in_process=not args.subprocess, threads=args.threads, pin=args.pin)
+
+    if not scripts:
+        merge_queue_ensembles(args.queue)
+
+    count = job_queue.counts(job_queue.connect(args.queue))
+    print(f"{count['done']} jobs done, {count['failed']} failed, {count['pending'] + count['running']} left")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,11 +2,15 @@ from cells.bind import VertexModel
 from cells.read import _progressbar as progressbar
 from cells.plot import plot, WindowClosedException
 
+import sys
 import numpy as np
 import pickle
 from operator import itemgetter
 import matplotlib.pyplot as plt
 
+sys.path.append("analysis/utils")
+from msd import mean_squared_displacement
+
 # PARAMETERS
 
 seed = 0    # random number generator seed
@@ -94,12 +98,8 @@ positions = np.array(list(map(
     list_vm)))
 
 # compute mean squared displacement
-msd = []
-for t in range(1, len(list_t)):
-    disp = np.roll(positions, -t, axis=0)[:-t] - positions[:-t] # compute displacements over t frames
-    disp = disp - disp.mean(axis=-2, keepdims=True)             # remove centre of mass displacement
-    msd += [[t*lag_time, (disp**2).sum(axis=-1).mean()]]        # mean squared displacement
-msd = np.array(msd)
+msd, _ = mean_squared_displacement(positions, remove_drift=True)  # all time origins, centre of mass displacement removed
+msd = np.array([np.arange(1, len(list_t))*lag_time, msd[1:]]).T  # lag times and mean squared displacements
 with open("msd.p", "wb") as dump:
     pickle.dump(msd, dump)
 
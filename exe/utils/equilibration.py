@@ -0,0 +1,156 @@
+import os
+import sys
+import json
+import time
+import pickle
+import hashlib
+
+from pathlib import Path
+
+from utils.job_queue import worker_name, worker_alive
+
+
+# Config entries that do not change the equilibrated state
+EXCLUDED_KEYS = ['seed', 'date', 'script', 'rho']
+
+
+def config_key(config_file, extra=None, excluded_keys=EXCLUDED_KEYS):
+    """
+    Hash of config without seed and run-specific entries, identifying a parameter point.
+    extra are further settings the hashed state depends on, e.g. the length of the equilibration.
+    """
+
+    def strip(entry):
+        if isinstance(entry, dict):
+            return {key: strip(value) for key, value in entry.items() if key not in excluded_keys}
+        return entry
+
+    payload = strip(config_file) if extra is None else {'config': strip(config_file), 'extra': extra}
+
+    return hashlib.sha1(json.dumps(payload, sort_keys=True).encode()).hexdigest()[:16]
+
+
+
+def canonical_seed(key, digits=5):
+    """ Seed of the cached equilibration run, derived from the config key so it does not depend on members """
+
+    return int(key, 16) % 10 ** digits
+
+
+
+def supports_reseeding(vm):
+    """
+    Whether the random number generator of a vertex model (class or object) can be reseeded after loading,
+    with setSeed. Forks of a cached state without reseeding would share the same noise.
+    """
+
+    return hasattr(vm, 'setSeed')
+
+
+
+def fork(state_path, seed):
+    """ Loads equilibrated state and reseeds its noise for one member """
+
+    with open(state_path, "rb") as dump:
+        vm = pickle.load(dump)
+
+    vm.setSeed(seed)
+
+    return vm
+
+
+
+def lock_owner(lock):
+    """ Name of the process holding lock (see worker_name), '' while the lock is being written, None without lock """
+
+    try:
+        return lock.read_text().strip()
+    except FileNotFoundError:
+        return None
+
+
+
+def break_lock(lock, owner):
+    """ Removes lock only if it is still held by owner, so that a lock taken over by another process is kept """
+
+    stale = lock.with_suffix(f".{os.getpid()}.stale")
+    try:
+        os.rename(lock, stale)
+    except FileNotFoundError:
+        return
+
+    # restore lock if another process took it in the meantime
+    if lock_owner(stale) != owner:
+        try:
+            os.link(stale, lock)
+        except FileExistsError:
+            pass
+    stale.unlink(missing_ok=True)
+
+
+
+def equilibrated_state(cache_dir, config_file, equilibrate, extra=None, timeout=24*3600, poll=10):
+    """
+    Path to equilibrated state of the parameter point of config_file, computing it with equilibrate(seed) if not cached.
+    Members started at the same time wait for the first one to finish, instead of equilibrating each.
+    Locks of processes that died are broken.
+
+    Parameters:
+    - cache_dir: directory of cached states
+    - config_file: config of member
+    - equilibrate: function returning an equilibrated vertex model from a seed
+    - extra: settings equilibrate depends on besides the config (e.g. script and number of transient frames)
+    - timeout: seconds to wait for another member, after which the state is computed anyway
+    """
+
+    key  = config_key(config_file, extra)
+    path = Path(cache_dir) / f"equilibrated_{key}.p"
+    lock = Path(cache_dir) / f"equilibrated_{key}.lock"
+    Path(cache_dir).mkdir(parents=True, exist_ok=True)
+
+    if path.exists():
+        print(f"Forking from cached equilibrated state {path}", file=sys.stderr)
+        return path
+
+    # Only one member equilibrates, and writes its name into the lock
+    start, owned = time.time(), False
+    while True:
+        try:
+            with open(lock, 'x') as f:
+                f.write(worker_name())
+            owned = True
+            break
+        except FileExistsError:
+            pass
+
+        if path.exists():
+            return path
+
+        # lock left behind by a killed process is broken
+        owner = lock_owner(lock)
+        if owner and not worker_alive(owner):
+            print(f"Breaking lock {lock} of dead process {owner}", file=sys.stderr)
+            break_lock(lock, owner)
+            continue
+
+        # after waiting too long, equilibrate without taking the lock of the live process
+        if time.time() - start > timeout:
+            break
+
+        time.sleep(poll)
+
+    try:
+        vm = equilibrate(canonical_seed(key))
+
+        # write atomically, so members never read a partial state
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as dump:
+            pickle.dump(vm, dump)
+        os.replace(tmp_path, path)
+    finally:
+        if owned:
+            lock.unlink(missing_ok=True)
+
+    print(f"Saved equilibrated state {path}", file=sys.stderr)
+
+    return path
@@ -0,0 +1,75 @@
+import json
+import hashlib
+import numpy as np
+import scipy as sc
+
+from pathlib import Path
+
+
+DISTRIBUTIONS = ['skewnorm', 'truncnorm', 'uniform']
+
+# Volume tables sampled in this process, per (seed, distribution, parameters, number of cells)
+_volume_tables = {}
+
+
+def sample_volumes(distribution, size, rng, **params):
+    """
+    Draws all cell volumes in one vectorized call.
+
+    Parameters:
+    - distribution: 'skewnorm' (a, loc, scale), 'truncnorm' (Vmin, Vmax, loc, scale) or 'uniform' (low, high)
+    - size: number of cells
+    - rng: numpy Generator
+    """
+
+    assert distribution in DISTRIBUTIONS, f"Unknown distribution {distribution}. Must be one of {DISTRIBUTIONS}"
+
+    if distribution == 'skewnorm':
+        return sc.stats.skewnorm.rvs(params['a'], loc=params['loc'], scale=params['scale'], size=size, random_state=rng)
+
+    elif distribution == 'truncnorm':
+        a = (params['Vmin'] - params['loc']) / params['scale']
+        b = (params['Vmax'] - params['loc']) / params['scale']
+        return sc.stats.truncnorm.rvs(a, b, loc=params['loc'], scale=params['scale'], size=size, random_state=rng)
+
+    else:
+        return rng.uniform(low=params['low'], high=params['high'], size=size)
+
+
+
+def volume_table(distribution, size, seed, cache_dir=None, **params):
+    """
+    Cell volumes from a Generator seeded with seed. Tables are cached in memory, and in cache_dir if given,
+    so ensemble members and repeated runs with the same seed and distribution reuse them.
+    """
+
+    key  = json.dumps({'distribution': distribution, 'size': size, 'seed': seed, 'params': params}, sort_keys=True)
+    name = hashlib.sha1(key.encode()).hexdigest()[:16]
+
+    if name in _volume_tables:
+        return _volume_tables[name]
+
+    path = Path(cache_dir) / f"volumes_{name}.npy" if cache_dir else None
+    if path is not None and path.exists():
+        volumes = np.load(path)
+    else:
+        volumes = sample_volumes(distribution, size, np.random.default_rng(seed), **params)
+        if path is not None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            np.save(path, volumes)
+
+    _volume_tables[name] = volumes
+
+    return volumes
+
+
+
+def set_cell_volumes(vm, distribution, seed, cache_dir=None, **params):
+    """ Samples volumes of all cells of vm and assigns them in a single update """
+
+    cells   = list(vm.vertexForces["surface"].volume.keys())
+    volumes = volume_table(distribution, len(cells), seed, cache_dir=cache_dir, **params)
+
+    vm.vertexForces["surface"].volume = dict(zip(cells, volumes.tolist()))
+
+    return vm
@@ -0,0 +1,242 @@
+import os
+import json
+import time
+import sqlite3
+import platform
+
+
+STATUSES = ['pending', 'running', 'done', 'failed']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id          INTEGER PRIMARY KEY,
+    command     TEXT UNIQUE NOT NULL,
+    script      TEXT,
+    output_dir  TEXT,
+    config_hash TEXT,
+    seed        INTEGER,
+    status      TEXT NOT NULL DEFAULT 'pending',
+    worker      TEXT,
+    output      TEXT,
+    started     REAL,
+    wall_time   REAL,
+    error       TEXT
+);
+CREATE TABLE IF NOT EXISTS ensembles (
+    output_dir  TEXT PRIMARY KEY,
+    member_dir  TEXT NOT NULL,
+    seed        INTEGER,
+    merged      INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+def connect(path, timeout=60):
+    """
+    Opens (and creates) a job queue in SQLite file path. Every process opens its own connection.
+    Connections wait up to timeout seconds for other processes holding the lock.
+    """
+
+    queue = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+    queue.row_factory = sqlite3.Row
+    queue.executescript(SCHEMA)
+
+    # queues created before ensembles recorded their merges
+    try:
+        queue.execute("ALTER TABLE ensembles ADD COLUMN merged INTEGER NOT NULL DEFAULT 0")
+    except sqlite3.OperationalError:
+        pass
+
+    return queue
+
+
+
+def process_start(pid):
+    """
+    Boot id and start time (clock ticks since boot) of process pid, which identify it even if pid is reused,
+    e.g. after a reboot. Empty string where /proc is not available.
+    """
+
+    try:
+        with open('/proc/sys/kernel/random/boot_id') as f:
+            boot_id = f.read().strip()
+        with open(f'/proc/{pid}/stat') as f:
+            # fields after the command name, which may contain spaces
+            start_time = f.read().rsplit(')', 1)[1].split()[19]
+    except (OSError, IndexError):
+        return ''
+
+    return f"{boot_id}/{start_time}"
+
+
+
+def worker_name(pid=None):
+    """ Identifies a worker process by host, pid and start of the process """
+
+    pid = os.getpid() if pid is None else pid
+
+    return f"{platform.node()}:{pid}:{process_start(pid)}"
+
+
+
+def worker_alive(worker):
+    """
+    Whether the process named by worker_name is alive. Processes on other hosts are assumed alive.
+    A live process with the same pid but a different start is a reused pid, so the worker is dead.
+    """
+
+    worker_host, pid, start = (worker.split(':', 2) + [''])[:3]
+    if worker_host != platform.node():
+        return True
+
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+
+    return start == '' or process_start(pid) in ['', start]
+
+
+
+def add_jobs(queue, jobs):
+    """
+    Adds jobs to the queue as pending. Jobs already in the queue (same command) are left as they are.
+
+    Parameters:
+    - jobs: list of dictionaries with 'command' (list of strings) and optionally 'output_dir', 'config_hash' and 'seed'
+
+    Returns:
+    - number of jobs added
+    """
+
+    before = queue.total_changes
+    queue.execute("BEGIN IMMEDIATE")
+    queue.executemany("INSERT OR IGNORE INTO jobs (command, script, output_dir, config_hash, seed) VALUES (?, ?, ?, ?, ?)",
+                      [(json.dumps(job['command']), job['command'][1], job.get('output_dir'), job.get('config_hash'), job.get('seed')) for job in jobs])
+    queue.execute("COMMIT")
+
+    return queue.total_changes - before
+
+
+
+def add_ensemble(queue, output_dir, member_dir, seed):
+    """ Registers an ensemble, whose member configs in member_dir are merged once its jobs have finished """
+
+    queue.execute("INSERT OR REPLACE INTO ensembles (output_dir, member_dir, seed) VALUES (?, ?, ?)", (output_dir, member_dir, seed))
+
+
+
+def claim(queue, worker=None, script=None):
+    """
+    Atomically marks the oldest pending job (of script, if given) as running and returns it,
+    so concurrent workers never run the same job. Returns None if no job is pending.
+    """
+
+    worker = worker or worker_name()
+
+    queue.execute("BEGIN IMMEDIATE")
+    try:
+        if script is None:
+            row = queue.execute("SELECT * FROM jobs WHERE status = 'pending' ORDER BY id LIMIT 1").fetchone()
+        else:
+            row = queue.execute("SELECT * FROM jobs WHERE status = 'pending' AND script = ? ORDER BY id LIMIT 1", (script,)).fetchone()
+
+        if row is not None:
+            queue.execute("UPDATE jobs SET status = 'running', worker = ?, started = ? WHERE id = ?", (worker, time.time(), row['id']))
+        queue.execute("COMMIT")
+    except BaseException:
+        queue.execute("ROLLBACK")
+        raise
+
+    if row is None:
+        return None
+
+    job = dict(row)
+    job['command'] = json.loads(job['command'])
+
+    return job
+
+
+
+def finish(queue, job_id, output=None, error=None, wall_time=None):
+    """ Records the outcome of a job: done, or failed with its traceback """
+
+    status = 'done' if error is None else 'failed'
+    queue.execute("UPDATE jobs SET status = ?, output = ?, error = ?, wall_time = ? WHERE id = ?",
+                  (status, output, error, wall_time, job_id))
+
+
+
+def requeue(queue, statuses=['failed']):
+    """
+    Resets jobs to pending, for resuming a queue. Running jobs whose worker was on this host and is no longer
+    alive (e.g. after a reboot) are reset too, while running jobs of live workers are left to them.
+
+    Returns:
+    - number of jobs reset
+    """
+
+    queue.execute("BEGIN IMMEDIATE")
+    stale = [row['id'] for row in queue.execute("SELECT id, worker FROM jobs WHERE status = 'running'") if not worker_alive(row['worker'])]
+    queue.executemany("UPDATE jobs SET status = 'pending', worker = NULL WHERE id = ?", [(job_id,) for job_id in stale])
+    reset = 0
+    if statuses:
+        reset = queue.execute(f"UPDATE jobs SET status = 'pending', worker = NULL WHERE status IN ({','.join('?' * len(statuses))})", statuses).rowcount
+    queue.execute("COMMIT")
+
+    return len(stale) + reset
+
+
+
+def counts(queue, output_dir=None):
+    """ Number of jobs of each status, of all jobs or of jobs saving in output_dir """
+
+    if output_dir is None:
+        rows = queue.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")
+    else:
+        rows = queue.execute("SELECT status, COUNT(*) FROM jobs WHERE output_dir = ? GROUP BY status", (output_dir,))
+
+    return {status: 0 for status in STATUSES} | {status: count for status, count in rows}
+
+
+
+def scripts(queue, statuses=['pending']):
+    """ Simulation scripts of jobs with given statuses """
+
+    return [row[0] for row in queue.execute(f"SELECT DISTINCT script FROM jobs WHERE status IN ({','.join('?' * len(statuses))})", statuses)]
+
+
+
+def ensembles(queue):
+    """ Registered ensembles as list of (output_dir, member_dir, seed) """
+
+    return [tuple(row) for row in queue.execute("SELECT output_dir, member_dir, seed FROM ensembles")]
+
+
+
+def claim_merge(queue, output_dir):
+    """
+    Atomically claims the merge of an ensemble whose jobs have all finished, so that of several processes
+    draining the queue only one merges. An ensemble is merged again once more of its members are done.
+
+    Returns:
+    - number of done members to merge, None if the ensemble is not to be merged
+    """
+
+    queue.execute("BEGIN IMMEDIATE")
+    try:
+        count  = counts(queue, output_dir)
+        merged = queue.execute("SELECT merged FROM ensembles WHERE output_dir = ?", (output_dir,)).fetchone()['merged']
+
+        Ndone = None
+        if count['pending'] + count['running'] == 0 and count['done'] > merged:
+            Ndone = count['done']
+            queue.execute("UPDATE ensembles SET merged = ? WHERE output_dir = ?", (Ndone, output_dir))
+        queue.execute("COMMIT")
+    except BaseException:
+        queue.execute("ROLLBACK")
+        raise
+
+    return Ndone
@@ -0,0 +1,208 @@
+import os
+import sys
+import resource
+import numpy as np
+
+from multiprocessing import Value
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+
+# Environment variables read by numba, OpenMP and BLAS libraries when they are loaded
+THREAD_VARIABLES = ['NUMBA_NUM_THREADS', 'OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS']
+
+
+def available_cores():
+    """ Cores this process may run on """
+
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count()))
+
+
+
+def split_cores(Nworkers, cores=None):
+    """
+    Splits cores into Nworkers disjoint groups of consecutive cores, as evenly as possible.
+    With more workers than cores, workers share single cores.
+    """
+
+    cores = available_cores() if cores is None else cores
+
+    if Nworkers <= len(cores):
+        return [group.tolist() for group in np.array_split(cores, Nworkers)]
+    return [[cores[worker % len(cores)]] for worker in range(Nworkers)]
+
+
+
+def plan_resources(Nworkers, threads=None, pin=False, cores=None):
+    """
+    Assigns cores to a pool of workers, so that parallel kernels in the workers do not oversubscribe the node.
+
+    Parameters:
+    - Nworkers: number of worker processes
+    - threads: numba/OpenMP/BLAS threads per worker. Default: cores of worker.
+    - pin: whether to pin workers to their cores
+    - cores: cores to split. Default: available cores.
+
+    Returns:
+    - dictionary with 'groups' (cores of every worker), 'threads' and 'pin'
+    """
+
+    groups = split_cores(Nworkers, cores)
+
+    if threads is None:
+        threads = min(len(group) for group in groups)
+
+    return {'groups': groups, 'threads': max(1, threads), 'pin': pin}
+
+
+
+def log_resources(resources, file=sys.stderr):
+    """ Prints the core assignment of a resource plan """
+
+    groups = resources['groups']
+    cores  = sorted(set(core for group in groups for core in group))
+
+    print(f"Assigning {len(cores)} cores to {len(groups)} workers with {resources['threads']} threads each"
+          f"{' (pinned)' if resources['pin'] else ''}", file=file)
+    for worker, group in enumerate(groups):
+        print(f"  worker {worker}: cores {group[0]}-{group[-1]}" if len(group) > 1 else f"  worker {worker}: core {group[0]}", file=file)
+
+
+
+def limit_threads(Nthreads):
+    """
+    Sets number of threads of numba, OpenMP and BLAS in this process. Environment variables cover libraries
+    loaded later, numba and threadpoolctl (if installed) cover libraries already loaded.
+    """
+
+    for variable in THREAD_VARIABLES:
+        os.environ[variable] = str(Nthreads)
+
+    if 'numba' in sys.modules:
+        import numba
+        numba.set_num_threads(min(Nthreads, numba.config.NUMBA_NUM_THREADS))
+
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(Nthreads)
+    except ImportError:
+        pass
+
+
+
+def pool_resources(resources):
+    """ Initializer arguments of workers of a pool with a resource plan, see init_worker """
+    return resources, Value('i', 0)
+
+
+
+def init_worker(resources, counter):
+    """
+    Pool initializer giving every worker its own group of cores (in order of start-up), limiting its threads,
+    and pinning it to its cores if resources['pin'].
+    """
+
+    with counter.get_lock():
+        worker = counter.value
+        counter.value += 1
+
+    group = resources['groups'][worker % len(resources['groups'])]
+
+    limit_threads(resources['threads'])
+    if resources['pin'] and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, group)
+
+
+
+def available_memory():
+    """ Memory available for new processes in bytes, from MemAvailable of /proc/meminfo """
+
+    try:
+        with open('/proc/meminfo') as meminfo:
+            for line in meminfo:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+
+
+
+def measured_call(function, args):
+    """ Runs function(*args) and returns its result and the peak memory of the process in bytes """
+
+    result = function(*args)
+
+    return result, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+
+def run_memory_aware(function, jobs, sizes, Npool, threads=None, pin=False, memory_fraction=0.8, memory_per_byte=None):
+    """
+    Runs function(*job) for all jobs in a pool of worker processes, admitting jobs only while the sum of their
+    estimated peak memory fits into a fraction of the available memory. A job always runs if no other job does.
+    If a worker is killed for lack of memory (or a job raises MemoryError), unfinished jobs are retried with
+    half as many workers.
+
+    Parameters:
+    - jobs: list of argument tuples
+    - sizes: size of every job, typically its input file size in bytes
+    - Npool: max number of workers
+    - threads, pin: thread budget and pinning of workers, see plan_resources
+    - memory_fraction: fraction of available memory that jobs may use
+    - memory_per_byte: peak memory per unit size. Measured on the first job, run alone, if None.
+
+    Returns:
+    - list of results in order of jobs
+    """
+
+    results = [None] * len(jobs)
+    pending = list(range(len(jobs)))
+
+    # Measure peak memory of the first job in a fresh process
+    if memory_per_byte is None and pending:
+        plan = plan_resources(1, threads=threads, pin=pin)
+        with ProcessPoolExecutor(max_workers=1, initializer=init_worker, initargs=pool_resources(plan)) as executor:
+            results[0], peak = executor.submit(measured_call, function, jobs[0]).result()
+        pending.pop(0)
+
+        memory_per_byte = peak / max(sizes[0], 1)
+        print(f"First job used {peak / 1e9:.2f} GB, {memory_per_byte:.1f} bytes per byte of input", file=sys.stderr)
+
+    estimates = [memory_per_byte * size for size in sizes]
+    Nworkers  = max(1, min(Npool, len(pending), len(available_cores())))
+
+    while pending:
+        budget = memory_fraction * available_memory()
+        plan   = plan_resources(Nworkers, threads=threads, pin=pin)
+        log_resources(plan)
+        print(f"Admitting jobs within {budget / 1e9:.2f} GB, estimated {max(estimates[i] for i in pending) / 1e9:.2f} GB per job at most", file=sys.stderr)
+
+        try:
+            with ProcessPoolExecutor(max_workers=Nworkers, initializer=init_worker, initargs=pool_resources(plan)) as executor:
+                queue, running, reserved = list(pending), {}, 0
+
+                while queue or running:
+                    # admit jobs while estimated memory fits
+                    while queue and len(running) < Nworkers and (not running or reserved + estimates[queue[0]] <= budget):
+                        job = queue.pop(0)
+                        running[executor.submit(function, *jobs[job])] = job
+                        reserved += estimates[job]
+
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        job = running.pop(future)
+                        reserved -= estimates[job]
+                        results[job] = future.result()
+                        pending.remove(job)
+
+        except (BrokenProcessPool, MemoryError):
+            if Nworkers == 1:
+                raise
+            Nworkers = max(1, Nworkers // 2)
+            print(f"Out of memory. Retrying {len(pending)} jobs with {Nworkers} workers", file=sys.stderr)
+
+    return results
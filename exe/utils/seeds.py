@@ -0,0 +1,64 @@
+import numpy as np
+
+from pathlib import Path
+
+
+# Seeds are passed to np.random.seed and VertexModel
+MAX_SEED = 2**31 - 1
+
+# Entropy of ensembles is stored exactly in configs, whose values update_value converts to float
+MAX_ENTROPY = 2**53
+
+
+def ensemble_entropy():
+    """ Fresh entropy from the operating system, so ensembles started at the same time get different seeds """
+    return int(np.random.SeedSequence().entropy % MAX_ENTROPY)
+
+
+
+def spawn_seeds(entropy, N, start=0):
+    """
+    Seeds of N members from independent child streams of SeedSequence(entropy).spawn, which are distinct.
+    Members start, ..., start+N-1 always get the same seeds, so an ensemble can be extended with new members.
+
+    Parameters:
+    - entropy: ensemble seed
+    - N: number of seeds
+    - start: index of first member
+
+    Returns:
+    - list of distinct ints below MAX_SEED
+    """
+
+    children = np.random.SeedSequence(entropy).spawn(start + N)
+
+    # Reduce each stream to one seed, drawing further words of a stream in the rare case of equal seeds
+    seeds, taken = [], set()
+    for child in children:
+        words = 1
+        seed  = int(child.generate_state(words, dtype=np.uint64)[-1] % MAX_SEED)
+        while seed in taken:
+            words += 1
+            seed   = int(child.generate_state(words, dtype=np.uint64)[-1] % MAX_SEED)
+        seeds.append(seed)
+        taken.add(seed)
+
+    return seeds[start:]
+
+
+
+def claim_filename(directory, filename, extension):
+    """
+    Creates directory/filename<extension> exclusively and returns filename, appending _1, _2, ... if it exists.
+    Runs started at the same time therefore never write to the same output file.
+    Not used for ensemble members, whose names are unique by seed and which overwrite their output when rerun.
+    """
+
+    n, name = 0, filename
+    while True:
+        try:
+            with open(Path(directory) / f"{name}{extension}", "xb"): pass
+            return name
+        except FileExistsError:
+            n   += 1
+            name = f"{filename}_{n}"
@@ -0,0 +1,108 @@
+import numpy as np
+
+from operator import itemgetter
+
+
+# Observables watched for the end of the transient
+OBSERVABLES = ['height_mean', 'height_std', 'volume_mean', 'volume_std', 'speed2']
+
+
+def new_detector(window=25, tolerance=0.2, observables=OBSERVABLES):
+    """
+    State of an online steady-state detector, updated every frame with update.
+
+    Parameters:
+    - window: number of frames of each of the two running windows compared
+    - tolerance: largest drift between the means of the windows, in units of the fluctuations within the windows
+    - observables: observables of frame_observables that must all be stationary
+    """
+
+    return {'window':        window,
+            'tolerance':     tolerance,
+            'frames':        [],
+            'values':        {name: [] for name in observables},
+            'positions':     None,
+            'time':          None,
+            'transient_end': None}
+
+
+
+def frame_observables(vm, previous_positions=None, previous_time=None):
+    """
+    Energy-like observables of one frame: mean and standard deviation of cell heights and volumes,
+    and mean squared velocity of cell centres since the previous frame (nan without previous frame).
+
+    Returns:
+    - dictionary of observables, centre positions
+    """
+
+    centres   = vm.getVertexIndicesByType("centre")
+    heights   = np.ravel(itemgetter(*centres)(vm.vertexForces["surface"].height))
+    volumes   = np.ravel(itemgetter(*centres)(vm.vertexForces["surface"].volume))
+    positions = np.reshape(itemgetter(*centres)(vm.getPositions(wrapped=False)), (-1, 2))
+
+    speed2 = np.nan
+    if previous_positions is not None and previous_positions.shape == positions.shape and vm.time > previous_time:
+        speed2 = np.mean(np.sum((positions - previous_positions)**2, axis=-1)) / (vm.time - previous_time)**2
+
+    return {'height_mean': np.mean(heights),
+            'height_std':  np.std(heights),
+            'volume_mean': np.mean(volumes),
+            'volume_std':  np.std(volumes),
+            'speed2':      speed2}, positions
+
+
+
+def is_stationary(values, window, tolerance):
+    """
+    Whether the means of the last two windows of values differ by at most tolerance times the
+    fluctuations within the windows. Constant values are stationary.
+    """
+
+    earlier, later = values[-2*window:-window], values[-window:]
+    drift = np.abs(np.mean(later) - np.mean(earlier))
+    noise = np.sqrt((np.var(earlier) + np.var(later)) / 2)
+
+    return drift <= tolerance * noise
+
+
+
+def update(detector, vm, frame):
+    """
+    Adds frame to the detector. The transient ends at the first frame of two consecutive windows
+    in which all observables are stationary.
+
+    Returns:
+    - frame at which transient ended, None while not detected
+    """
+
+    if detector['transient_end'] is not None:
+        return detector['transient_end']
+
+    observables, positions = frame_observables(vm, detector['positions'], detector['time'])
+    detector['positions'], detector['time'] = positions, vm.time
+
+    # frames without velocity are not compared
+    if any(np.isnan(observables[name]) for name in detector['values']):
+        return None
+
+    detector['frames'].append(frame)
+    for name, values in detector['values'].items():
+        values.append(observables[name])
+
+    window = detector['window']
+    if len(detector['frames']) >= 2 * window and \
+       all(is_stationary(values, window, detector['tolerance']) for values in detector['values'].values()):
+        detector['transient_end'] = detector['frames'][-2 * window]
+
+    return detector['transient_end']
+
+
+
+def production_done(detector, frame, production_frames=None):
+    """ Whether production_frames frames were simulated after the end of the transient """
+
+    if production_frames is None or detector['transient_end'] is None:
+        return False
+
+    return frame - detector['transient_end'] >= production_frames
@@ -1,23 +1,91 @@
 from cells.bind import VertexModel
+import time
+import pickle
 import numpy as np
 
 
-def cell_divisions(vm, Vth):
-    """ Performs cell division on vm object """
-    
-    volumes = vm.vertexForces["surface"].volume.copy()
-    heights = vm.vertexForces["surface"].height.copy()
+def new_lineage():
+    """ Empty record of division events: time, mother and daughter centre indices """
+
+    return {'time': [], 'mother': [], 'daughter': []}
+
+
+def record_division(lineage, time, mother, daughter):
+    """ Adds division event to lineage record """
 
-    for i in vm.getVertexIndicesByType("centre"):
+    lineage['time'].append(time)
+    lineage['mother'].append(mother)
+    lineage['daughter'].append(daughter)
 
-        if np.random.rand() < (volumes[i] - Vth)/Vth:
 
-            j = vm.SplitCellAtMax(i)
-            volumes[i] = heights[i]*vm.getVertexToNeighboursArea(i)
-            volumes[j] = heights[i]*vm.getVertexToNeighboursArea(j)
+def save_lineage(path, lineage):
+    """ Saves lineage record as arrays """
+
+    with open(path, "wb") as dump:
+        pickle.dump({key: np.array(value) for key, value in lineage.items()}, dump)
+
+
+def append_lineage(path, lineage, Nsaved=0):
+    """
+    Appends division events of lineage record after the first Nsaved to path as arrays,
+    so that the record is saved as it grows without rewriting earlier events.
+
+    Returns:
+    - number of events saved
+    """
 
+    Nevents = len(lineage['time'])
+    if Nevents > Nsaved:
+        with open(path, "ab") as dump:
+            pickle.dump({key: np.array(value[Nsaved:]) for key, value in lineage.items()}, dump)
+
+    return Nevents
+
+
+def cell_divisions(vm, Vth, lineage=None, rng=None, stats=None):
+    """
+    Performs cell division on vm object.
+    Division decisions of all cells are drawn at once, only selected cells are split,
+    and volumes are written back in a single update.
+
+    Parameters:
+    - vm: vertex model object
+    - Vth: threshold volume. Cells divide with probability (V - Vth) / Vth.
+    - lineage: division events are added to lineage, if given
+    - rng: numpy Generator. Global numpy random state if None.
+    - stats: number of divisions 'Ndivisions' and wall time 'time' of the step are appended, if given
+    """
+
+    start = time.perf_counter()
+
+    volumes = vm.vertexForces["surface"].volume.copy()
+    heights = vm.vertexForces["surface"].height.copy()
+
+    # Draw all division decisions at once
+    centres = list(vm.getVertexIndicesByType("centre"))
+    V = np.array([volumes[i] for i in centres])
+    u = rng.random(len(centres)) if rng is not None else np.random.rand(len(centres))
+    dividing = [centres[k] for k in np.flatnonzero(u < (V - Vth)/Vth)]
+
+    # Split selected cells. Mother and daughter keep the height of the mother.
+    new_volumes = {}
+    for i in dividing:
+        j = vm.splitCellAtMax(i)
+        new_volumes[i] = heights[i]*vm.getVertexToNeighboursArea(i)
+        new_volumes[j] = heights[i]*vm.getVertexToNeighboursArea(j)
+
+        if lineage is not None:
+            record_division(lineage, vm.time, i, j)
+
+    # Single bulk update
+    if len(new_volumes) > 0:
+        volumes.update(new_volumes)
         vm.vertexForces["surface"].volume = volumes
 
+    if stats is not None:
+        stats.setdefault('Ndivisions', []).append(len(dividing))
+        stats.setdefault('time', []).append(time.perf_counter() - start)
+
     return vm
 
 
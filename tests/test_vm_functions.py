@@ -0,0 +1,53 @@
+import sys
+import numpy as np
+import pytest
+
+from pathlib import Path
+
+pytest.importorskip("cells.bind")
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "exe"))
+from utils.vm_functions import new_lineage, cell_divisions
+
+
+class SurfaceForce:
+    def __init__(self, volume, height):
+        self.volume = volume
+        self.height = height
+
+
+class StubVertexModel:
+    """ Minimal vertex model with the methods used by cell_divisions. Every cell has area 1. """
+
+    def __init__(self, volumes):
+        self.time = 1.5
+        self.centres = list(volumes.keys())
+        self.vertexForces = {"surface": SurfaceForce(dict(volumes), {i: 2. for i in volumes})}
+
+    def getVertexIndicesByType(self, vertex_type):
+        return list(self.centres)
+
+    def splitCellAtMax(self, i):
+        j = max(self.centres) + 1
+        self.centres.append(j)
+        self.vertexForces["surface"].height[j] = 0.
+        return j
+
+    def getVertexToNeighboursArea(self, i):
+        return 1.
+
+
+
+def test_cell_divisions():
+    # cells 0 and 2 above 2 Vth always divide, cell 1 below Vth never does
+    vm = StubVertexModel({0: 4., 1: 1., 2: 5.})
+    lineage, stats = new_lineage(), {}
+
+    cell_divisions(vm, 1.5, lineage=lineage, rng=np.random.default_rng(0), stats=stats)
+
+    assert lineage == {'time': [1.5, 1.5], 'mother': [0, 2], 'daughter': [3, 4]}
+    assert stats['Ndivisions'] == [2]
+    assert len(stats['time']) == 1
+
+    # mothers and daughters get the height of the mother, undivided cells keep their volume
+    assert vm.vertexForces["surface"].volume == {0: 2., 1: 1., 2: 2., 3: 2., 4: 2.}